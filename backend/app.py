@@ -1,24 +1,63 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, abort, g, has_request_context, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, decode_token
+from flask_jwt_extended import (JWTManager, create_access_token, jwt_required, get_jwt_identity, decode_token,
+                                verify_jwt_in_request)
+from flask_jwt_extended.exceptions import JWTExtendedException
+import jwt as pyjwt
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
-from geopy.distance import geodesic
+from datetime import date, datetime, timedelta, timezone
 import os
-import requests
+import base64
 from datetime import timedelta as td
 import smtplib
+import time
+import tempfile
+import threading
+import json
+import random
+from collections import Counter, deque, namedtuple
 from email.message import EmailMessage
 from dotenv import load_dotenv
+from routing import plan_route
+from metrics import QUERY_COUNT_BUCKETS, Registry
+from query_plans import capture_selects, explain_connection, full_scans
+import funnel
+import search
+import serializers
+from serializers import records
+from live import Broadcast, Hub, create_broker, sse_event
+from static_files import BUILD_LEVELS, StaticBuild
+from buffered_writer import BufferedWriter
+from cache import TTLCache
+from mailer import OutboxWorker, SMTPPool
+from google_auth import GoogleKeySet
+from exporter import FORMATS as EXPORT_FORMATS, CONTENT_TYPES as EXPORT_CONTENT_TYPES, export_chunks, gzip_chunks
+from importer import (FORMATS as IMPORT_FORMATS, CUSTOMER_STAGES, clean_customer, clean_customer_update, clean_interaction,
+                      copy_stream, detect_format, iter_records)
+from tracks import decode_polyline, decode_values, encode_polyline, encode_values, simplify
+from geo import (KM_PER_MILE, bounding_box, encode_geohash, geodesic_matrix_km, geohash_cover, haversine_km,
+                 haversine_matrix_km, prefix_upper_bound)
+import click
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(BASE_DIR, '..', '.env'))
 load_dotenv(os.path.join(BASE_DIR, '.env'))
 FRONTEND_DIR = os.path.join(BASE_DIR, '..', 'frontend', 'build')
+if not os.path.isdir(FRONTEND_DIR):
+    # Deployments copy the React build next to the backend instead
+    FRONTEND_DIR = os.path.join(BASE_DIR, 'static')
+# `flask precompress-static` writes the .gz/.br copies at build time; set this to
+# also write missing ones (at lower quality) on first use
+STATIC_PRECOMPRESS = os.environ.get('STATIC_PRECOMPRESS', 'false').lower() == 'true'
 
-app = Flask(__name__, static_folder=FRONTEND_DIR, static_url_path='')
+# The build is served by serve_react() rather than Flask's static route
+app = Flask(__name__, static_folder=None)
+app.json = serializers.JSONProvider(app)
 CORS(app)
 
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'default-secret-key')
@@ -33,7 +72,7 @@ app.config['GOOGLE_CLIENT_SECRET'] = os.environ.get('GOOGLE_CLIENT_SECRET')
 app.config['FRONTEND_URL'] = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
 
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, include_object=search.include_object)
 jwt = JWTManager(app)
 CORS(
     app,
@@ -41,7 +80,8 @@ CORS(
         "http://localhost:3000",
         "https://your-production-frontend.com"  # Replace with your actual production domain
     ]}},
-    supports_credentials=True
+    supports_credentials=True,
+    expose_headers=['X-Next-Cursor', 'X-Query-Count', 'X-DB-Time-Ms', 'X-Response-Time-Ms']
 )
 
 # JWT Error Handlers
@@ -66,6 +106,101 @@ def missing_token_callback(error):
         'error': 'authorization_required'
     }), 401
 
+# Short-lived tokens that open GET /api/locations/stream and nothing else
+LOCATION_STREAM_TOKEN_TYPE = 'location_stream'
+
+@jwt.token_verification_loader
+def reject_stream_tokens(jwt_header, jwt_payload):
+    return jwt_payload.get('type') != LOCATION_STREAM_TOKEN_TYPE
+
+@jwt.token_verification_failed_loader
+def stream_token_callback(jwt_header, jwt_payload):
+    return jsonify({
+        'message': 'Stream tokens only open the location stream',
+        'error': 'invalid_token'
+    }), 401
+
+# Request and SQL instrumentation, exported on /metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_SAMPLES = int(os.environ.get('SLOW_QUERY_SAMPLES', '100'))
+
+metrics = Registry()
+request_counter = metrics.counter(
+    'crm_http_requests_total', 'HTTP requests by route and status.', ('method', 'route', 'status'))
+request_latency = metrics.histogram(
+    'crm_http_request_duration_seconds', 'Time to produce the response.', ('method', 'route'))
+request_db_time = metrics.histogram(
+    'crm_http_request_db_seconds', 'Time spent in SQL per request.', ('method', 'route'))
+request_query_count = metrics.histogram(
+    'crm_http_request_queries', 'SQL statements per request.', ('method', 'route'), buckets=QUERY_COUNT_BUCKETS)
+query_latency = metrics.histogram(
+    'crm_db_query_duration_seconds', 'Duration of every SQL statement, including background work.')
+slow_query_counter = metrics.counter(
+    'crm_db_slow_queries_total', f'Statements slower than {SLOW_QUERY_MS:g} ms.', ('route',))
+# Most recent slow statements, served by /api/metrics/slow-queries
+slow_queries = deque(maxlen=SLOW_QUERY_SAMPLES)
+
+def request_route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # A connection runs one statement at a time, so a single start time is
+    # enough, and one left behind by a failed statement is simply overwritten
+    conn.info['query_started'] = time.perf_counter()
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_started']
+    query_latency.observe(duration)
+    route = None
+    if has_request_context():
+        route = request_route()
+        g.query_count = g.get('query_count', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + duration
+    if duration * 1000 >= SLOW_QUERY_MS:
+        slow_query_counter.inc(route or 'background')
+        slow_queries.append({
+            'route': route,
+            'method': request.method if route else None,
+            'duration_ms': round(duration * 1000, 1),
+            'statement': statement[:2000],
+            'executemany': executemany,
+            'at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # Streamed responses are measured up to the first byte
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route, method = request_route(), request.method
+    query_count, db_time = g.get('query_count', 0), g.get('db_time', 0.0)
+    request_counter.inc(method, route, str(response.status_code))
+    request_latency.observe(elapsed, method, route)
+    request_db_time.observe(db_time, method, route)
+    request_query_count.observe(query_count, method, route)
+    if PROFILE_TOKEN and request.headers.get('X-Profile') == PROFILE_TOKEN:
+        response.headers['X-Query-Count'] = str(query_count)
+        response.headers['X-DB-Time-Ms'] = f'{db_time * 1000:.2f}'
+        response.headers['X-Response-Time-Ms'] = f'{elapsed * 1000:.2f}'
+        response.headers['Server-Timing'] = f'db;dur={db_time * 1000:.2f}, app;dur={elapsed * 1000:.2f}'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'message': 'Invalid metrics token'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 # Database models
 class User(db.Model):
     __tablename__ = 'users'
@@ -78,11 +213,109 @@ class User(db.Model):
     interactions = db.relationship('Interaction', backref='user', lazy=True)
     locations = db.relationship('Location', backref='user', lazy=True)
 
+# Outgoing mail, written in the request transaction and delivered by
+# email_worker; see deliver_due_emails()
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(100), nullable=False)
+    sender = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+@db.event.listens_for(db.metadata, 'after_create')
+def install_search(target, connection, **kw):
+    search.install(connection)
+
+@db.event.listens_for(db.metadata, 'before_drop')
+def uninstall_search(target, connection, **kw):
+    search.uninstall(connection)
+
+# Progress and outcome of a bulk import; see run_import()
+class ImportJob(db.Model):
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    format = db.Column(db.String(10), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    inserted_rows = db.Column(db.Integer, nullable=False, default=0)
+    duplicate_rows = db.Column(db.Integer, nullable=False, default=0)
+    failed_rows = db.Column(db.Integer, nullable=False, default=0)
+    # JSON list of {"row", "error"}, capped at IMPORT_MAX_ERRORS entries
+    errors = db.Column(db.Text)
+    message = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+# Identity and role of JWT holders, cached across requests so authorization
+# checks usually cost no query. Entries are dropped whenever a user row is
+# written, and in every other process through user_invalidations once the
+# write commits; USER_CACHE_TTL bounds staleness if a broadcast is missed.
+CachedUser = namedtuple('CachedUser', ['id', 'name', 'email', 'role'])
+user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', '4096')),
+    ttl=float(os.environ.get('USER_CACHE_TTL', '60'))
+)
+
+@db.event.listens_for(User, 'after_insert')
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, user):
+    user_cache.pop(user.id)
+    db.session.info.setdefault('invalidated_users', set()).add(user.id)
+
+@db.event.listens_for(db.session, 'after_commit')
+def broadcast_user_invalidations(session):
+    user_ids = session.info.pop('invalidated_users', None)
+    if user_ids:
+        user_invalidations.publish([(user_id, None) for user_id in user_ids])
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_user_invalidations(session):
+    session.info.pop('invalidated_users', None)
+
+def drop_cached_users(items):
+    for user_id, _ in items:
+        user_cache.pop(user_id)
+
+def load_user(user_id):
+    """Return the CachedUser for user_id, or None if there is no such user."""
+    cached = user_cache.get(user_id)
+    if cached is None:
+        # Listen before reading, so a change committed after this read is not missed
+        user_invalidations.start()
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        cached = CachedUser(user.id, user.name, user.email, user.role)
+        user_cache.set(user_id, cached)
+    return cached
+
+def get_current_user():
+    """Return the CachedUser of the request's JWT identity, memoised per request."""
+    user_id = get_jwt_identity()
+    user = g.get('current_user')
+    # Requests made inside an outer app context (CLI commands, tests) share g
+    if user is None or str(user.id) != str(user_id):
+        user = g.current_user = load_user(user_id)
+    return user
+
 class Customer(db.Model):
     __tablename__ = 'customers'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(100))
+    email = db.Column(db.String(100), index=True)
     phone = db.Column(db.String(20))
     company = db.Column(db.String(100))
     lat = db.Column(db.Float)
@@ -90,7 +323,33 @@ class Customer(db.Model):
     stage = db.Column(db.String(20), default='New')
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Geohash of (lat, lng), kept in sync on flush; see nearby_customers()
+    geohash = db.Column(db.String(12), index=True)
+    # When the current stage was entered and the furthest funnel stage
+    # reached, maintained with the stage_transitions log; see change_stage()
+    stage_entered_at = db.Column(db.DateTime)
+    furthest_stage = db.Column(db.String(20))
     interactions = db.relationship('Interaction', backref='customer', lazy=True)
+    __table_args__ = (
+        # Keyset pagination on GET /api/customers, globally and per rep
+        db.Index('ix_customers_created_at_id', 'created_at', 'id'),
+        db.Index('ix_customers_created_by_created_at_id', 'created_by', 'created_at', 'id'),
+        db.Index('ix_customers_created_by_geohash', 'created_by', 'geohash'),
+        # Case-insensitive duplicate check of imports, per rep
+        db.Index('ix_customers_created_by_lower_email', 'created_by', db.text('lower(email)')),
+        # Never reuse the id of a deleted customer: stage_transitions keeps its history
+        {'sqlite_autoincrement': True},
+    )
+
+def customer_geohash(lat, lng):
+    if lat is None or lng is None:
+        return None
+    return encode_geohash(lat, lng)
+
+@db.event.listens_for(Customer, 'before_insert')
+@db.event.listens_for(Customer, 'before_update')
+def sync_customer_geohash(mapper, connection, customer):
+    customer.geohash = customer_geohash(customer.lat, customer.lng)
 
 class Interaction(db.Model):
     __tablename__ = 'interactions'
@@ -100,6 +359,11 @@ class Interaction(db.Model):
     type = db.Column(db.String(20))
     note = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        # A rep's own interactions, and a customer's history, newest first
+        db.Index('ix_interactions_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_interactions_customer_id_timestamp', 'customer_id', 'timestamp'),
+    )
 
 class Location(db.Model):
     __tablename__ = 'locations'
@@ -108,14 +372,225 @@ class Location(db.Model):
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_locations_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
+# Most recent fix per user, upserted alongside every insert into locations
+class UserLatestLocation(db.Model):
+    __tablename__ = 'user_latest_location'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+# One simplified track per user and UTC day, replacing raw locations rows
+# older than the retention window; see compact_locations()
+class LocationTrack(db.Model):
+    __tablename__ = 'location_tracks'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    polyline = db.Column(db.Text, nullable=False)
+    # Seconds since midnight of each polyline point, delta-encoded
+    offsets = db.Column(db.Text, nullable=False)
+    point_count = db.Column(db.Integer, nullable=False)
+    raw_point_count = db.Column(db.Integer, nullable=False)
+    tolerance_m = db.Column(db.Float, nullable=False)
+
+# Rollups of the dashboard counters, maintained on every customer/interaction
+# write. user_id 0 holds the global (admin) totals.
+GLOBAL_ROLLUP_USER_ID = 0
+STAGE_ROLLUP_COLUMNS = {
+    'New': 'new_customers',
+    'Contacted': 'contacted_customers',
+    'Proposal': 'proposal_customers',
+    'Closed': 'closed_customers'
+}
+
+class PipelineRollup(db.Model):
+    __tablename__ = 'pipeline_rollups'
+    user_id = db.Column(db.Integer, primary_key=True)
+    new_customers = db.Column(db.Integer, nullable=False, default=0)
+    contacted_customers = db.Column(db.Integer, nullable=False, default=0)
+    proposal_customers = db.Column(db.Integer, nullable=False, default=0)
+    closed_customers = db.Column(db.Integer, nullable=False, default=0)
+    other_customers = db.Column(db.Integer, nullable=False, default=0)
+    total_interactions = db.Column(db.Integer, nullable=False, default=0)
+
+class ActivityRollup(db.Model):
+    __tablename__ = 'activity_rollups'
+    user_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    customers_created = db.Column(db.Integer, nullable=False, default=0)
+    interactions = db.Column(db.Integer, nullable=False, default=0)
+
+# Append-only log of customer stage changes, with a from_stage of NULL for
+# the stage a customer was created in. It outlives deleted customers, so
+# it has no foreign keys.
+class StageTransition(db.Model):
+    __tablename__ = 'stage_transitions'
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    from_stage = db.Column(db.String(20))
+    to_stage = db.Column(db.String(20))
+    entered_at = db.Column(db.DateTime, nullable=False)
+    # How long the customer had been in from_stage
+    from_stage_seconds = db.Column(db.Integer)
+    customer_created_at = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index('ix_stage_transitions_customer_id_entered_at', 'customer_id', 'entered_at'),
+    )
+
+# Funnel aggregates, folded in from every batch of stage transitions by
+# record_stage_transitions(). period and cohort are the first day of a UTC
+# month; user_id 0 holds the global totals, as for the pipeline rollups.
+class StageTransitionRollup(db.Model):
+    __tablename__ = 'stage_transition_rollups'
+    user_id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.Date, primary_key=True)
+    from_stage = db.Column(db.String(20), primary_key=True)
+    to_stage = db.Column(db.String(20), primary_key=True)
+    transitions = db.Column(db.Integer, nullable=False, default=0)
+    seconds_in_from_stage = db.Column(db.BigInteger, nullable=False, default=0)
+
+# Histogram of completed stays per stage, in funnel.duration_bucket() buckets
+class StageDurationRollup(db.Model):
+    __tablename__ = 'stage_duration_rollups'
+    user_id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.Date, primary_key=True)
+    stage = db.Column(db.String(20), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    customers = db.Column(db.Integer, nullable=False, default=0)
+
+# Customers of each monthly creation cohort that have reached each stage
+class CohortFunnelRollup(db.Model):
+    __tablename__ = 'cohort_funnel_rollups'
+    user_id = db.Column(db.Integer, primary_key=True)
+    cohort = db.Column(db.Date, primary_key=True)
+    stage = db.Column(db.String(20), primary_key=True)
+    customers = db.Column(db.Integer, nullable=False, default=0)
+    seconds_to_reach = db.Column(db.BigInteger, nullable=False, default=0)
+
+FUNNEL_MONTHS = int(os.environ.get('FUNNEL_MONTHS', '12'))
+FUNNEL_MONTHS_MAX = int(os.environ.get('FUNNEL_MONTHS_MAX', '60'))
+
+NEARBY_LIMIT = int(os.environ.get('NEARBY_LIMIT', '100'))
+NEARBY_LIMIT_MAX = int(os.environ.get('NEARBY_LIMIT_MAX', '1000'))
+NEARBY_INITIAL_RADIUS_KM = 1.0
+# Past this the k-nearest search ranks every customer in one query instead
+# of growing the circle, which would cover most geohash cells anyway
+NEARBY_UNBOUNDED_RADIUS_KM = 2000.0
+
+LOCATION_BATCH_MAX = int(os.environ.get('LOCATION_BATCH_MAX', '1000'))
+LOCATION_BUFFER_ENABLED = os.environ.get('LOCATION_BUFFER_ENABLED', 'true').lower() == 'true'
+LOCATION_BUFFER_SIZE = int(os.environ.get('LOCATION_BUFFER_SIZE', '500'))
+LOCATION_BUFFER_MAX_DELAY_MS = int(os.environ.get('LOCATION_BUFFER_MAX_DELAY_MS', '1000'))
+# How far ahead of the server clock a client-supplied fix timestamp may be
+LOCATION_MAX_CLOCK_SKEW = td(minutes=5)
+
+# Live location streams: 'local' fans out within one process, 'postgres'
+# across workers through LISTEN/NOTIFY on LIVE_BROKER_URL
+LIVE_BROKER = os.environ.get('LIVE_BROKER', 'local')
+LIVE_BROKER_URL = os.environ.get('LIVE_BROKER_URL', app.config['SQLALCHEMY_DATABASE_URI'])
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_MAX_SUBSCRIBERS', '10'))
+LIVE_MAX_PENDING = int(os.environ.get('LIVE_MAX_PENDING', '1000'))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', '15'))
+LIVE_STREAM_MAX_SECONDS = float(os.environ.get('LIVE_STREAM_MAX_SECONDS', '300'))
+# A stream token only has to be valid when the stream is opened
+LIVE_STREAM_TOKEN_SECONDS = int(os.environ.get('LIVE_STREAM_TOKEN_SECONDS', '60'))
+
+LOCATION_RAW_RETENTION_DAYS = int(os.environ.get('LOCATION_RAW_RETENTION_DAYS', '30'))
+TRACK_TOLERANCE_M = float(os.environ.get('TRACK_TOLERANCE_M', '10'))
+TRACK_MIN_DISTANCE_M = float(os.environ.get('TRACK_MIN_DISTANCE_M', '10'))
+TRACK_MIN_INTERVAL_S = float(os.environ.get('TRACK_MIN_INTERVAL_S', '300'))
+TRACK_MAX_RANGE_DAYS = int(os.environ.get('TRACK_MAX_RANGE_DAYS', '31'))
 
-@app.route('/')
-def serve_react():
-    return send_from_directory(app.static_folder, 'index.html')
+EMAIL_FROM = os.environ.get('SMTP_FROM', os.environ.get('SMTP_USER'))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', '5'))
+EMAIL_RETRY_BASE_SECONDS = int(os.environ.get('EMAIL_RETRY_BASE_SECONDS', '30'))
+EMAIL_RETRY_MAX_SECONDS = int(os.environ.get('EMAIL_RETRY_MAX_SECONDS', '3600'))
+# A claimed message is retried after this long if its worker dies mid-send
+EMAIL_SEND_LEASE = td(minutes=5)
+
+IMPORT_KINDS = ('customers', 'interactions')
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+IMPORT_BATCH_SIZE_MAX = int(os.environ.get('IMPORT_BATCH_SIZE_MAX', '10000'))
+IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', str(1024 ** 3)))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', '1000'))
+IMPORT_DIR = os.environ.get('IMPORT_DIR', tempfile.gettempdir())
+
+BULK_DELETE_CHUNK_SIZE = int(os.environ.get('BULK_DELETE_CHUNK_SIZE', '500'))
+BULK_DELETE_MAX_IDS = int(os.environ.get('BULK_DELETE_MAX_IDS', '10000'))
+BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', '500'))
+BATCH_OPERATIONS = {(kind, op) for kind in ('customer', 'interaction') for op in ('create', 'update', 'delete')}
+INTERACTION_UPDATE_FIELDS = ('type', 'note')
+
+# Travel-time estimates assume this average driving speed
+AVERAGE_SPEED_KMH = 50
+DISTANCE_MATRIX_MAX_CELLS = int(os.environ.get('DISTANCE_MATRIX_MAX_CELLS', '10000'))
+GEODESIC_MATRIX_MAX_CELLS = int(os.environ.get('GEODESIC_MATRIX_MAX_CELLS', '2500'))
+distance_cache = TTLCache(
+    maxsize=int(os.environ.get('DISTANCE_CACHE_SIZE', '100000')),
+    ttl=float(os.environ.get('DISTANCE_CACHE_TTL', '86400'))
+)
+
+ROUTE_TIME_BUDGET_MS = int(os.environ.get('ROUTE_TIME_BUDGET_MS', '500'))
+ROUTE_TIME_BUDGET_MS_MAX = int(os.environ.get('ROUTE_TIME_BUDGET_MS_MAX', '2000'))
+
+CUSTOMER_FIELDS = ('id', 'name', 'email', 'phone', 'company', 'lat', 'lng', 'stage', 'created_by', 'created_at')
+SEARCH_LIMIT = int(os.environ.get('SEARCH_LIMIT', '20'))
+SEARCH_LIMIT_MAX = int(os.environ.get('SEARCH_LIMIT_MAX', '100'))
+INTERACTION_FIELDS = ('id', 'customer_id', 'user_id', 'type', 'note', 'timestamp')
+INTERACTION_COLUMNS = tuple(getattr(Interaction, f) for f in INTERACTION_FIELDS)
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '2000'))
+CUSTOMER_PAGE_SIZE = int(os.environ.get('CUSTOMER_PAGE_SIZE', '100'))
+CUSTOMER_PAGE_SIZE_MAX = int(os.environ.get('CUSTOMER_PAGE_SIZE_MAX', '1000'))
+TIMELINE_PAGE_SIZE = int(os.environ.get('TIMELINE_PAGE_SIZE', '50'))
+TIMELINE_PAGE_SIZE_MAX = int(os.environ.get('TIMELINE_PAGE_SIZE_MAX', '500'))
+
+def encode_keyset_cursor(timestamp, row_id):
+    """Opaque keyset-pagination cursor for a (timestamp, id) position, e.g. a customer's created_at."""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_keyset_cursor(cursor):
+    """Return the (timestamp, id) pair encoded by encode_keyset_cursor.
+
+    Raises ValueError for anything that was not produced by it.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('invalid cursor')
+
+static_build = StaticBuild(FRONTEND_DIR, precompress=STATIC_PRECOMPRESS)
+
+@app.route('/', defaults={'filename': 'index.html'})
+@app.route('/<path:filename>')
+def serve_react(filename):
+    if not static_build.exists(filename):
+        abort(404)
+    return static_build.send(filename)
 
 @app.errorhandler(404)
 def not_found(e):
-    return send_from_directory(app.static_folder, 'index.html')
+    # Client-side routes get the app; unknown API paths and missing assets
+    # (e.g. chunks of a previous build) must not be answered with HTML
+    last_segment = request.path.rsplit('/', 1)[-1]
+    if request.path.startswith('/api/') or '.' in last_segment or not static_build.exists('index.html'):
+        return jsonify({'message': 'Not found'}), 404
+    return static_build.send('index.html')
+
+@app.cli.command('precompress-static')
+def precompress_static_command():
+    """Write gzip (and, with brotli installed, brotli) copies of the React build at the best quality."""
+    if not os.path.isdir(FRONTEND_DIR):
+        raise click.ClickException(f'No React build at {FRONTEND_DIR}')
+    variants = StaticBuild(FRONTEND_DIR, precompress=True, levels=BUILD_LEVELS).scan()
+    click.echo(f"Precompressed {len(variants)} files in {FRONTEND_DIR}")
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -133,6 +608,94 @@ def register():
     db.session.commit()
     return jsonify({'message': 'User created successfully'}), 201
 
+smtp_pool = SMTPPool.from_env()
+
+def enqueue_email(recipient, subject, body):
+    """Add a message to the outbox; it is sent once the caller commits."""
+    db.session.add(EmailOutbox(recipient=recipient, sender=EMAIL_FROM, subject=subject, body=body))
+
+def deliver_due_emails(limit=50):
+    """Send up to ``limit`` due outbox messages; returns how many were attempted.
+
+    Each message is claimed with a conditional UPDATE that pushes its
+    next_attempt_at out by EMAIL_SEND_LEASE, so concurrent workers never
+    send the same message twice. Failures are retried with exponential
+    backoff until EMAIL_MAX_ATTEMPTS, after which the message is 'failed'.
+    """
+    if smtp_pool is None:
+        return 0
+    now = datetime.utcnow()
+    due_ids = [row.id for row in db.session.query(EmailOutbox.id).filter(
+        EmailOutbox.status == 'pending',
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.next_attempt_at).limit(limit)]
+
+    attempted = 0
+    for email_id in due_ids:
+        claimed = db.session.execute(db.update(EmailOutbox).where(
+            EmailOutbox.id == email_id,
+            EmailOutbox.status == 'pending',
+            EmailOutbox.next_attempt_at <= now
+        ).values(
+            attempts=EmailOutbox.attempts + 1,
+            next_attempt_at=now + EMAIL_SEND_LEASE
+        )).rowcount
+        db.session.commit()
+        if not claimed:
+            continue
+        attempted += 1
+
+        email = db.session.get(EmailOutbox, email_id)
+        msg = EmailMessage()
+        msg['Subject'] = email.subject
+        msg['From'] = email.sender
+        msg['To'] = email.recipient
+        msg.set_content(email.body)
+        try:
+            smtp_pool.send(msg)
+        except (smtplib.SMTPException, OSError) as e:
+            email.last_error = str(e)[:500]
+            permanent = isinstance(e, smtplib.SMTPRecipientsRefused)
+            if permanent or email.attempts >= EMAIL_MAX_ATTEMPTS:
+                email.status = 'failed'
+            else:
+                backoff = min(EMAIL_RETRY_BASE_SECONDS * 2 ** (email.attempts - 1), EMAIL_RETRY_MAX_SECONDS)
+                email.next_attempt_at = datetime.utcnow() + td(seconds=backoff)
+        else:
+            email.status = 'sent'
+            email.sent_at = datetime.utcnow()
+            email.last_error = None
+        db.session.commit()
+    return attempted
+
+def deliver_emails_in_background():
+    with app.app_context():
+        try:
+            return deliver_due_emails()
+        finally:
+            db.session.remove()
+
+email_worker = OutboxWorker(
+    deliver_emails_in_background,
+    poll_interval=float(os.environ.get('EMAIL_POLL_INTERVAL', '30'))
+)
+
+@app.cli.command('send-emails')
+@click.option('--loop', is_flag=True, help='Keep polling the outbox instead of exiting once it is drained.')
+def send_emails_command(loop):
+    """Deliver pending outbox email."""
+    if smtp_pool is None:
+        raise click.ClickException('SMTP_HOST is not configured')
+    total = 0
+    while True:
+        attempted = deliver_due_emails()
+        total += attempted
+        if not attempted:
+            if not loop:
+                break
+            time.sleep(email_worker.poll_interval)
+    click.echo(f"Attempted delivery of {total} emails")
+
 @app.route('/api/forgot-password', methods=['POST'])
 def forgot_password():
     data = request.get_json()
@@ -147,37 +710,19 @@ def forgot_password():
     frontend_url = app.config.get('FRONTEND_URL', 'http://localhost:3000').rstrip('/')
     reset_url = f"{frontend_url}/reset-password/{reset_token}"
 
-    # Attempt to send email if SMTP environment is configured
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = int(os.environ.get('SMTP_PORT', '587'))
-    smtp_user = os.environ.get('SMTP_USER')
-    smtp_pass = os.environ.get('SMTP_PASS')
-    smtp_use_tls = os.environ.get('SMTP_USE_TLS', 'true').lower() == 'true'
-    from_email = os.environ.get('SMTP_FROM', smtp_user)
-
-    email_sent = False
-    if smtp_host and smtp_user and smtp_pass and from_email:
-      try:
-        msg = EmailMessage()
-        msg['Subject'] = 'Reset your CRM password'
-        msg['From'] = from_email
-        msg['To'] = email
-        msg.set_content(f"Click the link below to reset your password:\n\n{reset_url}\n\nThis link expires in 15 minutes.")
-        if smtp_use_tls:
-          with smtplib.SMTP(smtp_host, smtp_port, timeout=10) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_pass)
-            server.send_message(msg)
-            email_sent = True
-        else:
-          with smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=10) as server:
-            server.login(smtp_user, smtp_pass)
-            server.send_message(msg)
-            email_sent = True
-      except Exception:
-        email_sent = False
+    # Queue the email if SMTP is configured; the outbox worker delivers it
+    email_queued = False
+    if smtp_pool is not None and EMAIL_FROM:
+        enqueue_email(
+            email,
+            'Reset your CRM password',
+            f"Click the link below to reset your password:\n\n{reset_url}\n\nThis link expires in 15 minutes."
+        )
+        db.session.commit()
+        email_worker.notify()
+        email_queued = True
 
-    return jsonify({'message': 'Password reset link generated', 'reset_url': reset_url, 'email_sent': email_sent}), 200
+    return jsonify({'message': 'Password reset link generated', 'reset_url': reset_url, 'email_sent': email_queued}), 200
 
 @app.route('/api/reset-password', methods=['POST'])
 def reset_password():
@@ -218,6 +763,14 @@ def login():
         }
     }), 200
 
+# Google's signing keys; GOOGLE_JWKS_FILE pins a local key set (e.g. in tests)
+if os.environ.get('GOOGLE_JWKS_FILE'):
+    google_keys = GoogleKeySet.from_file(os.environ['GOOGLE_JWKS_FILE'])
+else:
+    google_keys = GoogleKeySet(cache_path=os.environ.get(
+        'GOOGLE_JWKS_CACHE', os.path.join(tempfile.gettempdir(), 'crm-google-jwks.json')
+    ))
+
 @app.route('/api/login/google', methods=['POST'])
 def login_google():
     data = request.get_json()
@@ -225,18 +778,16 @@ def login_google():
     if not id_token:
         return jsonify({'message': 'id_token is required'}), 400
     try:
-        # Verify ID token via Google tokeninfo endpoint
-        verify_resp = requests.get('https://oauth2.googleapis.com/tokeninfo', params={'id_token': id_token})
-        if verify_resp.status_code != 200:
+        # Verify the ID token's signature, issuer, expiry and audience locally
+        try:
+            token_info = google_keys.verify(id_token, audience=app.config.get('GOOGLE_CLIENT_ID'))
+        except pyjwt.InvalidAudienceError:
+            return jsonify({'message': 'Token audience mismatch'}), 401
+        except pyjwt.InvalidTokenError:
             return jsonify({'message': 'Invalid Google token'}), 401
-        token_info = verify_resp.json()
-        aud = token_info.get('aud')
         email = token_info.get('email')
         name = token_info.get('name') or email
         email_verified = token_info.get('email_verified') in ['true', True]
-        client_id = app.config.get('GOOGLE_CLIENT_ID')
-        if client_id and aud != client_id:
-            return jsonify({'message': 'Token audience mismatch'}), 401
         if not email or not email_verified:
             return jsonify({'message': 'Email not verified with Google'}), 401
         user = User.query.filter_by(email=email).first()
@@ -259,30 +810,565 @@ def login_google():
     except Exception:
         return jsonify({'message': 'Failed to authenticate with Google'}), 401
 
+def filter_customers(query, user):
+    """Scope a Customer query to what ``user`` may see and apply the list filters."""
+    if user.role == 'admin':
+        created_by = request.args.get('created_by', type=int)
+        if created_by is not None:
+            query = query.filter(Customer.created_by == created_by)
+    else:
+        query = query.filter(Customer.created_by == user.id)
+    stage = request.args.get('stage')
+    if stage:
+        query = query.filter(Customer.stage == stage)
+    company = request.args.get('company')
+    if company:
+        query = query.filter(Customer.company == company)
+    return query
+
+def parse_customer_fields():
+    """Columns requested with ?fields=, or all of them. Raises ValueError on unknown names."""
+    fields = request.args.get('fields')
+    if not fields:
+        return list(CUSTOMER_FIELDS)
+    fields = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in CUSTOMER_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+@app.route('/api/metrics/slow-queries', methods=['GET'])
+@jwt_required()
+def get_slow_queries():
+    """The most recent statements slower than SLOW_QUERY_MS, newest first (admins only)."""
+    if get_current_user().role != 'admin':
+        return jsonify({'message': 'Permission denied'}), 403
+    return jsonify(list(reversed(slow_queries))), 200
+
 @app.route('/api/customers', methods=['GET'])
 @jwt_required()
 def get_customers():
+    user = get_current_user()
+
+    try:
+        limit = min(int(request.args.get('limit', CUSTOMER_PAGE_SIZE)), CUSTOMER_PAGE_SIZE_MAX)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'message': 'limit must be a positive integer'}), 400
+
+    try:
+        fields = parse_customer_fields()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    # Only the requested columns are loaded; created_at and id are always
+    # selected because they form the pagination key.
+    columns = [getattr(Customer, f) for f in fields]
+    for key in ('created_at', 'id'):
+        if key not in fields:
+            columns.append(getattr(Customer, key))
+    query = filter_customers(db.session.query(*columns), user)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after_created_at, after_id = decode_keyset_cursor(cursor)
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        query = query.filter(db.or_(
+            Customer.created_at > after_created_at,
+            db.and_(Customer.created_at == after_created_at, Customer.id > after_id)
+        ))
+
+    rows = query.order_by(Customer.created_at, Customer.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    response = jsonify(records(fields, rows))
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_keyset_cursor(rows[-1].created_at, rows[-1].id)
+    return response, 200
+
+def export_response(name, query, fields):
+    """Stream the rows of ``query`` as a CSV or NDJSON download.
+
+    Rows are fetched EXPORT_BATCH_SIZE at a time (a server-side cursor on
+    Postgres) and written out as they arrive, with chunked transfer
+    encoding; ``?gzip=true`` compresses the stream on the fly.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'message': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    result = db.session.execute(query.statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    chunks = export_chunks(fmt, fields, result.partitions())
+    filename = f'{name}.{fmt}'
+    mimetype = EXPORT_CONTENT_TYPES[fmt]
+    if request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Keep reverse proxies from buffering the whole export
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/exports/customers', methods=['GET'])
+@jwt_required()
+def export_customers():
+    """Export customers, with the same filters and ?fields= as GET /api/customers."""
+    user = get_current_user()
+    try:
+        fields = parse_customer_fields()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    query = filter_customers(db.session.query(*[getattr(Customer, f) for f in fields]), user)
+    return export_response('customers', query.order_by(Customer.id), fields)
+
+@app.route('/api/exports/interactions', methods=['GET'])
+@jwt_required()
+def export_interactions():
+    user = get_current_user()
+    query = db.session.query(*INTERACTION_COLUMNS)
+    if user.role != 'admin':
+        query = query.filter(Interaction.user_id == user.id)
+    customer_id = request.args.get('customer_id', type=int)
+    if customer_id is not None:
+        query = query.filter(Interaction.customer_id == customer_id)
+    return export_response('interactions', query.order_by(Interaction.id), list(INTERACTION_FIELDS))
+
+@app.route('/api/search', methods=['GET'])
+@jwt_required()
+def search_records():
+    """Ranked full-text search over customers and interaction notes.
+
+    Every word of ``q`` must match, as a prefix, one of the customer's name,
+    company, email or phone, or the interaction's note. ``type`` limits the
+    search to customers or interactions; ``limit``/``offset`` page both lists.
+    """
+    user = get_current_user()
+    terms = search.search_terms(request.args.get('q'))
+    if not terms:
+        return jsonify({'message': 'q is required'}), 400
+    search_type = request.args.get('type', 'all')
+    if search_type not in ('all', 'customers', 'interactions'):
+        return jsonify({'message': 'type must be all, customers or interactions'}), 400
+    limit = max(min(request.args.get('limit', SEARCH_LIMIT, type=int), SEARCH_LIMIT_MAX), 1)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    dialect = db.engine.dialect.name
+    scoped = user.role != 'admin'
+    params = {
+        'query': search.match_expression(dialect, terms),
+        'limit': limit + 1,
+        'offset': offset,
+        'user_id': user.id
+    }
+    result = {'query': ' '.join(terms)}
+    has_more = False
+    if search_type in ('all', 'customers'):
+        rows = db.session.execute(db.text(search.customer_query(dialect, scoped)), params).mappings().all()
+        has_more = has_more or len(rows) > limit
+        result['customers'] = [dict(row, rank=round(float(row['rank']), 4)) for row in rows[:limit]]
+    if search_type in ('all', 'interactions'):
+        rows = db.session.execute(db.text(search.interaction_query(dialect, scoped)), params).mappings().all()
+        has_more = has_more or len(rows) > limit
+        hits = []
+        for row in rows[:limit]:
+            timestamp = row['timestamp']
+            if isinstance(timestamp, str):
+                # SQLite hands back raw text for columns of a text() query
+                timestamp = datetime.fromisoformat(timestamp)
+            hits.append(dict(row, timestamp=timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                             rank=round(float(row['rank']), 4)))
+        result['interactions'] = hits
+    result['next_offset'] = offset + limit if has_more else None
+    return jsonify(result), 200
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Create the full-text search tables/indexes and fill them from existing rows."""
+    with db.engine.begin() as connection:
+        search.install(connection, rebuild=True)
+    click.echo(f'Search index ready ({db.engine.dialect.name})')
+
+def customers_within(lat, lng, radius_km, created_by=None):
+    """Return (distance_km, row) pairs for customers within radius_km, nearest first.
+
+    Candidates come from the geohash prefix ranges covering the bounding box
+    of the circle, further narrowed by the box itself; exact haversine
+    distances are only computed for those. A radius_km of None matches every
+    customer with coordinates.
+    """
+    columns = [getattr(Customer, f) for f in CUSTOMER_FIELDS]
+    if radius_km is None:
+        query = db.session.query(*columns).filter(Customer.lat.isnot(None), Customer.lng.isnot(None))
+    else:
+        query = db.session.query(*columns).filter(*customer_area_filters(lat, lng, radius_km))
+    if created_by is not None:
+        query = query.filter(Customer.created_by == created_by)
+    rows = query.all()
+    if not rows:
+        return []
+    distances = haversine_km(lat, lng, [row.lat for row in rows], [row.lng for row in rows])
+    matches = [(float(distance), row) for distance, row in zip(distances, rows)
+               if radius_km is None or distance <= radius_km]
+    matches.sort(key=lambda match: match[0])
+    return matches
+
+def customer_area_filters(lat, lng, radius_km):
+    """Filters selecting the customers in the bounding box of a circle, by geohash range first."""
+    south, west, north, east = bounding_box(lat, lng, radius_km)
+    cells = []
+    for prefix in geohash_cover(south, west, north, east):
+        upper = prefix_upper_bound(prefix)
+        if upper is None:
+            cells.append(Customer.geohash >= prefix)
+        else:
+            cells.append(db.and_(Customer.geohash >= prefix, Customer.geohash < upper))
+    if west < -180.0:
+        lng_filter = db.or_(Customer.lng >= west + 360.0, Customer.lng <= east)
+    elif east > 180.0:
+        lng_filter = db.or_(Customer.lng >= west, Customer.lng <= east - 360.0)
+    else:
+        lng_filter = Customer.lng.between(west, east)
+    return db.or_(*cells), Customer.lat.between(south, north), lng_filter
+
+@app.route('/api/customers/nearby', methods=['GET'])
+@jwt_required()
+def nearby_customers():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if user.role == 'admin':
-        customers = Customer.query.all()
+    user = get_current_user()
+
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if lat is None or lng is None:
+        user_location = latest_user_location(current_user_id)
+        if not user_location:
+            return jsonify({'message': 'User location not available'}), 400
+        lat, lng = user_location.latitude, user_location.longitude
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({'message': 'lat/lng out of range'}), 400
+
+    radius_km = request.args.get('radius_km', type=float)
+    k = request.args.get('k', type=int)
+    if (radius_km is None) == (k is None):
+        return jsonify({'message': 'Provide exactly one of radius_km or k'}), 400
+    created_by = None if user.role == 'admin' else current_user_id
+
+    if radius_km is not None:
+        if radius_km <= 0:
+            return jsonify({'message': 'radius_km must be positive'}), 400
+        limit = min(request.args.get('limit', NEARBY_LIMIT, type=int), NEARBY_LIMIT_MAX)
+        matches = customers_within(lat, lng, radius_km, created_by)[:limit]
     else:
-        customers = Customer.query.filter_by(created_by=current_user_id).all()
+        if k <= 0:
+            return jsonify({'message': 'k must be positive'}), 400
+        k = min(k, NEARBY_LIMIT_MAX)
+        # Grow the search circle until it holds k customers; everything
+        # outside the circle is farther than everything inside it. Callers
+        # with fewer than k customers nearby get one unbounded query.
+        radius_km = NEARBY_INITIAL_RADIUS_KM
+        while True:
+            matches = customers_within(lat, lng, radius_km, created_by)
+            if len(matches) >= k:
+                break
+            radius_km *= 4
+            if radius_km > NEARBY_UNBOUNDED_RADIUS_KM:
+                matches = customers_within(lat, lng, None, created_by)
+                break
+        matches = matches[:k]
+
     result = []
-    for customer in customers:
-        result.append({
-            'id': customer.id,
-            'name': customer.name,
-            'email': customer.email,
-            'phone': customer.phone,
-            'company': customer.company,
-            'lat': customer.lat,
-            'lng': customer.lng,
-            'stage': customer.stage,
-            'created_by': customer.created_by,
-            'created_at': customer.created_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
-    return jsonify(result), 200
+    for distance_km, row in matches:
+        item = dict(zip(CUSTOMER_FIELDS, row))
+        item['distance_km'] = round(distance_km, 3)
+        result.append(item)
+    return jsonify({
+        'origin': {'lat': lat, 'lng': lng},
+        'customers': result
+    }), 200
+
+@app.cli.command('rebuild-geohashes')
+def rebuild_geohashes_command():
+    """Recompute Customer.geohash for every customer, in batches."""
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.query(Customer.id, Customer.lat, Customer.lng).filter(
+            Customer.id > last_id
+        ).order_by(Customer.id).limit(1000).all()
+        if not rows:
+            break
+        db.session.execute(db.update(Customer), [
+            {'id': row.id, 'geohash': customer_geohash(row.lat, row.lng)} for row in rows
+        ])
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
+    click.echo(f"Updated geohashes of {updated} customers")
+
+def import_job_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'format': job.format,
+        'status': job.status,
+        'processed_rows': job.processed_rows,
+        'inserted_rows': job.inserted_rows,
+        'duplicate_rows': job.duplicate_rows,
+        'failed_rows': job.failed_rows,
+        'errors': json.loads(job.errors) if job.errors else [],
+        'message': job.message,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None
+    }
+
+def clean_import_interaction(record):
+    values = clean_interaction(record)
+    if values['timestamp'] is not None:
+        try:
+            values['timestamp'] = parse_client_timestamp(values['timestamp'])
+        except (ValueError, OverflowError, OSError):
+            raise ValueError('timestamp is invalid')
+    return values
+
+def _import_customer_batch(job, importer, batch, report):
+    """Insert a batch of cleaned customer rows, skipping emails the owner already has.
+
+    Emails are compared case-insensitively, per owning rep.
+    """
+    now = datetime.utcnow()
+    owner_ids = {values['created_by'] for _, values in batch if values['created_by'] is not None}
+    if importer.role != 'admin' or not owner_ids:
+        known_owners = set()
+    else:
+        known_owners = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(owner_ids))}
+    valid = []
+    for row_number, values in batch:
+        if values['created_by'] is None or importer.role != 'admin':
+            values['created_by'] = importer.id
+        elif values['created_by'] not in known_owners:
+            job.failed_rows += 1
+            report(row_number, 'created_by does not exist')
+            continue
+        valid.append((row_number, values))
+    emails = {(values['created_by'], values['email'].lower()) for _, values in valid if values['email']}
+    seen_emails = set()
+    if emails:
+        seen_emails = {tuple(row) for row in db.session.query(Customer.created_by, db.func.lower(Customer.email)).filter(
+            Customer.created_by.in_({owner_id for owner_id, _ in emails}),
+            db.func.lower(Customer.email).in_({email for _, email in emails})
+        )}
+
+    rows = []
+    for row_number, values in valid:
+        if values['email']:
+            key = (values['created_by'], values['email'].lower())
+            if key in seen_emails:
+                job.duplicate_rows += 1
+                report(row_number, 'Duplicate email')
+                continue
+            seen_emails.add(key)
+        values['created_at'] = now
+        values['geohash'] = customer_geohash(values['lat'], values['lng'])
+        values['stage_entered_at'] = now
+        values['furthest_stage'] = furthest_stage_after(None, values['stage'])
+        rows.append(values)
+    if not rows:
+        return
+    customer_ids = db.session.scalars(db.insert(Customer).returning(Customer.id, sort_by_parameter_order=True), rows)
+    record_stage_transitions([
+        new_customer_transition(customer_id, values['created_by'], values['stage'], now)
+        for customer_id, values in zip(customer_ids, rows)
+    ])
+    stages_by_owner = {}
+    for values in rows:
+        stages_by_owner.setdefault(values['created_by'], Counter())[values['stage']] += 1
+    for owner_id, stages in stages_by_owner.items():
+        bump_pipeline_rollup(owner_id, day=now.date(), stage_deltas=stages,
+                             customers_created=sum(stages.values()))
+    job.inserted_rows += len(rows)
+
+def _import_interaction_batch(job, importer, batch, report):
+    """Insert a batch of cleaned interaction rows logged by the importer."""
+    now = datetime.utcnow()
+    customer_ids = {values['customer_id'] for _, values in batch}
+    owners = dict(db.session.query(Customer.id, Customer.created_by).filter(Customer.id.in_(customer_ids)))
+
+    rows = []
+    for row_number, values in batch:
+        owner_id = owners.get(values['customer_id'])
+        if owner_id is None:
+            job.failed_rows += 1
+            report(row_number, 'customer_id does not exist')
+            continue
+        if importer.role != 'admin' and owner_id != importer.id:
+            job.failed_rows += 1
+            report(row_number, 'Permission denied for customer_id')
+            continue
+        values['user_id'] = importer.id
+        values['timestamp'] = values['timestamp'] or now
+        rows.append(values)
+    if not rows:
+        return
+    db.session.execute(db.insert(Interaction), rows)
+    for day, count in Counter(values['timestamp'].date() for values in rows).items():
+        bump_pipeline_rollup(importer.id, day=day, interactions=count)
+    job.inserted_rows += len(rows)
+
+def run_import(job_id, path, batch_size=IMPORT_BATCH_SIZE, remove_file=True):
+    """Stream the file at ``path`` into the table of an ImportJob.
+
+    Rows are validated one by one and inserted ``batch_size`` at a time; the
+    job's counters and error report are committed with every batch, so
+    progress can be polled while the import runs.
+    """
+    job = db.session.get(ImportJob, job_id)
+    importer = load_user(job.user_id)
+    if job.kind == 'customers':
+        clean, insert_batch = clean_customer, _import_customer_batch
+    else:
+        clean, insert_batch = clean_import_interaction, _import_interaction_batch
+    errors = []
+
+    def report(row_number, message):
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({'row': row_number, 'error': message})
+
+    def commit_batch(batch):
+        if batch:
+            insert_batch(job, importer, batch, report)
+        errors.sort(key=lambda error: error['row'])
+        job.errors = json.dumps(errors)
+        db.session.commit()
+
+    job.status = 'running'
+    db.session.commit()
+    try:
+        with open(path, 'rb') as f:
+            batch = []
+            for row_number, record, error in iter_records(f, job.format):
+                job.processed_rows += 1
+                if error is None:
+                    try:
+                        batch.append((row_number, clean(record)))
+                    except ValueError as e:
+                        error = str(e)
+                if error is not None:
+                    job.failed_rows += 1
+                    report(row_number, error)
+                if len(batch) >= batch_size:
+                    commit_batch(batch)
+                    batch = []
+            commit_batch(batch)
+        job.status = 'completed'
+    except Exception as e:
+        app.logger.exception('Import %s failed', job_id)
+        db.session.rollback()
+        job = db.session.get(ImportJob, job_id)
+        job.status = 'failed'
+        job.message = str(e)[:500]
+    finally:
+        if remove_file:
+            os.remove(path)
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+def run_import_in_background(job_id, path, batch_size):
+    with app.app_context():
+        try:
+            run_import(job_id, path, batch_size)
+        finally:
+            db.session.remove()
+
+@app.route('/api/imports/<kind>', methods=['POST'])
+@jwt_required()
+def start_import(kind):
+    """Upload a CSV or NDJSON file of customers or interactions for import.
+
+    The body is the raw file (format from ?format= or Content-Type) or a
+    multipart form with a ``file`` field. It is spooled to disk in chunks
+    and imported in the background; poll GET /api/imports/<id> for progress.
+    """
+    if kind not in IMPORT_KINDS:
+        return jsonify({'message': f"Can only import {', '.join(IMPORT_KINDS)}"}), 404
+    user = get_current_user()
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'message': 'file is required'}), 400
+        stream = upload.stream
+        fmt = request.args.get('format') or detect_format(upload.mimetype, upload.filename)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or detect_format(request.mimetype)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'message': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+    batch_size = max(min(request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int), IMPORT_BATCH_SIZE_MAX), 1)
+
+    fd, path = tempfile.mkstemp(prefix='crm-import-', dir=IMPORT_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            copy_stream(stream, f, max_bytes=IMPORT_MAX_BYTES)
+    except ValueError as e:
+        os.remove(path)
+        return jsonify({'message': str(e)}), 413
+
+    job = ImportJob(kind=kind, format=fmt, user_id=user.id)
+    db.session.add(job)
+    db.session.commit()
+    threading.Thread(target=run_import_in_background, args=(job.id, path, batch_size), daemon=True).start()
+    return jsonify(import_job_dict(job)), 202
+
+@app.route('/api/imports/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_import(job_id):
+    job = db.session.get(ImportJob, job_id)
+    if not job:
+        return jsonify({'message': 'Import not found'}), 404
+    user = get_current_user()
+    if user.role != 'admin' and job.user_id != user.id:
+        return jsonify({'message': 'Permission denied'}), 403
+    return jsonify(import_job_dict(job)), 200
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True, help='User the rows are imported as.')
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), help='Defaults to the file extension.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+def import_data_command(kind, path, user_id, fmt, batch_size):
+    """Import customers or interactions from a CSV or NDJSON file."""
+    fmt = fmt or detect_format(None, path)
+    if fmt is None:
+        raise click.ClickException('Cannot tell the format from the file name; pass --format')
+    if load_user(user_id) is None:
+        raise click.ClickException(f'No user with id {user_id}')
+    job = ImportJob(kind=kind, format=fmt, user_id=user_id)
+    db.session.add(job)
+    db.session.commit()
+    job = run_import(job.id, path, batch_size, remove_file=False)
+    click.echo(f"Import {job.id} {job.status}: {job.inserted_rows} inserted, "
+               f"{job.duplicate_rows} duplicates, {job.failed_rows} failed of {job.processed_rows} rows")
+    if job.message:
+        click.echo(job.message)
+
+def customer_dict(customer):
+    return {
+        'id': customer.id,
+        'name': customer.name,
+        'email': customer.email,
+        'phone': customer.phone,
+        'company': customer.company,
+        'lat': customer.lat,
+        'lng': customer.lng,
+        'stage': customer.stage,
+        'created_by': customer.created_by,
+        'created_at': customer.created_at
+    }
 
 @app.route('/api/customers/<int:id>', methods=['GET'])
 @jwt_required()
@@ -292,39 +1378,82 @@ def get_customer(id):
     if not customer:
         return jsonify({'message': 'Customer not found'}), 404
     
-    user = User.query.get(current_user_id)
+    user = get_current_user()
     if user.role != 'admin' and customer.created_by != current_user_id:
         return jsonify({'message': 'Permission denied'}), 403
     
+    return jsonify(customer_dict(customer)), 200
+
+@app.route('/api/customers/<int:id>/timeline', methods=['GET'])
+@jwt_required()
+def get_customer_timeline(id):
+    """The customer and a page of its interactions, newest first.
+
+    Pages are keyed on (timestamp, id) and walk the (customer_id, timestamp)
+    index backwards, so later pages of a long history cost the same as the
+    first. next_cursor is null on the last page.
+    """
+    current_user_id = get_jwt_identity()
+    customer = db.session.get(Customer, id)
+    if not customer:
+        return jsonify({'message': 'Customer not found'}), 404
+
+    user = get_current_user()
+    if user.role != 'admin' and customer.created_by != current_user_id:
+        return jsonify({'message': 'Permission denied'}), 403
+
+    try:
+        limit = min(int(request.args.get('limit', TIMELINE_PAGE_SIZE)), TIMELINE_PAGE_SIZE_MAX)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'message': 'limit must be a positive integer'}), 400
+
+    query = db.session.query(*INTERACTION_COLUMNS).filter(Interaction.customer_id == id)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            before_timestamp, before_id = decode_keyset_cursor(cursor)
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        query = query.filter(db.or_(
+            Interaction.timestamp < before_timestamp,
+            db.and_(Interaction.timestamp == before_timestamp, Interaction.id < before_id)
+        ))
+
+    interactions = query.order_by(Interaction.timestamp.desc(), Interaction.id.desc()).limit(limit + 1).all()
+    has_more = len(interactions) > limit
+    interactions = interactions[:limit]
+
     return jsonify({
-        'id': customer.id,
-        'name': customer.name,
-        'email': customer.email,
-        'phone': customer.phone,
-        'company': customer.company,
-        'lat': customer.lat,
-        'lng': customer.lng,
-        'stage': customer.stage,
-        'created_by': customer.created_by,
-        'created_at': customer.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        'customer': customer_dict(customer),
+        'interactions': records(INTERACTION_FIELDS, interactions),
+        'next_cursor': encode_keyset_cursor(interactions[-1].timestamp, interactions[-1].id) if has_more else None
     }), 200
 
+def add_customer(created_by, stage='New', **fields):
+    """Insert a customer with its rollup bumps and initial stage transition; the caller commits."""
+    now = datetime.utcnow()
+    customer = Customer(created_by=created_by, stage=stage, created_at=now, stage_entered_at=now,
+                        furthest_stage=furthest_stage_after(None, stage), **fields)
+    db.session.add(customer)
+    db.session.flush()
+    bump_pipeline_rollup(created_by, day=now.date(), stage_deltas={stage: 1}, customers_created=1)
+    record_stage_transitions([new_customer_transition(customer.id, created_by, stage, now)])
+    return customer
+
 @app.route('/api/customers', methods=['POST'])
 @jwt_required()
 def create_customer():
     current_user_id = get_jwt_identity()
     data = request.get_json()
-    new_customer = Customer(
-        name=data['name'],
-        email=data.get('email'),
-        phone=data.get('phone'),
-        company=data.get('company'),
-        lat=data.get('lat'),
-        lng=data.get('lng'),
-        stage=data.get('stage', 'New'),
-        created_by=current_user_id
-    )
-    db.session.add(new_customer)
+    # Validated and normalised (e.g. lowercased email) as in imports and batches
+    try:
+        values = clean_customer(data)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    del values['created_by']
+    new_customer = add_customer(current_user_id, **values)
     db.session.commit()
     return jsonify({
         'id': new_customer.id,
@@ -340,16 +1469,21 @@ def update_customer(id):
     customer = Customer.query.get(id)
     if not customer:
         return jsonify({'message': 'Customer not found'}), 404
-    user = User.query.get(current_user_id)
+    user = get_current_user()
     if user.role != 'admin' and customer.created_by != current_user_id:
         return jsonify({'message': 'Permission denied'}), 403
-    customer.name = data.get('name', customer.name)
-    customer.email = data.get('email', customer.email)
-    customer.phone = data.get('phone', customer.phone)
-    customer.company = data.get('company', customer.company)
-    customer.lat = data.get('lat', customer.lat)
-    customer.lng = data.get('lng', customer.lng)
-    customer.stage = data.get('stage', customer.stage)
+    try:
+        values = clean_customer_update(data)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    for field, value in values.items():
+        if field != 'stage':
+            setattr(customer, field, value)
+    old_stage = customer.stage
+    transition = change_stage(customer, values.get('stage', customer.stage), datetime.utcnow())
+    if transition is not None:
+        bump_pipeline_rollup(customer.created_by, stage_deltas={old_stage: -1, customer.stage: 1})
+        record_stage_transitions([transition])
     db.session.commit()
     return jsonify({'message': 'Customer updated successfully'}), 200
 
@@ -360,37 +1494,185 @@ def delete_customer(id):
     customer = Customer.query.get(id)
     if not customer:
         return jsonify({'message': 'Customer not found'}), 404
-    user = User.query.get(current_user_id)
+    user = get_current_user()
     if user.role != 'admin' and customer.created_by != current_user_id:
         return jsonify({'message': 'Permission denied'}), 403
-    db.session.delete(customer)
+    delete_customer_rows([id])
     db.session.commit()
     return jsonify({'message': 'Customer deleted successfully'}), 200
 
+def delete_customer_rows(customer_ids):
+    """Delete customers and their interactions with one DELETE per table.
+
+    The rollups are decremented from the rows the DELETEs return, in the
+    current transaction; the caller commits. Returns the numbers of
+    customers and interactions deleted.
+    """
+    customer_ids = list(customer_ids)
+    if not customer_ids:
+        return 0, 0
+    no_sync = {'synchronize_session': False}
+    deleted_interactions = db.session.execute(
+        db.delete(Interaction).where(Interaction.customer_id.in_(customer_ids))
+        .returning(Interaction.user_id, Interaction.timestamp),
+        execution_options=no_sync
+    ).all()
+    deleted_customers = db.session.execute(
+        db.delete(Customer).where(Customer.id.in_(customer_ids))
+        .returning(Customer.created_by, Customer.stage, Customer.created_at),
+        execution_options=no_sync
+    ).all()
+
+    stage_deltas = {}
+    activity = Counter()
+    for owner_id, stage, created_at in deleted_customers:
+        stage_deltas.setdefault(owner_id, Counter())[stage] -= 1
+        activity[owner_id, created_at.date() if created_at else None, 'customers_created'] -= 1
+    for user_id, timestamp in deleted_interactions:
+        activity[user_id, timestamp.date() if timestamp else None, 'interactions'] -= 1
+    bump_rollups(stage_deltas, activity)
+    return len(deleted_customers), len(deleted_interactions)
+
+def customer_purge_filters(ids=None, stage=None, created_by=None, created_before=None):
+    """WHERE clauses selecting customers for a bulk delete."""
+    filters = []
+    if ids is not None:
+        filters.append(Customer.id.in_(ids))
+    if stage is not None:
+        filters.append(Customer.stage == stage)
+    if created_by is not None:
+        filters.append(Customer.created_by == created_by)
+    if created_before is not None:
+        filters.append(Customer.created_at < created_before)
+    return filters
+
+def purge_customers(filters, chunk_size=BULK_DELETE_CHUNK_SIZE, progress=None):
+    """Delete every customer matching ``filters`` (and their interactions).
+
+    Works through the matches ``chunk_size`` ids at a time, committing after
+    each chunk so no transaction holds its locks for long. ``progress`` is
+    called with the running totals after each chunk. Returns the numbers of
+    customers and interactions deleted.
+    """
+    customers = interactions = 0
+    while True:
+        ids = [customer_id for (customer_id,) in db.session.query(Customer.id).filter(*filters)
+               .order_by(Customer.id).limit(chunk_size)]
+        if not ids:
+            break
+        try:
+            deleted = delete_customer_rows(ids)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        customers += deleted[0]
+        interactions += deleted[1]
+        if progress is not None:
+            progress(customers, interactions)
+        if len(ids) < chunk_size:
+            break
+    return customers, interactions
+
+def parse_purge_date(value):
+    """A created-before cutoff: an ISO date/datetime, or a number of days ago."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return datetime.utcnow() - td(days=value)
+    return datetime.fromisoformat(value)
+
+@app.route('/api/customers/bulk-delete', methods=['POST'])
+@jwt_required()
+def bulk_delete_customers():
+    """Delete customers by ``ids`` and/or ``stage``, ``created_by`` and ``created_before``.
+
+    ``created_before`` is an ISO date or a number of days ago. Reps can only
+    delete their own customers; at least one filter is required. With
+    ``dry_run`` the matching customers are counted but not deleted.
+    """
+    user = get_current_user()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Expected a JSON object'}), 400
+    ids = data.get('ids')
+    if ids is not None and (not isinstance(ids, list) or not all(
+            isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+        return jsonify({'message': 'ids must be a list of integers'}), 400
+    if ids is not None and len(ids) > BULK_DELETE_MAX_IDS:
+        return jsonify({'message': f'At most {BULK_DELETE_MAX_IDS} ids per request'}), 413
+    created_by = data.get('created_by')
+    if created_by is not None and not isinstance(created_by, int):
+        return jsonify({'message': 'created_by must be an integer'}), 400
+    try:
+        created_before = parse_purge_date(data['created_before']) if data.get('created_before') is not None else None
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({'message': 'created_before must be an ISO date or a number of days'}), 400
+    stage = data.get('stage')
+    if ids is None and stage is None and created_by is None and created_before is None:
+        return jsonify({'message': 'Give ids, stage, created_by or created_before'}), 400
+    if user.role != 'admin':
+        if created_by is not None and created_by != user.id:
+            return jsonify({'message': 'Permission denied'}), 403
+        created_by = user.id
+
+    filters = customer_purge_filters(ids, stage, created_by, created_before)
+    if data.get('dry_run'):
+        matched = db.session.query(db.func.count(Customer.id)).filter(*filters).scalar()
+        return jsonify({'matched_customers': matched}), 200
+    customers, interactions = purge_customers(filters)
+    return jsonify({'deleted_customers': customers, 'deleted_interactions': interactions}), 200
+
+@app.cli.command('purge-customers')
+@click.option('--ids', help='Comma-separated customer ids.')
+@click.option('--stage')
+@click.option('--created-by', type=int)
+@click.option('--older-than-days', type=int, help='Only customers created more than this many days ago.')
+@click.option('--chunk-size', default=BULK_DELETE_CHUNK_SIZE, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Only count the matching customers.')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def purge_customers_command(ids, stage, created_by, older_than_days, chunk_size, dry_run, yes):
+    """Delete customers matching all the given filters, with their interactions."""
+    try:
+        id_list = [int(i) for i in ids.split(',') if i.strip()] if ids else None
+    except ValueError:
+        raise click.BadParameter('must be comma-separated integers', param_hint='--ids')
+    created_before = parse_purge_date(older_than_days) if older_than_days is not None else None
+    if id_list is None and stage is None and created_by is None and created_before is None:
+        raise click.UsageError('Give at least one of --ids, --stage, --created-by, --older-than-days')
+
+    filters = customer_purge_filters(id_list, stage, created_by, created_before)
+    matched = db.session.query(db.func.count(Customer.id)).filter(*filters).scalar()
+    click.echo(f'{matched} customers match')
+    if dry_run or not matched:
+        return
+    if not yes:
+        click.confirm(f'Delete {matched} customers and their interactions?', abort=True)
+    started = time.perf_counter()
+    customers, interactions = purge_customers(
+        filters, chunk_size,
+        progress=lambda c, i: click.echo(f'  {c} customers, {i} interactions deleted')
+    )
+    click.echo(f'Deleted {customers} customers and {interactions} interactions '
+               f'in {time.perf_counter() - started:.1f}s')
+
 @app.route('/api/interactions', methods=['GET'])
 @jwt_required()
 def get_interactions():
     current_user_id = get_jwt_identity()
-    customer_id = request.args.get('customer_id')
+    customer_id = request.args.get('customer_id', type=int)
+    user = get_current_user()
     if customer_id:
-        interactions = Interaction.query.filter_by(customer_id=customer_id).all()
+        customer = db.session.get(Customer, customer_id)
+        if not customer:
+            return jsonify({'message': 'Customer not found'}), 404
+        if user.role != 'admin' and customer.created_by != current_user_id:
+            return jsonify({'message': 'Permission denied'}), 403
+        query = db.session.query(*INTERACTION_COLUMNS).filter(Interaction.customer_id == customer_id).order_by(
+            Interaction.timestamp.desc(), Interaction.id.desc())
+    elif user.role == 'admin':
+        query = db.session.query(*INTERACTION_COLUMNS)
     else:
-        user = User.query.get(current_user_id)
-        if user.role == 'admin':
-            interactions = Interaction.query.all()
-        else:
-            interactions = Interaction.query.filter_by(user_id=current_user_id).all()
-    result = []
-    for interaction in interactions:
-        result.append({
-            'id': interaction.id,
-            'customer_id': interaction.customer_id,
-            'user_id': interaction.user_id,
-            'type': interaction.type,
-            'note': interaction.note,
-            'timestamp': interaction.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
-    return jsonify(result), 200
+        query = db.session.query(*INTERACTION_COLUMNS).filter(Interaction.user_id == current_user_id)
+    return jsonify(records(INTERACTION_FIELDS, query)), 200
 
 @app.route('/api/interactions', methods=['POST'])
 @jwt_required()
@@ -401,9 +1683,11 @@ def create_interaction():
         customer_id=data['customer_id'],
         user_id=current_user_id,
         type=data.get('type', 'note'),
-        note=data.get('note', '')
+        note=data.get('note', ''),
+        timestamp=datetime.utcnow()
     )
     db.session.add(new_interaction)
+    bump_pipeline_rollup(current_user_id, day=new_interaction.timestamp.date(), interactions=1)
     db.session.commit()
     return jsonify({
         'id': new_interaction.id,
@@ -418,54 +1702,588 @@ def delete_interaction(id):
     if not interaction:
         return jsonify({'message': 'Interaction not found'}), 404
     
-    user = User.query.get(current_user_id)
+    user = get_current_user()
     if user.role != 'admin' and interaction.user_id != current_user_id:
         return jsonify({'message': 'Permission denied'}), 403
     
+    bump_pipeline_rollup(interaction.user_id, day=interaction.timestamp.date() if interaction.timestamp else None,
+                         interactions=-1)
     db.session.delete(interaction)
     db.session.commit()
     return jsonify({'message': 'Interaction deleted successfully'}), 200
 
+def clean_batch_operation(operation):
+    """Validate one operation of POST /api/batch; returns (kind, op, id, values).
+
+    Raises ValueError with a message for the per-operation result.
+    """
+    if not isinstance(operation, dict):
+        raise ValueError('Each operation must be an object')
+    kind, op = operation.get('type'), operation.get('op')
+    if (kind, op) not in BATCH_OPERATIONS:
+        raise ValueError('type must be customer or interaction and op one of create, update, delete')
+    data = operation.get('data') or {}
+    if not isinstance(data, dict):
+        raise ValueError('data must be an object')
+    target_id = operation.get('id')
+    if op != 'create' and (not isinstance(target_id, int) or isinstance(target_id, bool)):
+        raise ValueError('id must be an integer')
+
+    if op == 'delete':
+        return kind, op, target_id, {}
+    if kind == 'customer':
+        if op == 'create':
+            return kind, op, None, clean_customer(data)
+        # Only the given fields are validated and changed
+        values = clean_customer_update(data)
+    else:
+        if op == 'create':
+            return kind, op, None, clean_import_interaction(data)
+        cleaned = clean_interaction({'customer_id': 0, **data})
+        values = {field: cleaned[field] for field in INTERACTION_UPDATE_FIELDS if field in data}
+    if not values:
+        raise ValueError('data has no fields to update')
+    return kind, op, target_id, values
+
+@app.route('/api/batch', methods=['POST'])
+@jwt_required()
+def batch_mutations():
+    """Create, update and delete customers and interactions in one request.
+
+    The body is ``{"operations": [{"type": "customer", "op": "update",
+    "id": 1, "data": {"stage": "Closed"}}, ...]}``. Every operation is
+    validated and permission-checked before anything is written, with one
+    query per table for all the rows involved. If any operation fails,
+    nothing is applied and the response is 400; otherwise all of them are
+    applied in one transaction. Deleting a customer deletes its interactions,
+    so it cannot follow a create or update of one of them in the same batch.
+    ``results`` has one entry per operation, in order, with an HTTP-style
+    ``status`` and the row ``id`` or a ``message``.
+    """
+    user = get_current_user()
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'message': 'operations must be a non-empty list'}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({'message': f'At most {BATCH_MAX_OPERATIONS} operations per batch'}), 413
+
+    errors = {}
+    cleaned = []
+    for index, operation in enumerate(operations):
+        try:
+            cleaned.append(clean_batch_operation(operation))
+        except ValueError as e:
+            errors[index] = (400, str(e))
+            cleaned.append(None)
+
+    # Every row the batch touches, loaded up front
+    customer_ids, interaction_ids, owner_ids = set(), set(), set()
+    for item in cleaned:
+        if item is None:
+            continue
+        kind, op, target_id, values = item
+        if kind == 'customer' and op != 'create':
+            customer_ids.add(target_id)
+        elif kind == 'customer' and user.role == 'admin' and values['created_by'] is not None:
+            owner_ids.add(values['created_by'])
+        elif kind == 'interaction' and op == 'create':
+            customer_ids.add(values['customer_id'])
+        elif kind == 'interaction':
+            interaction_ids.add(target_id)
+    customers = {c.id: c for c in Customer.query.filter(Customer.id.in_(customer_ids))} if customer_ids else {}
+    interactions = {i.id: i for i in Interaction.query.filter(Interaction.id.in_(interaction_ids))} if interaction_ids else {}
+    known_owners = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(owner_ids))} if owner_ids else set()
+
+    def check(kind, op, target_id, values):
+        if kind == 'customer' and op == 'create':
+            if values['created_by'] is None or user.role != 'admin':
+                values['created_by'] = user.id
+            elif values['created_by'] not in known_owners:
+                return 400, 'created_by does not exist'
+            return None
+        if kind == 'interaction' and op == 'create':
+            customer = customers.get(values['customer_id'])
+            if customer is None or customer.id in deleted_customers:
+                return 404, 'Customer not found'
+            if user.role != 'admin' and customer.created_by != user.id:
+                return 403, 'Permission denied'
+            written_customers.add(customer.id)
+            return None
+        rows, deleted = (customers, deleted_customers) if kind == 'customer' else (interactions, deleted_interactions)
+        row = rows.get(target_id)
+        if row is None or target_id in deleted or (kind == 'interaction' and row.customer_id in deleted_customers):
+            return 404, f'{kind.capitalize()} not found'
+        owner_id = row.created_by if kind == 'customer' else row.user_id
+        if user.role != 'admin' and owner_id != user.id:
+            return 403, 'Permission denied'
+        if kind == 'customer' and op == 'delete' and target_id in written_customers:
+            # The cascade would delete rows this batch reports as written
+            return 409, 'Customer has interactions created or updated in this batch'
+        if op == 'delete':
+            deleted.add(target_id)
+        elif kind == 'interaction':
+            written_customers.add(row.customer_id)
+        return None
+
+    deleted_customers, deleted_interactions = set(), set()
+    # Customers with interactions created or updated by an earlier operation
+    written_customers = set()
+    for index, item in enumerate(cleaned):
+        if item is not None:
+            error = check(*item)
+            if error is not None:
+                errors[index] = error
+    if errors:
+        return jsonify({
+            'message': 'No operations were applied',
+            'results': [
+                {'status': errors[index][0], 'message': errors[index][1]} if index in errors
+                else {'status': 424, 'message': 'Not applied'}
+                for index in range(len(operations))
+            ]
+        }), 400
+
+    now = datetime.utcnow()
+    stage_deltas = {}
+    activity = Counter()
+    created = {}
+    transitions = []
+    for index, (kind, op, target_id, values) in enumerate(cleaned):
+        if kind == 'customer' and op == 'create':
+            customer = Customer(**values, created_at=now, stage_entered_at=now,
+                                furthest_stage=furthest_stage_after(None, values['stage']))
+            db.session.add(customer)
+            created[index] = customer
+            stage_deltas.setdefault(customer.created_by, Counter())[customer.stage] += 1
+            activity[customer.created_by, now.date(), 'customers_created'] += 1
+        elif kind == 'customer' and op == 'update':
+            customer = customers[target_id]
+            old_stage = customer.stage
+            transition = change_stage(customer, values.pop('stage', customer.stage), now)
+            if transition is not None:
+                stage_deltas.setdefault(customer.created_by, Counter()).update({old_stage: -1, customer.stage: 1})
+                transitions.append(transition)
+            for field, value in values.items():
+                setattr(customer, field, value)
+        elif op == 'create' and kind == 'interaction':
+            interaction = Interaction(**values, user_id=user.id)
+            interaction.timestamp = interaction.timestamp or now
+            db.session.add(interaction)
+            created[index] = interaction
+            activity[user.id, interaction.timestamp.date(), 'interactions'] += 1
+        elif op == 'update' and kind == 'interaction':
+            for field, value in values.items():
+                setattr(interactions[target_id], field, value)
+        elif kind == 'interaction':
+            interaction = interactions[target_id]
+            day = interaction.timestamp.date() if interaction.timestamp else None
+            activity[interaction.user_id, day, 'interactions'] -= 1
+
+    # Deletes as one statement per table instead of one per row
+    if deleted_interactions:
+        db.session.execute(db.delete(Interaction).where(Interaction.id.in_(deleted_interactions)))
+    bump_rollups(stage_deltas, activity)
+    db.session.flush()
+    record_stage_transitions([
+        new_customer_transition(customer.id, customer.created_by, customer.stage, now)
+        for customer in created.values() if isinstance(customer, Customer)
+    ] + transitions)
+    if deleted_customers:
+        delete_customer_rows(deleted_customers)
+    db.session.commit()
+
+    results = []
+    for index, (kind, op, target_id, values) in enumerate(cleaned):
+        if op == 'create':
+            results.append({'status': 201, 'id': created[index].id})
+        else:
+            results.append({'status': 200, 'id': target_id})
+    return jsonify({'results': results}), 200
+
+def parse_client_timestamp(value):
+    """Parse a fix timestamp sent by a client into a naive UTC datetime.
+
+    Accepts ISO 8601 strings (a trailing Z or any offset is converted to
+    UTC) and Unix epoch numbers in seconds or milliseconds.
+    """
+    if isinstance(value, bool):
+        raise ValueError('invalid timestamp')
+    if isinstance(value, (int, float)):
+        seconds = value / 1000 if value > 1e11 else value
+        return datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
+    if not isinstance(value, str):
+        raise ValueError('invalid timestamp')
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_location_fix(fix, user_id, now):
+    latitude = float(fix['latitude'])
+    longitude = float(fix['longitude'])
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('coordinates out of range')
+    timestamp = now
+    if fix.get('timestamp') is not None:
+        timestamp = parse_client_timestamp(fix['timestamp'])
+        if timestamp > now + LOCATION_MAX_CLOCK_SKEW:
+            raise ValueError('timestamp in the future')
+    return {'user_id': user_id, 'latitude': latitude, 'longitude': longitude, 'timestamp': timestamp}
+
+def write_locations(rows):
+    """Insert location rows with a single executemany and commit.
+
+    The user_latest_location projection is upserted in the same
+    transaction; a fix only replaces a user's latest one if it is newer.
+    Returns the fixes that did, for publish_locations().
+    """
+    db.session.execute(db.insert(Location), rows)
+    latest = {}
+    for row in rows:
+        current = latest.get(row['user_id'])
+        if current is None or row['timestamp'] >= current['timestamp']:
+            latest[row['user_id']] = row
+    won = upsert_latest_locations(list(latest.values()))
+    db.session.commit()
+    return won
+
+def publish_locations(rows):
+    """Push the given latest fixes to live location streams.
+
+    Called after the fixes are committed; a failure is logged and never
+    fails or repeats the write.
+    """
+    try:
+        events = []
+        for row in rows:
+            user = load_user(row['user_id'])
+            events.append({
+                'user_id': row['user_id'],
+                'name': user.name if user else None,
+                'latitude': float(row['latitude']),
+                'longitude': float(row['longitude']),
+                'timestamp': row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+            })
+        location_hub.publish(events)
+    except Exception:
+        app.logger.exception('Publishing %d live locations failed', len(rows))
+
+def upsert_latest_locations(rows):
+    """Upsert latest fixes; return those that replaced (or created) a user's row."""
+    table = UserLatestLocation.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={
+            'latitude': stmt.excluded.latitude,
+            'longitude': stmt.excluded.longitude,
+            'timestamp': stmt.excluded.timestamp
+        },
+        where=stmt.excluded.timestamp >= table.c.timestamp
+    ).returning(table.c.user_id, table.c.latitude, table.c.longitude, table.c.timestamp)
+    # A fix losing to a newer one already stored updates nothing and returns no row
+    return [row._asdict() for row in db.session.execute(stmt, [
+        {key: row[key] for key in ('user_id', 'latitude', 'longitude', 'timestamp')} for row in rows
+    ])]
+
+def latest_user_location(user_id):
+    """Return the user's most recent fix (a UserLatestLocation) or None."""
+    return db.session.get(UserLatestLocation, user_id)
+
+@app.cli.command('rebuild-latest-locations')
+def rebuild_latest_locations_command():
+    """Rebuild user_latest_location from the full locations history."""
+    latest = db.session.query(
+        Location.user_id,
+        db.func.max(Location.timestamp).label('max_timestamp')
+    ).group_by(Location.user_id).subquery('recent_locations')
+    rows = db.session.query(
+        Location.user_id, Location.latitude, Location.longitude, Location.timestamp
+    ).join(
+        latest,
+        db.and_(
+            Location.user_id == latest.c.user_id,
+            Location.timestamp == latest.c.max_timestamp
+        )
+    ).all()
+    # Ties on the latest timestamp would upsert the same user twice in one batch
+    latest_by_user = {row.user_id: row._asdict() for row in rows}
+    UserLatestLocation.query.delete()
+    if latest_by_user:
+        upsert_latest_locations(list(latest_by_user.values()))
+    db.session.commit()
+    click.echo(f"Rebuilt latest locations of {len(latest_by_user)} users")
+
+def flush_location_buffer(rows):
+    with app.app_context():
+        try:
+            won = write_locations(rows)
+        except Exception:
+            db.session.rollback()
+            raise
+        publish_locations(won)
+
+location_hub = Hub(
+    create_broker(LIVE_BROKER, LIVE_BROKER_URL),
+    max_subscribers=LIVE_MAX_SUBSCRIBERS,
+    max_pending=LIVE_MAX_PENDING
+)
+
+# Committed user changes, relayed to every process's user_cache
+user_invalidations = Broadcast(create_broker(LIVE_BROKER, LIVE_BROKER_URL, channel='crm_user_cache'), drop_cached_users)
+
+location_writer = BufferedWriter(
+    flush_location_buffer,
+    max_rows=LOCATION_BUFFER_SIZE,
+    max_delay=LOCATION_BUFFER_MAX_DELAY_MS / 1000
+)
+
 @app.route('/api/locations', methods=['POST'])
 @jwt_required()
 def update_location():
+    """Record one GPS fix, or a batch of them.
+
+    The body is either a single fix, a list of fixes or ``{"fixes": [...]}``;
+    each fix has latitude, longitude and an optional client timestamp.
+    With the location buffer enabled the fixes are written asynchronously
+    in bulk and the response is 202.
+    """
     current_user_id = get_jwt_identity()
     data = request.get_json()
-    new_location = Location(
-        user_id=current_user_id,
-        latitude=data['latitude'],
-        longitude=data['longitude']
-    )
-    db.session.add(new_location)
-    db.session.commit()
-    return jsonify({'message': 'Location updated successfully'}), 201
+    if isinstance(data, list):
+        fixes = data
+    elif isinstance(data, dict):
+        fixes = data['fixes'] if 'fixes' in data else [data]
+    else:
+        return jsonify({'message': 'Expected a location fix or a list of fixes'}), 400
+    if not isinstance(fixes, list) or not fixes:
+        return jsonify({'message': 'No location fixes given'}), 400
+    if len(fixes) > LOCATION_BATCH_MAX:
+        return jsonify({'message': f'At most {LOCATION_BATCH_MAX} fixes per request'}), 413
+
+    now = datetime.utcnow()
+    rows = []
+    for index, fix in enumerate(fixes):
+        try:
+            rows.append(parse_location_fix(fix, current_user_id, now))
+        except (KeyError, TypeError, ValueError, AttributeError, OverflowError, OSError) as e:
+            return jsonify({'message': f'Invalid location fix at index {index}: {e}'}), 400
+
+    if LOCATION_BUFFER_ENABLED:
+        location_writer.add(rows)
+        return jsonify({'message': 'Location updated successfully', 'count': len(rows)}), 202
+    publish_locations(write_locations(rows))
+    return jsonify({'message': 'Location updated successfully', 'count': len(rows)}), 201
+
+def latest_locations():
+    recent_locations = db.session.query(
+        UserLatestLocation.user_id,
+        User.name,
+        UserLatestLocation.latitude,
+        UserLatestLocation.longitude,
+        UserLatestLocation.timestamp
+    ).join(User, User.id == UserLatestLocation.user_id)
+    return records(('user_id', 'name', 'latitude', 'longitude', 'timestamp'), recent_locations)
 
 @app.route('/api/locations', methods=['GET'])
 @jwt_required()
 def get_locations():
+    return jsonify(latest_locations()), 200
+
+@app.route('/api/locations/stream-token', methods=['POST'])
+@jwt_required()
+def create_location_stream_token():
+    """A token for ``?token=`` on GET /api/locations/stream, so the access token stays out of URLs."""
+    token = create_access_token(
+        identity=get_jwt_identity(),
+        expires_delta=td(seconds=LIVE_STREAM_TOKEN_SECONDS),
+        additional_claims={'type': LOCATION_STREAM_TOKEN_TYPE}
+    )
+    return jsonify({'token': token, 'expires_in': LIVE_STREAM_TOKEN_SECONDS}), 201
+
+@app.route('/api/locations/stream', methods=['GET'])
+def stream_locations():
+    """Server-Sent Events with everyone's latest location.
+
+    A ``snapshot`` event carries the same list as GET /api/locations, then
+    ``locations`` events carry the users whose latest fix changed, newest
+    per user only. A client too slow to keep up gets a fresh snapshot
+    instead of a backlog. EventSource cannot send headers, so browsers pass
+    a token from POST /api/locations/stream-token as ``?token=``; other
+    clients may send their access token in the Authorization header. Streams
+    end after LIVE_STREAM_MAX_SECONDS; stream tokens expire quickly, so
+    clients reconnect with a fresh one.
+    """
+    stream_token = request.args.get('token')
+    if stream_token is None:
+        verify_jwt_in_request()
+    else:
+        try:
+            claims = decode_token(stream_token)
+        except (pyjwt.InvalidTokenError, JWTExtendedException):
+            claims = {}
+        if claims.get('type') != LOCATION_STREAM_TOKEN_TYPE:
+            return jsonify({'message': 'Invalid or expired stream token', 'error': 'invalid_token'}), 401
+
+    subscription = location_hub.subscribe()
+    if subscription is None:
+        return jsonify({'message': 'Too many live streams, poll GET /api/locations instead'}), 503
+
+    def snapshot():
+        # Subscribed first, so no update between this query and the stream is lost
+        data = serializers.dumps(latest_locations())
+        # Don't hold a pooled connection for the life of the stream
+        db.session.close()
+        return sse_event('snapshot', data)
+
+    def generate():
+        try:
+            yield b'retry: 3000\n\n' + snapshot()
+            deadline = time.monotonic() + LIVE_STREAM_MAX_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                events = subscription.get(min(LIVE_HEARTBEAT_SECONDS, remaining))
+                if subscription.overflowed:
+                    subscription.reset()
+                    yield snapshot()
+                elif events:
+                    yield sse_event('locations', serializers.dumps(events))
+                else:
+                    # Keeps proxies from timing out and notices closed connections
+                    yield b': keepalive\n\n'
+        finally:
+            subscription.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def track_points(track):
+    """Decode a LocationTrack into (latitude, longitude, timestamp) tuples."""
+    midnight = datetime.combine(track.day, datetime.min.time())
+    return [
+        (lat, lng, midnight + td(seconds=offset))
+        for (lat, lng), offset in zip(decode_polyline(track.polyline), decode_values(track.offsets))
+    ]
+
+def compact_location_day(user_id, day, tolerance_m=TRACK_TOLERANCE_M):
+    """Fold a user's raw locations of one UTC day into its LocationTrack.
+
+    Any existing track for the day is merged with the raw rows before
+    simplifying, so late fixes are not lost. The raw rows are deleted.
+    Returns the number of raw rows compacted; the caller commits.
+    """
+    midnight = datetime.combine(day, datetime.min.time())
+    in_day = (
+        Location.user_id == user_id,
+        Location.timestamp >= midnight,
+        Location.timestamp < midnight + td(days=1)
+    )
+    rows = db.session.query(Location.latitude, Location.longitude, Location.timestamp).filter(
+        *in_day
+    ).order_by(Location.timestamp).all()
+    points = [tuple(row) for row in rows]
+    raw_point_count = len(points)
+
+    track = db.session.get(LocationTrack, (user_id, day))
+    if track is None:
+        track = LocationTrack(user_id=user_id, day=day, raw_point_count=0)
+        db.session.add(track)
+    else:
+        points = sorted(track_points(track) + points, key=lambda point: point[2])
+
+    simplified = simplify(points, tolerance_m, TRACK_MIN_DISTANCE_M, TRACK_MIN_INTERVAL_S)
+    track.polyline = encode_polyline([(lat, lng) for lat, lng, _ in simplified])
+    track.offsets = encode_values([int((timestamp - midnight).total_seconds()) for _, _, timestamp in simplified])
+    track.point_count = len(simplified)
+    track.raw_point_count += raw_point_count
+    track.tolerance_m = tolerance_m
+    Location.query.filter(*in_day).delete(synchronize_session=False)
+    return raw_point_count
+
+def compact_locations(retention_days=LOCATION_RAW_RETENTION_DAYS, tolerance_m=TRACK_TOLERANCE_M):
+    """Compact every whole UTC day of raw locations older than retention_days.
+
+    Each (user, day) is committed separately so locks stay short.
+    Returns (days compacted, raw rows removed).
+    """
+    cutoff = datetime.combine((datetime.utcnow() - td(days=retention_days)).date(), datetime.min.time())
+    day = db.func.date(Location.timestamp)
+    pending = db.session.query(Location.user_id, day).filter(
+        Location.timestamp < cutoff
+    ).distinct().all()
+    removed = 0
+    for user_id, track_day in pending:
+        removed += compact_location_day(user_id, sql_date(track_day), tolerance_m)
+        db.session.commit()
+    return len(pending), removed
+
+@app.cli.command('compact-locations')
+@click.option('--retention-days', default=LOCATION_RAW_RETENTION_DAYS, show_default=True,
+              help='Keep raw fixes for this many days; older days are compacted.')
+@click.option('--tolerance-m', default=TRACK_TOLERANCE_M, show_default=True,
+              help='Douglas-Peucker tolerance in metres.')
+def compact_locations_command(retention_days, tolerance_m):
+    """Roll old raw locations into simplified per-day tracks."""
+    days, removed = compact_locations(retention_days, tolerance_m)
+    click.echo(f"Compacted {removed} raw locations into {days} daily tracks")
+
+@app.route('/api/locations/<int:user_id>/track', methods=['GET'])
+@jwt_required()
+def get_location_track(user_id):
+    """Return a user's simplified track between ``start`` and ``end``.
+
+    Days past the retention window come from the compacted tracks, newer
+    ones from the raw fixes; the combined track is simplified to
+    ``tolerance_m`` metres (default TRACK_TOLERANCE_M).
+    """
     current_user_id = get_jwt_identity()
-    subquery = db.session.query(
-        Location.user_id,
-        db.func.max(Location.timestamp).label('max_timestamp')
-    ).group_by(Location.user_id).subquery('recent_locations')
-    recent_locations = db.session.query(Location).join(
-        subquery,
-        db.and_(
-            Location.user_id == subquery.c.user_id,
-            Location.timestamp == subquery.c.max_timestamp
-        )
-    ).all()
-    result = []
-    for location in recent_locations:
-        user = User.query.get(location.user_id)
-        result.append({
-            'user_id': location.user_id,
-            'name': user.name,
-            'latitude': location.latitude,
-            'longitude': location.longitude,
-            'timestamp': location.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
-    return jsonify(result), 200
+    user = get_current_user()
+    if user.role != 'admin' and user_id != current_user_id:
+        return jsonify({'message': 'Permission denied'}), 403
+
+    try:
+        end = parse_client_timestamp(request.args['end']) if request.args.get('end') else datetime.utcnow()
+        start = parse_client_timestamp(request.args['start']) if request.args.get('start') else end - td(days=1)
+        tolerance_m = float(request.args.get('tolerance_m', TRACK_TOLERANCE_M))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return jsonify({'message': 'Invalid start, end or tolerance_m'}), 400
+    if start > end or end - start > td(days=TRACK_MAX_RANGE_DAYS):
+        return jsonify({'message': f'start must precede end by at most {TRACK_MAX_RANGE_DAYS} days'}), 400
+
+    points = []
+    for track in LocationTrack.query.filter(
+        LocationTrack.user_id == user_id,
+        LocationTrack.day >= start.date(),
+        LocationTrack.day <= end.date()
+    ):
+        points.extend(point for point in track_points(track) if start <= point[2] <= end)
+    points.extend(tuple(row) for row in db.session.query(
+        Location.latitude, Location.longitude, Location.timestamp
+    ).filter(
+        Location.user_id == user_id,
+        Location.timestamp >= start,
+        Location.timestamp <= end
+    ))
+    points.sort(key=lambda point: point[2])
+    points = simplify(points, max(tolerance_m, 0))
+
+    return jsonify({
+        'user_id': user_id,
+        'start': start,
+        'end': end,
+        'tolerance_m': tolerance_m,
+        'points': records(('latitude', 'longitude', 'timestamp'), points)
+    }), 200
+
+def travel_minutes(distance_km):
+    return distance_km / AVERAGE_SPEED_KMH * 60
 
 @app.route('/api/distance', methods=['POST'])
 @jwt_required()
@@ -473,19 +2291,68 @@ def calculate_distance():
     data = request.get_json()
     point1 = (data['lat1'], data['lng1'])
     point2 = (data['lat2'], data['lng2'])
-    distance_km = geodesic(point1, point2).kilometers
-    distance_mi = geodesic(point1, point2).miles
-    
-    # Calculate estimated travel time (assuming average speed of 50 km/h)
-    estimated_time_hours = distance_km / 50
-    estimated_time_minutes = estimated_time_hours * 60
-    
+    distance_km = float(geodesic_matrix_km([point1], [point2], cache=distance_cache)[0, 0])
+    distance_mi = distance_km / KM_PER_MILE
+    estimated_time_minutes = travel_minutes(distance_km)
+
     return jsonify({
         'distance_km': round(distance_km, 2),
         'distance_mi': round(distance_mi, 2),
         'estimated_time_minutes': round(estimated_time_minutes, 0),
         'estimated_time_text': f"{int(estimated_time_minutes // 60)}h {int(estimated_time_minutes % 60)}m" if estimated_time_minutes >= 60 else f"{int(estimated_time_minutes)}m"
-    }), 200 
+    }), 200
+
+def parse_points(value, name):
+    """Parse a list of {"lat", "lng"} objects or [lat, lng] pairs."""
+    if not isinstance(value, list) or not value:
+        raise ValueError(f'{name} must be a non-empty list of points')
+    points = []
+    for point in value:
+        try:
+            lat, lng = (point['lat'], point['lng']) if isinstance(point, dict) else point
+            lat, lng = float(lat), float(lng)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'{name} must contain {{"lat", "lng"}} objects or [lat, lng] pairs')
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError(f'{name} contains coordinates out of range')
+        points.append((lat, lng))
+    return points
+
+@app.route('/api/distance-matrix', methods=['POST'])
+@jwt_required()
+def distance_matrix():
+    """Distances and travel times from every origin to every destination.
+
+    ``mode`` is ``haversine`` (default; great-circle, computed in one
+    vectorised pass) or ``geodesic`` (exact on the WGS-84 ellipsoid, with
+    recent pairs cached). ``destinations`` defaults to ``origins``.
+    """
+    data = request.get_json() or {}
+    mode = data.get('mode', 'haversine')
+    if mode not in ('haversine', 'geodesic'):
+        return jsonify({'message': 'mode must be haversine or geodesic'}), 400
+    try:
+        origins = parse_points(data.get('origins'), 'origins')
+        destinations = parse_points(data['destinations'], 'destinations') if 'destinations' in data else origins
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    max_cells = GEODESIC_MATRIX_MAX_CELLS if mode == 'geodesic' else DISTANCE_MATRIX_MAX_CELLS
+    if len(origins) * len(destinations) > max_cells:
+        return jsonify({'message': f'At most {max_cells} origin/destination pairs per {mode} request'}), 400
+
+    if mode == 'geodesic':
+        distances = geodesic_matrix_km(origins, destinations, cache=distance_cache)
+    else:
+        distances = haversine_matrix_km(
+            [lat for lat, _ in origins], [lng for _, lng in origins],
+            [lat for lat, _ in destinations], [lng for _, lng in destinations]
+        )
+    return jsonify({
+        'mode': mode,
+        'distances_km': distances.round(3).tolist(),
+        'durations_minutes': travel_minutes(distances).round(0).tolist()
+    }), 200
+
 @app.route('/api/route-planning', methods=['POST'])
 @jwt_required()
 def route_planning():
@@ -493,7 +2360,7 @@ def route_planning():
     data = request.get_json()
     
     # Get user's current location
-    user_location = Location.query.filter_by(user_id=current_user_id).order_by(Location.timestamp.desc()).first()
+    user_location = latest_user_location(current_user_id)
     if not user_location:
         return jsonify({'message': 'User location not available'}), 400
     
@@ -501,119 +2368,723 @@ def route_planning():
     customer_ids = data.get('customer_ids', [])
     if not customer_ids:
         return jsonify({'message': 'No customers selected'}), 400
+    return_to_start = bool(data.get('return_to_start', False))
+    try:
+        time_budget_ms = min(int(data.get('time_budget_ms', ROUTE_TIME_BUDGET_MS)), ROUTE_TIME_BUDGET_MS_MAX)
+    except (TypeError, ValueError):
+        return jsonify({'message': 'time_budget_ms must be an integer'}), 400
     
-    customers = Customer.query.filter(Customer.id.in_(customer_ids)).all()
+    # Keep the order the stops were requested in; it is the naive route
+    customers_by_id = {
+        customer.id: customer
+        for customer in Customer.query.filter(Customer.id.in_(customer_ids))
+        if customer.lat is not None and customer.lng is not None
+    }
+    stops = [customers_by_id[customer_id] for customer_id in dict.fromkeys(customer_ids) if customer_id in customers_by_id]
     
-    # Calculate distances and create route
-    route_data = []
-    total_distance = 0
-    current_lat, current_lng = user_location.latitude, user_location.longitude
+    plan = plan_route(
+        [user_location.latitude] + [customer.lat for customer in stops],
+        [user_location.longitude] + [customer.lng for customer in stops],
+        return_to_start=return_to_start,
+        time_budget=max(time_budget_ms, 0) / 1000
+    )
     
-    for customer in customers:
-        if customer.lat and customer.lng:
-            distance_km = geodesic((current_lat, current_lng), (customer.lat, customer.lng)).kilometers
-            estimated_time = distance_km / 50 * 60  # minutes
-            
-            route_data.append({
-                'customer_id': customer.id,
-                'customer_name': customer.name,
-                'customer_company': customer.company,
-                'lat': customer.lat,
-                'lng': customer.lng,
-                'distance_from_previous': round(distance_km, 2),
-                'estimated_time_minutes': round(estimated_time, 0)
-            })
-            
-            total_distance += distance_km
-            current_lat, current_lng = customer.lat, customer.lng
+    route_data = []
+    for node, distance_km in zip(plan['order'], plan['legs_km']):
+        customer = stops[node - 1]
+        route_data.append({
+            'customer_id': customer.id,
+            'customer_name': customer.name,
+            'customer_company': customer.company,
+            'lat': customer.lat,
+            'lng': customer.lng,
+            'distance_from_previous': round(distance_km, 2),
+            'estimated_time_minutes': round(travel_minutes(distance_km), 0)
+        })
     
-    return jsonify({
+    total_distance = plan['distance_km']
+    naive_distance = plan['naive_distance_km']
+    result = {
         'route': route_data,
         'total_distance_km': round(total_distance, 2),
-        'total_estimated_time_minutes': round(sum(item['estimated_time_minutes'] for item in route_data), 0),
+        'total_estimated_time_minutes': round(travel_minutes(total_distance), 0),
+        'naive_distance_km': round(naive_distance, 2),
+        'improvement_percent': round((naive_distance - total_distance) / naive_distance * 100, 1) if naive_distance else 0,
         'starting_location': {
             'lat': user_location.latitude,
             'lng': user_location.longitude
         }
-    }), 200
+    }
+    if return_to_start and stops:
+        result['return_distance_km'] = round(plan['legs_km'][-1], 2)
+    return jsonify(result), 200
+
+def sql_date(value):
+    """Normalise a func.date() result, which comes back as a string on SQLite."""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def dialect_insert(table):
+    """INSERT for the session's database that supports ON CONFLICT (PostgreSQL or SQLite)."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return postgresql_insert(table)
+    return sqlite_insert(table)
+
+def _upsert_add(model, keys, deltas):
+    """Add ``deltas`` to the row of ``model`` identified by ``keys``, creating it if needed.
+
+    Runs as a single INSERT ... ON CONFLICT DO UPDATE inside the current
+    session transaction, so concurrent writers never lose increments.
+    """
+    table = model.__table__
+    stmt = dialect_insert(table).values(**keys, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: table.c[column] + delta for column, delta in deltas.items()}
+    )
+    db.session.execute(stmt)
+
+def bump_pipeline_rollup(user_id, day=None, stage_deltas=None, interactions=0, customers_created=0):
+    """Apply a customer/interaction write to the rollups of ``user_id`` and the global scope.
+
+    ``stage_deltas`` maps stage names to +/- customer counts. ``day`` is the
+    activity bucket that ``customers_created``/``interactions`` fall into.
+    """
+    pipeline_deltas = {}
+    for stage, delta in (stage_deltas or {}).items():
+        column = STAGE_ROLLUP_COLUMNS.get(stage, 'other_customers')
+        pipeline_deltas[column] = pipeline_deltas.get(column, 0) + delta
+    if interactions:
+        pipeline_deltas['total_interactions'] = interactions
+    pipeline_deltas = {column: delta for column, delta in pipeline_deltas.items() if delta}
+    activity_deltas = {
+        column: delta
+        for column, delta in (('customers_created', customers_created), ('interactions', interactions))
+        if delta
+    }
+    for scope in (user_id, GLOBAL_ROLLUP_USER_ID):
+        if pipeline_deltas:
+            _upsert_add(PipelineRollup, {'user_id': scope}, pipeline_deltas)
+        if activity_deltas and day is not None:
+            _upsert_add(ActivityRollup, {'user_id': scope, 'day': day}, activity_deltas)
+
+def bump_rollups(stage_deltas, activity):
+    """Apply aggregated deltas of a multi-row write with one bump per user and day.
+
+    ``stage_deltas`` maps user ids to Counters of stage deltas; ``activity``
+    is a Counter keyed by (user_id, day, 'customers_created' or 'interactions').
+    """
+    for owner_id, stages in stage_deltas.items():
+        bump_pipeline_rollup(owner_id, stage_deltas=stages)
+    by_day = {}
+    for (owner_id, day, column), delta in activity.items():
+        by_day.setdefault((owner_id, day), {})[column] = delta
+    for (owner_id, day), deltas in by_day.items():
+        bump_pipeline_rollup(owner_id, day=day, **deltas)
+
+def new_customer_transition(customer_id, owner_id, stage, created_at):
+    """The transition recording the stage a customer was created in."""
+    return {
+        'customer_id': customer_id,
+        'user_id': owner_id,
+        'from_stage': None,
+        'to_stage': stage,
+        'entered_at': created_at,
+        'from_stage_seconds': None,
+        'customer_created_at': created_at,
+        'previous_furthest_stage': None
+    }
+
+def furthest_stage_after(furthest, stage):
+    reached = funnel.newly_reached(furthest, stage)
+    return reached[-1] if reached else furthest
+
+def change_stage(customer, stage, at):
+    """Move ``customer`` to ``stage``; return the transition to record, or None if unchanged."""
+    if stage == customer.stage:
+        return None
+    since = customer.stage_entered_at or customer.created_at
+    transition = {
+        'customer_id': customer.id,
+        'user_id': customer.created_by,
+        'from_stage': customer.stage,
+        'to_stage': stage,
+        'entered_at': at,
+        'from_stage_seconds': max(int((at - since).total_seconds()), 0) if since else None,
+        'customer_created_at': customer.created_at,
+        'previous_furthest_stage': customer.furthest_stage
+    }
+    customer.stage = stage
+    customer.stage_entered_at = at
+    customer.furthest_stage = furthest_stage_after(customer.furthest_stage, stage)
+    return transition
+
+def funnel_rollup_deltas(transitions):
+    """Sum the funnel rollup deltas of ``transitions``.
+
+    Returns {(model, ((column, value), ...)): Counter of column deltas},
+    the key columns including user_id for both the user and global scope.
+    """
+    deltas = {}
+
+    def add(model, user_id, keys, **values):
+        for scope in (user_id, GLOBAL_ROLLUP_USER_ID):
+            deltas.setdefault((model, (('user_id', scope),) + keys), Counter()).update(values)
+
+    for transition in transitions:
+        user_id, entered_at = transition['user_id'], transition['entered_at']
+        period = funnel.month_start(entered_at)
+        seconds = transition['from_stage_seconds']
+        if transition['from_stage'] is not None:
+            from_stage = funnel.stage_key(transition['from_stage'])
+            add(StageTransitionRollup, user_id,
+                (('period', period), ('from_stage', from_stage), ('to_stage', funnel.stage_key(transition['to_stage']))),
+                transitions=1, seconds_in_from_stage=seconds or 0)
+            if seconds is not None:
+                add(StageDurationRollup, user_id,
+                    (('period', period), ('stage', from_stage), ('bucket', funnel.duration_bucket(seconds))),
+                    customers=1)
+        created_at = transition['customer_created_at']
+        if created_at is None:
+            continue
+        seconds_to_reach = max(int((entered_at - created_at).total_seconds()), 0)
+        for stage in funnel.newly_reached(transition['previous_furthest_stage'], transition['to_stage']):
+            add(CohortFunnelRollup, user_id,
+                (('cohort', funnel.month_start(created_at)), ('stage', stage)),
+                customers=1, seconds_to_reach=seconds_to_reach)
+    return deltas
+
+def record_stage_transitions(transitions):
+    """Append ``transitions`` to the log and fold them into the funnel rollups.
+
+    Each is a dict as built by new_customer_transition() or change_stage().
+    Runs in the current transaction, with one upsert per rollup row touched.
+    """
+    if not transitions:
+        return
+    db.session.execute(db.insert(StageTransition), [
+        {key: value for key, value in transition.items() if key != 'previous_furthest_stage'}
+        for transition in transitions
+    ])
+    for (model, keys), values in funnel_rollup_deltas(transitions).items():
+        _upsert_add(model, dict(keys), dict(values))
+
+def rebuild_funnel_rollups():
+    """Recompute the funnel rollups from the stage_transitions log.
+
+    Customers without any transition yet (created before the log existed)
+    first get one for the stage they are in, dated at their creation.
+    Returns the number of transitions logged and of rollup rows written.
+    """
+    logged = db.select(StageTransition.id).where(StageTransition.customer_id == Customer.id)
+    db.session.execute(db.insert(StageTransition).from_select(
+        ['customer_id', 'user_id', 'to_stage', 'entered_at', 'customer_created_at'],
+        db.select(Customer.id, Customer.created_by, Customer.stage,
+                  db.func.coalesce(Customer.created_at, db.func.current_timestamp()), Customer.created_at)
+        .where(~logged.exists())
+    ))
+    for model in (StageTransitionRollup, StageDurationRollup, CohortFunnelRollup):
+        model.query.delete()
+
+    def transitions():
+        customer_id = furthest = None
+        rows = db.session.query(
+            StageTransition.customer_id, StageTransition.user_id, StageTransition.from_stage,
+            StageTransition.to_stage, StageTransition.entered_at, StageTransition.from_stage_seconds,
+            StageTransition.customer_created_at
+        ).order_by(StageTransition.customer_id, StageTransition.entered_at, StageTransition.id)
+        for row in rows.yield_per(SEED_CHUNK_SIZE):
+            if row.customer_id != customer_id:
+                customer_id, furthest = row.customer_id, None
+            transition = row._asdict()
+            transition['previous_furthest_stage'] = furthest
+            furthest = furthest_stage_after(furthest, row.to_stage)
+            yield transition
+
+    by_model = {}
+    for (model, keys), values in funnel_rollup_deltas(transitions()).items():
+        by_model.setdefault(model, []).append({**dict(keys), **values})
+    for model, rows in by_model.items():
+        db.session.bulk_insert_mappings(model, rows)
+    db.session.commit()
+    return db.session.query(db.func.count(StageTransition.id)).scalar(), sum(len(rows) for rows in by_model.values())
+
+@app.cli.command('rebuild-funnels')
+def rebuild_funnels_command():
+    """Log the current stage of customers missing from stage_transitions and rebuild the funnel rollups."""
+    transitions, rows = rebuild_funnel_rollups()
+    click.echo(f"Folded {transitions} stage transitions into {rows} funnel rollup rows")
+
+def rebuild_pipeline_rollups():
+    """Recompute every rollup row from the customers and interactions tables."""
+    ActivityRollup.query.delete()
+    PipelineRollup.query.delete()
+
+    pipeline = {}
+    activity = {}
+
+    def add(rows, keys, values):
+        for key in keys:
+            row = rows.setdefault(key, {})
+            for column, value in values.items():
+                row[column] = row.get(column, 0) + value
+
+    for created_by, stage, count in db.session.query(
+        Customer.created_by, Customer.stage, db.func.count(Customer.id)
+    ).group_by(Customer.created_by, Customer.stage):
+        column = STAGE_ROLLUP_COLUMNS.get(stage, 'other_customers')
+        add(pipeline, (created_by, GLOBAL_ROLLUP_USER_ID), {column: count})
+    for user_id, count in db.session.query(
+        Interaction.user_id, db.func.count(Interaction.id)
+    ).group_by(Interaction.user_id):
+        add(pipeline, (user_id, GLOBAL_ROLLUP_USER_ID), {'total_interactions': count})
+
+    customer_day = db.func.date(Customer.created_at)
+    for created_by, day, count in db.session.query(
+        Customer.created_by, customer_day, db.func.count(Customer.id)
+    ).filter(Customer.created_at.isnot(None)).group_by(Customer.created_by, customer_day):
+        day = sql_date(day)
+        add(activity, ((created_by, day), (GLOBAL_ROLLUP_USER_ID, day)), {'customers_created': count})
+    interaction_day = db.func.date(Interaction.timestamp)
+    for user_id, day, count in db.session.query(
+        Interaction.user_id, interaction_day, db.func.count(Interaction.id)
+    ).filter(Interaction.timestamp.isnot(None)).group_by(Interaction.user_id, interaction_day):
+        day = sql_date(day)
+        add(activity, ((user_id, day), (GLOBAL_ROLLUP_USER_ID, day)), {'interactions': count})
+
+    db.session.bulk_insert_mappings(PipelineRollup, [
+        {'user_id': user_id, **values} for user_id, values in pipeline.items()
+    ])
+    db.session.bulk_insert_mappings(ActivityRollup, [
+        {'user_id': user_id, 'day': day, **values} for (user_id, day), values in activity.items()
+    ])
+    db.session.commit()
+    return len(pipeline), len(activity)
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Rebuild the dashboard rollup tables from scratch."""
+    pipeline_rows, activity_rows = rebuild_pipeline_rollups()
+    click.echo(f"Rebuilt {pipeline_rows} pipeline rollups and {activity_rows} activity buckets")
+
+def query_pipeline_counts(user_id=None):
+    """Compute the dashboard and analytics counters in a single SELECT.
+
+    Customer counts are conditional aggregates over the customers table and
+    interaction counts come from scalar subqueries, so the whole result is one
+    row regardless of table size. ``user_id`` of None means the admin scope.
+    """
+    now = datetime.utcnow()
+    thirty_days_ago = now - td(days=30)
+    seven_days_ago = now - td(days=7)
+
+    def count_where(condition):
+        return db.func.count(db.case((condition, 1)))
+
+    interaction_filter = [Interaction.user_id == user_id] if user_id is not None else []
+    total_interactions = db.select(db.func.count(Interaction.id)).where(
+        *interaction_filter
+    ).scalar_subquery()
+    recent_interactions = db.select(db.func.count(Interaction.id)).where(
+        Interaction.timestamp >= seven_days_ago, *interaction_filter
+    ).scalar_subquery()
+
+    query = db.session.query(
+        db.func.count(Customer.id).label('total_customers'),
+        count_where(Customer.stage == 'New').label('new_customers'),
+        count_where(Customer.stage == 'Contacted').label('contacted_customers'),
+        count_where(Customer.stage == 'Proposal').label('proposal_customers'),
+        count_where(Customer.stage == 'Closed').label('closed_customers'),
+        count_where(Customer.created_at >= thirty_days_ago).label('recent_customers'),
+        total_interactions.label('total_interactions'),
+        recent_interactions.label('recent_interactions')
+    ).select_from(Customer)
+    if user_id is not None:
+        query = query.filter(Customer.created_by == user_id)
+    return query.one()._asdict()
+
+def read_pipeline_counts(user_id=None, with_recent=False):
+    """Return the counters of query_pipeline_counts() from the rollup tables.
+
+    The stage and interaction totals are a primary-key lookup; the recency
+    counters (``with_recent``) sum at most 30 daily activity buckets, so
+    they are day-granular. Scopes without a rollup row yet (e.g. before the
+    first ``flask rebuild-rollups``) fall back to the live aggregate.
+    """
+    scope = GLOBAL_ROLLUP_USER_ID if user_id is None else user_id
+    rollup = db.session.get(PipelineRollup, scope)
+    if rollup is None:
+        return query_pipeline_counts(user_id)
+
+    counts = {column: getattr(rollup, column) for column in STAGE_ROLLUP_COLUMNS.values()}
+    counts['total_customers'] = sum(counts.values()) + rollup.other_customers
+    counts['total_interactions'] = rollup.total_interactions
+    if with_recent:
+        today = datetime.utcnow().date()
+        month_start = today - td(days=30)
+        week_start = today - td(days=7)
+        recent = db.session.query(
+            db.func.coalesce(db.func.sum(ActivityRollup.customers_created), 0),
+            db.func.coalesce(db.func.sum(db.case(
+                (ActivityRollup.day >= week_start, ActivityRollup.interactions), else_=0
+            )), 0)
+        ).filter(ActivityRollup.user_id == scope, ActivityRollup.day >= month_start).one()
+        counts['recent_customers'], counts['recent_interactions'] = recent
+    return counts
 
 @app.route('/api/customer-analytics', methods=['GET'])
 @jwt_required()
 def customer_analytics():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role == 'admin':
-        customers = Customer.query.all()
-        interactions = Interaction.query.all()
-    else:
-        customers = Customer.query.filter_by(created_by=current_user_id).all()
-        interactions = Interaction.query.filter_by(user_id=current_user_id).all()
-    
-    # Get customers created in the last 30 days
-    thirty_days_ago = datetime.utcnow() - td(days=30)
-    recent_customers = [c for c in customers if c.created_at >= thirty_days_ago]
-    
-    # Get interactions in the last 7 days
-    seven_days_ago = datetime.utcnow() - td(days=7)
-    recent_interactions = [i for i in interactions if i.timestamp >= seven_days_ago]
-    
-    # Calculate conversion rate
-    closed_customers = [c for c in customers if c.stage == 'Closed']
-    conversion_rate = (len(closed_customers) / len(customers) * 100) if customers else 0
-    
+    user = get_current_user()
+    counts = read_pipeline_counts(None if user.role == 'admin' else current_user_id, with_recent=True)
+
+    total_customers = counts['total_customers']
+    conversion_rate = (counts['closed_customers'] / total_customers * 100) if total_customers else 0
+    closed, seconds_to_close = db.session.query(
+        db.func.sum(CohortFunnelRollup.customers), db.func.sum(CohortFunnelRollup.seconds_to_reach)
+    ).filter(
+        CohortFunnelRollup.user_id == (GLOBAL_ROLLUP_USER_ID if user.role == 'admin' else current_user_id),
+        CohortFunnelRollup.stage == 'Closed'
+    ).one()
+
     return jsonify({
-        'recent_customers_count': len(recent_customers),
-        'recent_interactions_count': len(recent_interactions),
+        'recent_customers_count': counts['recent_customers'],
+        'recent_interactions_count': counts['recent_interactions'],
         'conversion_rate': round(conversion_rate, 1),
-        'avg_interactions_per_customer': round(len(interactions) / len(customers), 1) if customers else 0
+        'avg_interactions_per_customer': round(counts['total_interactions'] / total_customers, 1) if total_customers else 0,
+        'avg_days_to_close': round(seconds_to_close / closed / 86400, 1) if closed else None
     }), 200
 
-@app.route('/api/dashboard', methods=['GET'])
+def percent(part, whole):
+    return round(part / whole * 100, 1) if whole else None
+
+def days(seconds):
+    return round(seconds / 86400, 1) if seconds is not None else None
+
+@app.route('/api/analytics/funnel', methods=['GET'])
 @jwt_required()
-def dashboard():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+def funnel_analytics():
+    """Conversion rates, time in stage and cohort funnels, read from the funnel rollups.
 
+    Covers the last ``months`` calendar months (default FUNNEL_MONTHS), the
+    current one included. Conversion is over the customers created in that
+    window; time in stage is over the stays that ended in it, so customers
+    still in a stage do not count yet. Admins see everyone, or one rep with
+    ``user_id``.
+    """
+    user = get_current_user()
+    try:
+        months = min(max(int(request.args.get('months', FUNNEL_MONTHS)), 1), FUNNEL_MONTHS_MAX)
+    except ValueError:
+        return jsonify({'message': 'months must be an integer'}), 400
+    scope = user.id
     if user.role == 'admin':
-        customers = Customer.query.all()
-        interactions = Interaction.query.all()
-    else:
-        customers = Customer.query.filter_by(created_by=current_user_id).all()
-        interactions = Interaction.query.filter_by(user_id=current_user_id).all()
+        scope = request.args.get('user_id', GLOBAL_ROLLUP_USER_ID, type=int)
+    start = funnel.add_months(funnel.month_start(datetime.utcnow()), 1 - months)
+
+    cohorts = {}
+    reached = Counter()
+    seconds_to_reach = Counter()
+    for cohort, stage, customers, seconds in db.session.query(
+        CohortFunnelRollup.cohort, CohortFunnelRollup.stage,
+        CohortFunnelRollup.customers, CohortFunnelRollup.seconds_to_reach
+    ).filter(CohortFunnelRollup.user_id == scope, CohortFunnelRollup.cohort >= start):
+        cohorts.setdefault(cohort, {})[stage] = customers
+        reached[stage] += customers
+        seconds_to_reach[stage] += seconds
+    created = reached[CUSTOMER_STAGES[0]]
+    conversion = []
+    for rank, stage in enumerate(CUSTOMER_STAGES):
+        conversion.append({
+            'stage': stage,
+            'customers': reached[stage],
+            'rate': percent(reached[stage], created),
+            'rate_from_previous': percent(reached[stage], reached[CUSTOMER_STAGES[rank - 1]]) if rank else None,
+            'avg_days_to_reach': days(seconds_to_reach[stage] / reached[stage]) if reached[stage] else None
+        })
+
+    histograms = {}
+    for stage, bucket, customers in db.session.query(
+        StageDurationRollup.stage, StageDurationRollup.bucket, db.func.sum(StageDurationRollup.customers)
+    ).filter(StageDurationRollup.user_id == scope, StageDurationRollup.period >= start).group_by(
+        StageDurationRollup.stage, StageDurationRollup.bucket
+    ):
+        histograms.setdefault(stage, {})[bucket] = customers
+    transitions = []
+    stays = {}
+    for period, from_stage, to_stage, count, seconds in db.session.query(
+        StageTransitionRollup.period, StageTransitionRollup.from_stage, StageTransitionRollup.to_stage,
+        StageTransitionRollup.transitions, StageTransitionRollup.seconds_in_from_stage
+    ).filter(StageTransitionRollup.user_id == scope, StageTransitionRollup.period >= start).order_by(
+        StageTransitionRollup.period
+    ):
+        transitions.append({'period': period.strftime('%Y-%m'), 'from_stage': from_stage,
+                            'to_stage': to_stage, 'customers': count})
+        exits, total = stays.get(from_stage, (0, 0))
+        stays[from_stage] = (exits + count, total + seconds)
+    time_in_stage = []
+    for stage in CUSTOMER_STAGES + (funnel.OTHER_STAGE,):
+        if stage not in stays:
+            continue
+        exits, total = stays[stage]
+        histogram = histograms.get(stage, {})
+        time_in_stage.append({
+            'stage': stage,
+            'exits': exits,
+            'avg_days': days(total / exits),
+            'median_days': days(funnel.histogram_quantile(histogram, 0.5)),
+            'p90_days': days(funnel.histogram_quantile(histogram, 0.9))
+        })
+
+    return jsonify({
+        'start': start,
+        'months': months,
+        'conversion': conversion,
+        'time_in_stage': time_in_stage,
+        'transitions': transitions,
+        'cohorts': [
+            {
+                'cohort': cohort.strftime('%Y-%m'),
+                'customers': stages.get(CUSTOMER_STAGES[0], 0),
+                'reached': {stage: stages.get(stage, 0) for stage in CUSTOMER_STAGES}
+            }
+            for cohort, stages in sorted(cohorts.items())
+        ]
+    }), 200
 
-    total_customers = len(customers)
-    total_interactions = len(interactions)
-    new_customers = sum(1 for c in customers if c.stage == 'New')
-    contacted_customers = sum(1 for c in customers if c.stage == 'Contacted')
-    proposal_customers = sum(1 for c in customers if c.stage == 'Proposal')
-    closed_customers = sum(1 for c in customers if c.stage == 'Closed')
+@app.route('/api/dashboard', methods=['GET'])
+@jwt_required()
+def dashboard():
+    current_user_id = get_jwt_identity()
+    user = get_current_user()
+    counts = read_pipeline_counts(None if user.role == 'admin' else current_user_id)
 
     return jsonify({
-        'total_customers': total_customers,
-        'total_interactions': total_interactions,
-        'new_customers': new_customers,
-        'contacted_customers': contacted_customers,
-        'proposal_customers': proposal_customers,
-        'closed_customers': closed_customers
+        'total_customers': counts['total_customers'],
+        'total_interactions': counts['total_interactions'],
+        'new_customers': counts['new_customers'],
+        'contacted_customers': counts['contacted_customers'],
+        'proposal_customers': counts['proposal_customers'],
+        'closed_customers': counts['closed_customers']
     }), 200
 
 
+SEED_CHUNK_SIZE = 5000
+
+def _insert_chunked(model, rows):
+    """executemany-insert an iterable of row dicts SEED_CHUNK_SIZE at a time."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= SEED_CHUNK_SIZE:
+            db.session.execute(db.insert(model), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(db.insert(model), chunk)
+
+def seed_sample_data(reps=5, customers_per_rep=200, interactions_per_customer=2, fixes_per_rep=100,
+                     track_days=1, seed=0):
+    """Fill an empty database with reproducible synthetic CRM data.
+
+    Creates one admin (admin@example.com) and ``reps`` sales reps
+    (rep<N>@example.com), all with the password "password". Each rep gets
+    customers clustered around a home area, interactions spread over the
+    year after each customer was created, and a GPS random walk of
+    ``fixes_per_rep`` fixes over the last ``track_days`` days. Returns the
+    created users.
+    """
+    rng = random.Random(seed)
+    # Stage histories draw from their own generator, leaving the rest of the data as it was
+    history_rng = random.Random(seed + 1)
+    now = datetime.utcnow()
+    password_hash = generate_password_hash('password')
+    users = [User(name='Admin', email='admin@example.com', password_hash=password_hash, role='admin')]
+    users += [
+        User(name=f'Rep {i}', email=f'rep{i}@example.com', password_hash=password_hash, role='sales_rep')
+        for i in range(1, reps + 1)
+    ]
+    db.session.add_all(users)
+    db.session.flush()
+    stages = list(STAGE_ROLLUP_COLUMNS)
+    interaction_types = ['note', 'call', 'meeting', 'email']
+
+    for rep in users[1:]:
+        home_lat, home_lng = rng.uniform(-60, 60), rng.uniform(-170, 170)
+        histories = []
+
+        def customers():
+            for i in range(customers_per_rep):
+                lat, lng = home_lat + rng.gauss(0, 0.2), home_lng + rng.gauss(0, 0.2)
+                customer = {
+                    'name': f'Customer {rep.id}-{i}',
+                    'email': f'customer{rep.id}-{i}@example.com',
+                    'phone': f'555-{rng.randrange(10000):04d}',
+                    'company': f'Company {rng.randrange(max(customers_per_rep // 4, 1))}',
+                    'lat': lat,
+                    'lng': lng,
+                    'geohash': customer_geohash(lat, lng),
+                    'stage': rng.choice(stages),
+                    'created_by': rep.id,
+                    'created_at': now - timedelta(days=rng.uniform(0, 365))
+                }
+                # Each customer walked the funnel from New to its stage at random points since creation
+                entered = [customer['created_at']]
+                for _ in range(funnel.STAGE_RANKS[customer['stage']]):
+                    entered.append(entered[-1] + (now - entered[-1]) * history_rng.uniform(0.05, 0.5))
+                histories.append(entered)
+                yield dict(customer, stage_entered_at=entered[-1], furthest_stage=customer['stage'])
+        _insert_chunked(Customer, customers())
+        customer_ids = [customer_id for (customer_id,) in db.session.query(Customer.id).filter(
+            Customer.created_by == rep.id).order_by(Customer.id)]
+
+        def transitions():
+            for customer_id, entered in zip(customer_ids, histories):
+                for rank, at in enumerate(entered):
+                    yield {
+                        'customer_id': customer_id,
+                        'user_id': rep.id,
+                        'from_stage': stages[rank - 1] if rank else None,
+                        'to_stage': stages[rank],
+                        'entered_at': at,
+                        'from_stage_seconds': int((at - entered[rank - 1]).total_seconds()) if rank else None,
+                        'customer_created_at': entered[0]
+                    }
+        _insert_chunked(StageTransition, transitions())
+
+        def interactions():
+            for customer_id, created_at in db.session.query(Customer.id, Customer.created_at).filter(
+                Customer.created_by == rep.id
+            ).all():
+                age_days = (now - created_at).total_seconds() / 86400
+                for _ in range(interactions_per_customer):
+                    yield {
+                        'customer_id': customer_id,
+                        'user_id': rep.id,
+                        'type': rng.choice(interaction_types),
+                        'note': f'Follow-up {rng.randrange(1000)} about order {rng.randrange(100000)}',
+                        'timestamp': now - timedelta(days=rng.uniform(0, age_days))
+                    }
+        _insert_chunked(Interaction, interactions())
+
+        if fixes_per_rep:
+            lat, lng = home_lat, home_lng
+            step = timedelta(days=track_days) / fixes_per_rep
+            fixes = []
+            for i in range(fixes_per_rep):
+                lat, lng = lat + rng.gauss(0, 0.0005), lng + rng.gauss(0, 0.0005)
+                fixes.append({'user_id': rep.id, 'latitude': lat, 'longitude': lng,
+                              'timestamp': now - step * (fixes_per_rep - i)})
+            db.session.execute(db.insert(Location), fixes)
+            upsert_latest_locations(fixes[-1:])
+    db.session.commit()
+    rebuild_pipeline_rollups()
+    rebuild_funnel_rollups()
+    return users
+
+@app.cli.command('seed-data')
+@click.option('--reps', default=5, show_default=True)
+@click.option('--customers-per-rep', default=200, show_default=True)
+@click.option('--interactions-per-customer', default=2, show_default=True)
+@click.option('--fixes-per-rep', default=100, show_default=True)
+@click.option('--track-days', default=1, show_default=True)
+@click.option('--seed', default=0, show_default=True, help='Random seed; equal seeds give equal data.')
+def seed_data_command(reps, customers_per_rep, interactions_per_customer, fixes_per_rep, track_days, seed):
+    """Fill an empty database with synthetic users, customers, interactions and GPS tracks."""
+    if db.session.query(User.id).first() is not None:
+        raise click.ClickException('seed-data needs an empty database')
+    started = time.perf_counter()
+    users = seed_sample_data(reps, customers_per_rep, interactions_per_customer, fixes_per_rep, track_days, seed)
+    click.echo(f"Seeded {len(users)} users, {reps * customers_per_rep} customers, "
+               f"{reps * customers_per_rep * interactions_per_customer} interactions and "
+               f"{reps * fixes_per_rep} GPS fixes in {time.perf_counter() - started:.1f}s")
+
+# Read endpoints checked by check-query-plans: (role, path, tables a full
+# scan of which is expected). Paths are formatted with the sample ids.
+QUERY_PLAN_CHECKS = [
+    ('rep', '/api/customers', ()),
+    ('rep', '/api/customers?stage=New&cursor={cursor}', ()),
+    ('admin', '/api/customers', ()),
+    ('admin', '/api/customers?created_by={rep_id}', ()),
+    ('rep', '/api/customers/{customer_id}', ()),
+    ('rep', '/api/customers/nearby?lat={lat}&lng={lng}&radius_km=5', ()),
+    ('rep', '/api/customers/nearby?lat={lat}&lng={lng}&k=10', ()),
+    # More than the sample rep has: falls back to ranking all of the rep's customers
+    ('rep', '/api/customers/nearby?lat={lat}&lng={lng}&k=1000', ()),
+    ('rep', '/api/interactions', ()),
+    ('rep', '/api/interactions?customer_id={customer_id}', ()),
+    ('rep', '/api/customers/{customer_id}/timeline', ()),
+    ('rep', '/api/customers/{customer_id}/timeline?limit=1&cursor={timeline_cursor}', ()),
+    # One row per user: listing everyone's latest location reads it all
+    ('rep', '/api/locations', ('user_latest_location',)),
+    ('rep', '/api/locations/{rep_id}/track', ()),
+    ('rep', '/api/dashboard', ()),
+    ('rep', '/api/customer-analytics', ()),
+    ('rep', '/api/analytics/funnel', ()),
+    ('admin', '/api/analytics/funnel', ()),
+    ('admin', '/api/dashboard', ()),
+    ('rep', '/api/search?q=follow', ()),
+    ('rep', '/api/exports/customers', ()),
+    ('rep', '/api/exports/interactions?customer_id={customer_id}', ()),
+]
+
+@app.cli.command('check-query-plans')
+@click.option('--seed', is_flag=True, help='Fill an empty database with sample data first.')
+def check_query_plans_command(seed):
+    """EXPLAIN the queries behind the read endpoints; fail on full table scans.
+
+    Each endpoint in QUERY_PLAN_CHECKS is called as a sample rep or admin,
+    and every SELECT it runs is explained with the same parameters.
+    """
+    if seed:
+        if db.session.query(User.id).first() is not None:
+            raise click.ClickException('--seed needs an empty database')
+        seed_sample_data()
+    customer = Customer.query.filter(Customer.lat.isnot(None)).order_by(Customer.id).first()
+    admin = User.query.filter_by(role='admin').first()
+    if customer is None or admin is None:
+        raise click.ClickException('Needs an admin and a customer with coordinates; run with --seed on an empty database')
+    values = {
+        'rep_id': customer.created_by,
+        'customer_id': customer.id,
+        'lat': customer.lat,
+        'lng': customer.lng,
+        'cursor': encode_keyset_cursor(customer.created_at, customer.id),
+        'timeline_cursor': encode_keyset_cursor(datetime.utcnow(), 0)
+    }
+    headers = {
+        'rep': {'Authorization': f"Bearer {create_access_token(identity=customer.created_by)}"},
+        'admin': {'Authorization': f"Bearer {create_access_token(identity=admin.id)}"}
+    }
+    db.session.commit()
+
+    client = app.test_client()
+    failures = 0
+    with explain_connection(db.engine) as connection:
+        for role, path, allowed_scans in QUERY_PLAN_CHECKS:
+            path = path.format(**values)
+            with capture_selects(db.engine) as statements:
+                response = client.get(path, headers=headers[role])
+                response.get_data()
+            if response.status_code != 200:
+                raise click.ClickException(f'GET {path} as {role} returned {response.status_code}')
+            scans = sorted({
+                table for statement, parameters in statements
+                for table in full_scans(connection, statement, parameters)
+                if table not in allowed_scans
+            })
+            if scans:
+                failures += 1
+                click.echo(f"FAIL  GET {path} ({role}): full scan of {', '.join(scans)}")
+                for statement, parameters in statements:
+                    if full_scans(connection, statement, parameters):
+                        click.echo(f'      {statement}')
+            else:
+                click.echo(f'ok    GET {path} ({role}): {len(statements)} queries')
+    if failures:
+        raise click.ClickException(f'{failures} endpoint(s) plan a full table scan')
+
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
     app.run(debug=True)
-
-from flask import Flask, send_from_directory
-import os
-
-app = Flask(__name__, static_folder="static")
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    if path != "" and os.path.exists("static/" + path):
-        return send_from_directory("static", path)
-    else:
-        return send_from_directory("static", "index.html")
@@ -0,0 +1 @@
+"""Benchmarks for the CRM API; see bench/run.py."""
@@ -0,0 +1,289 @@
+"""Benchmark harness: drives every /api route and reports latency percentiles.
+
+Run from backend/ against a seeded database (DATABASE_URL as for the app):
+
+    flask --app app db upgrade
+    flask --app app seed-data --reps 20 --customers-per-rep 2000
+    python -m bench.run --save bench-baseline.json
+    python -m bench.run --baseline bench-baseline.json
+    python -m bench.run --server gunicorn --workers 4 --concurrency 8
+
+Requests go through the Flask test client (in-process, with a SQL query
+count per request) or over HTTP to a local gunicorn started for the run,
+or to any running server given with --url (query counts need PROFILE_TOKEN
+there). Each scenario reports p50, p95 and p99 latency, throughput and errors; with --baseline, a p95 more than
+--tolerance slower than the stored one fails the run.
+"""
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+import numpy as np
+import requests
+
+from app import (Customer, Interaction, User, add_customer, app, bump_pipeline_rollup, create_access_token, db,
+                 latest_user_location)
+from bench.scenarios import SCENARIOS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Latency changes smaller than this are treated as noise when comparing
+MIN_REGRESSION_MS = 1.0
+
+
+class BenchContext:
+    """Seeded ids, auth tokens and helpers shared by the scenarios."""
+
+    def __init__(self, seed=0):
+        with app.app_context():
+            admin = User.query.filter_by(role='admin').first()
+            rep = User.query.filter(User.role != 'admin', User.customers.any()).order_by(User.id).first()
+            if admin is None or rep is None:
+                raise click.ClickException('Seed the database first: flask --app app seed-data')
+            customers = db.session.query(Customer.id, Customer.lat, Customer.lng).filter(
+                Customer.created_by == rep.id, Customer.lat.isnot(None)
+            ).order_by(Customer.id).limit(100).all()
+            location = latest_user_location(rep.id)
+            self.tokens = {
+                'rep': create_access_token(identity=rep.id),
+                'admin': create_access_token(identity=admin.id)
+            }
+            self.rep_id = rep.id
+            self.rep_email = rep.email
+        self.customer_ids = [c.id for c in customers]
+        self.customer_points = [[c.lat, c.lng] for c in customers]
+        self.customer_id = self.customer_ids[0]
+        if location is not None:
+            self.lat, self.lng = location.latitude, location.longitude
+        else:
+            self.lat, self.lng = self.customer_points[0]
+        # Unique across runs, for e-mail addresses of created rows
+        self._numbers = itertools.count(int(time.time() * 1000))
+        self._rng = random.Random(seed)
+
+    def next_number(self):
+        return next(self._numbers)
+
+    def pick(self, options):
+        return self._rng.choice(options)
+
+    def headers(self, role):
+        return {'Authorization': f'Bearer {self.tokens[role]}'} if role else {}
+
+    def create_customer(self):
+        with app.app_context():
+            customer = add_customer(self.rep_id, name='Bench delete')
+            db.session.commit()
+            return customer.id
+
+    def create_interaction(self):
+        with app.app_context():
+            interaction = Interaction(customer_id=self.customer_id, user_id=self.rep_id, type='note',
+                                      note='Bench delete', timestamp=datetime.utcnow())
+            db.session.add(interaction)
+            bump_pipeline_rollup(self.rep_id, day=interaction.timestamp.date(), interactions=1)
+            db.session.commit()
+            return interaction.id
+
+
+class ClientDriver:
+    """In-process requests through the Flask test client, counting SQL queries."""
+
+    name = 'client'
+
+    def __init__(self):
+        self.client = app.test_client()
+        self._local = threading.local()
+        with app.app_context():
+            self.engine = db.engine
+        db.event.listen(self.engine, 'before_cursor_execute', self._count_query)
+
+    def _count_query(self, *args):
+        # Only the requesting thread's queries, not background flushers
+        self._local.queries = getattr(self._local, 'queries', 0) + 1
+
+    def request(self, method, path, body, headers):
+        self._local.queries = 0
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        response.get_data()
+        return time.perf_counter() - started, response.status_code, self._local.queries
+
+    def close(self):
+        db.event.remove(self.engine, 'before_cursor_execute', self._count_query)
+
+
+class HTTPDriver:
+    """Requests over HTTP, one keep-alive session per thread.
+
+    When PROFILE_TOKEN is set (for the server too), query counts are read
+    from the X-Query-Count profiling header.
+    """
+
+    def __init__(self, base_url, process=None):
+        self.name = base_url
+        self.base_url = base_url.rstrip('/')
+        self.process = process
+        self.profile_token = os.environ.get('PROFILE_TOKEN')
+        self._local = threading.local()
+
+    def request(self, method, path, body, headers):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            if self.profile_token:
+                session.headers['X-Profile'] = self.profile_token
+        started = time.perf_counter()
+        response = session.request(method, self.base_url + path, json=body, headers=headers, timeout=60)
+        response.content
+        elapsed = time.perf_counter() - started
+        queries = response.headers.get('X-Query-Count')
+        return elapsed, response.status_code, int(queries) if queries is not None else None
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+
+
+def start_gunicorn(workers, port):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=BACKEND_DIR
+    )
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.terminate()
+                raise click.ClickException('gunicorn did not start; is it installed?')
+            time.sleep(0.2)
+
+
+def run_scenario(driver, ctx, scenario, count, warmup, concurrency):
+    def send(_=None):
+        path = scenario.path(ctx) if callable(scenario.path) else scenario.path
+        body = scenario.body(ctx) if callable(scenario.body) else scenario.body
+        return driver.request(scenario.method, path, body, ctx.headers(scenario.role))
+
+    for _ in range(warmup):
+        send()
+    started = time.perf_counter()
+    if concurrency == 1:
+        samples = [send() for _ in range(count)]
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = list(pool.map(send, range(count)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([sample[0] for sample in samples]) * 1000
+    queries = [sample[2] for sample in samples if sample[2] is not None]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'requests': count,
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'throughput_rps': round(count / elapsed, 1),
+        'queries_per_request': round(sum(queries) / len(queries), 1) if queries else None,
+        'errors': sum(1 for sample in samples if sample[1] >= 400)
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a line per scenario whose p95 regressed against the baseline."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        slower = result['p95_ms'] - before['p95_ms']
+        if slower > MIN_REGRESSION_MS and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if before.get('queries_per_request') is not None and result['queries_per_request'] is not None \
+                and result['queries_per_request'] > before['queries_per_request']:
+            regressions.append(f"{name}: queries per request "
+                               f"{before['queries_per_request']} -> {result['queries_per_request']}")
+    return regressions
+
+
+def print_results(results):
+    click.echo(f"{'scenario':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'queries':>8} {'errors':>7}")
+    for name, r in results.items():
+        queries = '-' if r['queries_per_request'] is None else r['queries_per_request']
+        click.echo(f"{name:<28} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+                   f"{r['throughput_rps']:>9.1f} {queries:>8} {r['errors']:>7}")
+
+
+@click.command()
+@click.option('--server', type=click.Choice(['client', 'gunicorn']), default='client', show_default=True)
+@click.option('--url', help='Benchmark an already running server instead.')
+@click.option('--workers', default=4, show_default=True, help='gunicorn workers.')
+@click.option('--port', default=8765, show_default=True, help='gunicorn port.')
+@click.option('--requests', 'count', default=100, show_default=True, help='Timed requests per scenario.')
+@click.option('--warmup', default=5, show_default=True)
+@click.option('--concurrency', default=1, show_default=True)
+@click.option('--only', multiple=True, help='Run scenarios whose name starts with this; repeatable.')
+@click.option('--save', type=click.Path(dir_okay=False), help='Write the results as JSON.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Results JSON to compare with.')
+@click.option('--tolerance', default=0.2, show_default=True, help='Allowed p95 slowdown against the baseline.')
+def main(server, url, workers, port, count, warmup, concurrency, only, save, baseline, tolerance):
+    """Benchmark the /api routes against the database in DATABASE_URL."""
+    ctx = BenchContext()
+    if url:
+        driver = HTTPDriver(url)
+    elif server == 'gunicorn':
+        driver = HTTPDriver(f'http://127.0.0.1:{port}', start_gunicorn(workers, port))
+    else:
+        driver = ClientDriver()
+
+    scenarios = [s for s in SCENARIOS if not only or s.name.startswith(only)]
+    results = {}
+    try:
+        for scenario in scenarios:
+            results[scenario.name] = run_scenario(driver, ctx, scenario, count, warmup, concurrency)
+    finally:
+        driver.close()
+    print_results(results)
+
+    if save:
+        with app.app_context():
+            dialect = db.engine.dialect.name
+        with open(save, 'w') as f:
+            json.dump({
+                'meta': {
+                    'server': driver.name,
+                    'database': dialect,
+                    'requests': count,
+                    'concurrency': concurrency,
+                    'python': platform.python_version(),
+                    'created_at': datetime.utcnow().isoformat(timespec='seconds')
+                },
+                'results': results
+            }, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)['results'], tolerance)
+        if regressions:
+            click.echo('\nRegressions against ' + baseline + ':')
+            for line in regressions:
+                click.echo('  ' + line)
+            sys.exit(1)
+        click.echo(f'\nNo regressions against {baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Requests driven by the benchmark harness, one per /api route.
+
+``path`` and ``body`` are either constants or callables taking the
+BenchContext, so scenarios can refer to seeded ids or create the row a
+DELETE will remove (outside the timed request).
+"""
+from collections import namedtuple
+
+Scenario = namedtuple('Scenario', 'name method path body role')
+Scenario.__new__.__defaults__ = (None, 'rep')
+
+
+def _customer_body(ctx):
+    n = ctx.next_number()
+    return {'name': f'Bench customer {n}', 'email': f'bench{n}@example.com', 'company': 'Bench Ltd',
+            'lat': ctx.lat, 'lng': ctx.lng}
+
+
+def _fixes(ctx, count):
+    return {'fixes': [{'latitude': ctx.lat + i * 1e-4, 'longitude': ctx.lng} for i in range(count)]}
+
+
+SCENARIOS = [
+    Scenario('login', 'POST', '/api/login', lambda ctx: {'email': ctx.rep_email, 'password': 'password'}, None),
+    Scenario('register', 'POST', '/api/register',
+             lambda ctx: {'name': 'Bench', 'email': f'bench-user{ctx.next_number()}@example.com', 'password': 'password'},
+             None),
+    Scenario('customers_page', 'GET', '/api/customers'),
+    Scenario('customers_page_1000', 'GET', '/api/customers?limit=1000'),
+    Scenario('customers_page_admin', 'GET', '/api/customers', role='admin'),
+    Scenario('customer_detail', 'GET', lambda ctx: f'/api/customers/{ctx.customer_id}'),
+    Scenario('customer_timeline', 'GET', lambda ctx: f'/api/customers/{ctx.customer_id}/timeline'),
+    Scenario('customers_nearby_radius', 'GET', lambda ctx: f'/api/customers/nearby?lat={ctx.lat}&lng={ctx.lng}&radius_km=5'),
+    Scenario('customers_nearby_k', 'GET', lambda ctx: f'/api/customers/nearby?lat={ctx.lat}&lng={ctx.lng}&k=20'),
+    Scenario('customer_create', 'POST', '/api/customers', _customer_body),
+    Scenario('customer_update', 'PUT', lambda ctx: f'/api/customers/{ctx.customer_id}',
+             lambda ctx: {'stage': ctx.pick(['New', 'Contacted', 'Proposal', 'Closed'])}),
+    Scenario('customer_delete', 'DELETE', lambda ctx: f'/api/customers/{ctx.create_customer()}'),
+    Scenario('batch_stage_20', 'POST', '/api/batch', lambda ctx: {'operations': [
+        {'type': 'customer', 'op': 'update', 'id': customer_id,
+         'data': {'stage': ctx.pick(['New', 'Contacted', 'Proposal', 'Closed'])}}
+        for customer_id in ctx.customer_ids[:20]
+    ]}),
+    Scenario('interactions_rep', 'GET', '/api/interactions'),
+    Scenario('interactions_customer', 'GET', lambda ctx: f'/api/interactions?customer_id={ctx.customer_id}'),
+    Scenario('interaction_create', 'POST', '/api/interactions',
+             lambda ctx: {'customer_id': ctx.customer_id, 'type': 'call', 'note': 'Benchmark call'}),
+    Scenario('interaction_delete', 'DELETE', lambda ctx: f'/api/interactions/{ctx.create_interaction()}'),
+    Scenario('search', 'GET', '/api/search?q=follow'),
+    Scenario('export_customers', 'GET', '/api/exports/customers'),
+    Scenario('location_ingest', 'POST', '/api/locations',
+             lambda ctx: {'latitude': ctx.lat, 'longitude': ctx.lng}),
+    Scenario('location_ingest_batch_50', 'POST', '/api/locations', lambda ctx: _fixes(ctx, 50)),
+    Scenario('locations_latest', 'GET', '/api/locations'),
+    Scenario('location_track', 'GET', lambda ctx: f'/api/locations/{ctx.rep_id}/track'),
+    Scenario('distance', 'POST', '/api/distance',
+             lambda ctx: {'lat1': ctx.lat, 'lng1': ctx.lng, 'lat2': ctx.lat + 0.1, 'lng2': ctx.lng + 0.1}),
+    Scenario('distance_matrix_1x100', 'POST', '/api/distance-matrix',
+             lambda ctx: {'origins': [[ctx.lat, ctx.lng]], 'destinations': ctx.customer_points[:100]}),
+    Scenario('route_planning_10', 'POST', '/api/route-planning', lambda ctx: {'customer_ids': ctx.customer_ids[:10]}),
+    Scenario('route_planning_50', 'POST', '/api/route-planning', lambda ctx: {'customer_ids': ctx.customer_ids[:50]}),
+    Scenario('dashboard', 'GET', '/api/dashboard'),
+    Scenario('dashboard_admin', 'GET', '/api/dashboard', role='admin'),
+    Scenario('customer_analytics', 'GET', '/api/customer-analytics'),
+    Scenario('analytics_funnel', 'GET', '/api/analytics/funnel'),
+    Scenario('analytics_funnel_admin', 'GET', '/api/analytics/funnel', role='admin'),
+]
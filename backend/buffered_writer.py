@@ -0,0 +1,113 @@
+"""Size/time-triggered write buffer used for high-volume inserts.
+
+Rows handed to a BufferedWriter are collected in memory and passed to its
+``flush_rows`` callback in batches, so many small requests turn into a few
+bulk INSERTs. Each process (e.g. each gunicorn worker) gets its own buffer
+and flusher thread.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter:
+    """Collect rows and hand them to ``flush_rows`` in batches.
+
+    A batch is flushed once ``max_rows`` rows are pending or the oldest
+    pending row has waited ``max_delay`` seconds. If ``flush_rows`` raises,
+    the rows are kept and retried after ``max_delay``; beyond
+    ``max_pending`` rows the oldest ones are dropped.
+    """
+
+    def __init__(self, flush_rows, max_rows=500, max_delay=1.0, max_pending=None):
+        self.flush_rows = flush_rows
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.max_pending = max_pending or max_rows * 20
+        self.stats = {'flushes': 0, 'rows': 0, 'errors': 0, 'dropped': 0}
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._rows = []
+        self._oldest = None
+        self._closed = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+
+    def add(self, rows):
+        if os.getpid() != self._pid:
+            # Forked after rows/threads were set up in the parent
+            self._reset()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='buffered-writer', daemon=True)
+                self._thread.start()
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            if len(self._rows) >= self.max_rows:
+                self._wakeup.notify()
+
+    def pending(self):
+        with self._lock:
+            return len(self._rows)
+
+    def flush(self):
+        """Write out everything pending now. Returns False if the write failed."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                self._oldest = None
+            if not rows:
+                return True
+            try:
+                self.flush_rows(rows)
+            except Exception:
+                logger.exception('Flushing %d buffered rows failed', len(rows))
+                with self._lock:
+                    self.stats['errors'] += 1
+                    self._rows[:0] = rows
+                    overflow = len(self._rows) - self.max_pending
+                    if overflow > 0:
+                        del self._rows[:overflow]
+                        self.stats['dropped'] += overflow
+                        logger.error('Dropped %d buffered rows over the %d row limit', overflow, self.max_pending)
+                    self._oldest = time.monotonic()
+                return False
+            with self._lock:
+                self.stats['flushes'] += 1
+                self.stats['rows'] += len(rows)
+            return True
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if os.getpid() == self._pid:
+            self.flush()
+
+    def _due(self):
+        if not self._rows:
+            return False
+        return len(self._rows) >= self.max_rows or time.monotonic() - self._oldest >= self.max_delay
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed and not self._due():
+                    timeout = None
+                    if self._rows:
+                        timeout = max(self.max_delay - (time.monotonic() - self._oldest), 0)
+                    self._wakeup.wait(timeout)
+                if self._closed:
+                    return
+            if not self.flush():
+                time.sleep(self.max_delay)
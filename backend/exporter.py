@@ -0,0 +1,59 @@
+"""Streaming serialization for CSV/NDJSON exports.
+
+Rows arrive in partitions (lists of tuples, as produced by a ``yield_per``
+query) and leave as byte chunks, one per partition, so an export of any
+size is produced in bounded memory.
+"""
+import csv
+import io
+import zlib
+from datetime import date, datetime
+
+from serializers import dumps
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def _format(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(fields, partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for rows in partitions:
+        writer.writerows([_format(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(fields, partitions):
+    for rows in partitions:
+        lines = [dumps(dict(zip(fields, row))) for row in rows]
+        if lines:
+            yield b'\n'.join(lines) + b'\n'
+
+
+def export_chunks(fmt, fields, partitions):
+    if fmt == 'csv':
+        return csv_chunks(fields, partitions)
+    return ndjson_chunks(fields, partitions)
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of byte chunks incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
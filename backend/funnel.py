@@ -0,0 +1,77 @@
+"""Sales funnel arithmetic: stage order, periods and time-in-stage histograms.
+
+Stages are ranked in CUSTOMER_STAGES order. A customer has reached every
+stage up to the furthest one it has been in, so moving straight from New
+to Closed also counts as reaching Contacted and Proposal. Stages outside
+the funnel are reported together as ``Other``.
+
+Time spent in a stage is counted in power-of-two hour buckets: bucket 0 is
+under an hour and bucket ``b`` covers ``[2**(b-1), 2**b)`` hours, the last
+one open-ended. Quantiles are interpolated within a bucket, so a median is
+accurate to within its bucket.
+"""
+import math
+from datetime import date
+
+from importer import CUSTOMER_STAGES
+
+OTHER_STAGE = 'Other'
+STAGE_RANKS = {stage: rank for rank, stage in enumerate(CUSTOMER_STAGES)}
+# Bucket 16 starts at 2**15 hours, about 3.7 years
+DURATION_BUCKETS = 17
+
+
+def stage_key(stage):
+    """The stage as reported in the aggregates."""
+    return stage if stage in STAGE_RANKS else OTHER_STAGE
+
+
+def newly_reached(furthest, stage):
+    """Funnel stages first reached by moving to ``stage`` when ``furthest`` was the furthest so far."""
+    rank = STAGE_RANKS.get(stage)
+    if rank is None:
+        return []
+    start = STAGE_RANKS.get(furthest, -1) + 1
+    return list(CUSTOMER_STAGES[start:rank + 1])
+
+
+def month_start(value):
+    """First day of the month of a date or datetime."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(day, months):
+    """The first day of the month ``months`` after (or before) ``day``'s month."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def duration_bucket(seconds):
+    if seconds < 3600:
+        return 0
+    return min(int(math.log2(seconds / 3600)) + 1, DURATION_BUCKETS - 1)
+
+
+def bucket_bounds(bucket):
+    """(lower, upper) seconds of a bucket; upper is None for the last one."""
+    lower = 0 if bucket == 0 else 3600 * 2 ** (bucket - 1)
+    upper = None if bucket == DURATION_BUCKETS - 1 else 3600 * 2 ** bucket
+    return lower, upper
+
+
+def histogram_quantile(counts, q):
+    """Estimate the ``q`` quantile (0-1) in seconds from {bucket: count}; None if empty."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for bucket in sorted(counts):
+        count = counts[bucket]
+        if count and seen + count >= target:
+            lower, upper = bucket_bounds(bucket)
+            if upper is None:
+                return lower
+            return lower + (upper - lower) * (target - seen) / count
+        seen += count
+    return bucket_bounds(max(counts))[0]
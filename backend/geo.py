@@ -0,0 +1,154 @@
+"""Geographic helpers: haversine distances, bounding boxes and geohashes.
+
+Customers carry a geohash of their coordinates so that radius searches can
+scan a handful of indexed geohash prefix ranges instead of the whole table.
+"""
+import math
+
+import numpy as np
+from geopy.distance import geodesic
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_MILE = 1.609344
+# Coordinates are rounded to ~0.1 m before geodesic cache lookups
+GEODESIC_CACHE_DECIMALS = 6
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Upper bound on the number of prefix ranges a single search may scan
+MAX_COVER_CELLS = 16
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distance in km from (lat, lng) to every point of lats/lngs."""
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    lng2 = np.radians(np.asarray(lngs, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix_km(lats1, lngs1, lats2, lngs2):
+    """N x M great-circle distances in km between two point sets."""
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lng1 = np.radians(np.asarray(lngs1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lng2 = np.radians(np.asarray(lngs2, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def geodesic_matrix_km(origins, destinations, cache=None):
+    """N x M WGS-84 ellipsoidal distances in km between (lat, lng) point lists.
+
+    Each distinct pair is solved once; ``cache`` (anything with get/set,
+    such as cache.TTLCache) keeps recent pairs across calls. Distances are
+    symmetric, so A-B and B-A share a cache entry.
+    """
+    result = np.empty((len(origins), len(destinations)))
+    solved = {}
+    for i, origin in enumerate(origins):
+        a = (round(origin[0], GEODESIC_CACHE_DECIMALS), round(origin[1], GEODESIC_CACHE_DECIMALS))
+        for j, destination in enumerate(destinations):
+            b = (round(destination[0], GEODESIC_CACHE_DECIMALS), round(destination[1], GEODESIC_CACHE_DECIMALS))
+            key = (a, b) if a <= b else (b, a)
+            distance = solved.get(key)
+            if distance is None:
+                distance = cache.get(key) if cache is not None else None
+                if distance is None:
+                    distance = geodesic(a, b).kilometers
+                    if cache is not None:
+                        cache.set(key, distance)
+                solved[key] = distance
+            result[i, j] = distance
+    return result
+
+
+def bounding_box(lat, lng, radius_km):
+    """Return (south, west, north, east) enclosing the circle of radius_km.
+
+    ``west`` may be below -180 or ``east`` above 180 when the box crosses
+    the antimeridian; near the poles the box spans every longitude.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    if south <= -90.0 or north >= 90.0:
+        return south, -180.0, north, 180.0
+    dlng = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    if dlng >= 180.0:
+        return south, -180.0, north, 180.0
+    return south, lng - dlng, north, lng + dlng
+
+
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """Return the (lat, lng) extent in degrees of a geohash cell."""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def _cells_covering(south, west, north, east, precision):
+    lat_step, lng_step = geohash_cell_size(precision)
+    lat = math.floor((south + 90.0) / lat_step) * lat_step - 90.0 + lat_step / 2
+    cells = set()
+    while lat - lat_step / 2 <= north:
+        lng = math.floor((west + 180.0) / lng_step) * lng_step - 180.0 + lng_step / 2
+        while lng - lng_step / 2 <= east:
+            wrapped = (lng + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(min(lat, 90.0), wrapped, precision))
+            lng += lng_step
+            if len(cells) > MAX_COVER_CELLS:
+                return None
+        lat += lat_step
+    return cells
+
+
+def geohash_cover(south, west, north, east):
+    """Return the smallest set of geohash prefixes covering the box.
+
+    The finest precision that needs at most MAX_COVER_CELLS cells is used,
+    so a search scans few, tight prefix ranges.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cells = _cells_covering(south, west, north, east, precision)
+        if cells is not None:
+            return cells
+    return set(GEOHASH_ALPHABET)
+
+
+def prefix_upper_bound(prefix):
+    """Smallest geohash greater than every geohash starting with ``prefix``.
+
+    Stays within the geohash alphabet so the range is valid under any
+    collation. Returns None when no such geohash exists (prefix of z's).
+    """
+    while prefix:
+        position = GEOHASH_ALPHABET.index(prefix[-1])
+        if position + 1 < len(GEOHASH_ALPHABET):
+            return prefix[:-1] + GEOHASH_ALPHABET[position + 1]
+        prefix = prefix[:-1]
+    return None
@@ -0,0 +1,156 @@
+"""Local verification of Google Sign-In ID tokens.
+
+Google signs ID tokens with rotating RSA keys published as a JWKS document.
+GoogleKeySet keeps those keys in memory and in a small disk cache for as
+long as the response's Cache-Control allows, refreshes them in the
+background shortly before they expire, and verifies tokens without any
+network call in the common case.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import jwt
+import requests
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_JWKS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+GOOGLE_ISSUERS = ['accounts.google.com', 'https://accounts.google.com']
+DEFAULT_MAX_AGE = 3600
+
+
+def _max_age(cache_control):
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+def _parse_keys(jwks):
+    keys = {}
+    for jwk in jwks.get('keys', []):
+        try:
+            keys[jwk['kid']] = jwt.PyJWK(jwk).key
+        except (KeyError, jwt.PyJWKError):
+            logger.warning('Skipping unusable JWK %r', jwk.get('kid'))
+    return keys
+
+
+class GoogleKeySet:
+    """Google's ID-token signing keys, cached according to Cache-Control.
+
+    ``url`` of None makes a static key set (e.g. for tests) that never goes
+    to the network. ``refresh_ahead`` is the fraction of the cache lifetime
+    before expiry at which a background refresh starts; stale keys keep
+    being used if a refresh fails.
+    """
+
+    def __init__(self, url=GOOGLE_JWKS_URL, cache_path=None, session=None, timeout=5,
+                 refresh_ahead=0.2, min_refresh_interval=60):
+        self.url = url
+        self.cache_path = cache_path
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.refresh_ahead = refresh_ahead
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        if cache_path:
+            self._load_cache()
+
+    @classmethod
+    def from_jwks(cls, jwks):
+        key_set = cls(url=None)
+        key_set._keys = _parse_keys(jwks)
+        key_set._expires_at = float('inf')
+        return key_set
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls.from_jwks(json.load(f))
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+            self._keys = _parse_keys(cached['jwks'])
+            self._fetched_at = cached['fetched_at']
+            self._expires_at = cached['expires_at']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save_cache(self, jwks):
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'jwks': jwks, 'fetched_at': self._fetched_at, 'expires_at': self._expires_at}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            logger.warning('Could not write the Google JWKS cache to %s', self.cache_path)
+
+    def refresh(self):
+        """Fetch the key set now. Raises requests.RequestException on failure."""
+        response = self.session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        jwks = response.json()
+        keys = _parse_keys(jwks)
+        now = time.time()
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = now
+            self._expires_at = now + _max_age(response.headers.get('Cache-Control'))
+        if self.cache_path:
+            self._save_cache(jwks)
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except (requests.RequestException, ValueError):
+            logger.exception('Background refresh of Google signing keys failed')
+        finally:
+            self._refreshing = False
+
+    def _refresh_or_keep_stale(self):
+        try:
+            self.refresh()
+        except (requests.RequestException, ValueError):
+            if not self._keys:
+                raise
+            logger.exception('Refreshing Google signing keys failed; using cached keys')
+
+    def get_key(self, kid):
+        if self.url is not None:
+            now = time.time()
+            if not self._keys or now >= self._expires_at:
+                self._refresh_or_keep_stale()
+            elif now >= self._expires_at - self.refresh_ahead * (self._expires_at - self._fetched_at):
+                with self._lock:
+                    start = not self._refreshing
+                    self._refreshing = True
+                if start:
+                    threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            if kid not in self._keys and now - self._fetched_at >= self.min_refresh_interval:
+                # Probably a freshly rotated key
+                self._refresh_or_keep_stale()
+        key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError('Unknown signing key')
+        return key
+
+    def verify(self, id_token, audience=None):
+        """Return the claims of a valid Google ID token, else raise jwt.InvalidTokenError."""
+        header = jwt.get_unverified_header(id_token)
+        return jwt.decode(
+            id_token,
+            self.get_key(header.get('kid')),
+            algorithms=['RS256'],
+            audience=audience,
+            issuer=GOOGLE_ISSUERS,
+            options={'verify_aud': audience is not None}
+        )
@@ -0,0 +1,162 @@
+"""Streaming parsing and validation for bulk customer/interaction imports.
+
+Records are read one at a time from CSV or NDJSON byte streams, so an
+upload of any size is processed in bounded memory.
+"""
+import csv
+import io
+import json
+import re
+
+FORMATS = ('csv', 'ndjson')
+CUSTOMER_STAGES = ('New', 'Contacted', 'Proposal', 'Closed')
+INTERACTION_TYPES = ('note', 'call', 'email', 'meeting')
+CUSTOMER_UPDATE_FIELDS = ('name', 'email', 'phone', 'company', 'lat', 'lng', 'stage')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def detect_format(content_type, filename=None):
+    """Guess the import format from a Content-Type header or file name."""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-lines'):
+        return 'ndjson'
+    if filename:
+        if filename.lower().endswith('.csv'):
+            return 'csv'
+        if filename.lower().endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+    return None
+
+
+def iter_records(stream, fmt):
+    """Yield (row_number, record, error) for every record of a byte stream.
+
+    ``record`` is a dict, or None with ``error`` set when the row could not
+    be parsed. Row numbers count data rows from 1.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row_number, row in enumerate(reader, start=1):
+            if None in row:
+                yield row_number, None, 'Too many columns'
+                continue
+            yield row_number, {key.strip(): value for key, value in row.items() if key}, None
+        return
+    row_number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield row_number, None, 'Expected a JSON object'
+            continue
+        yield row_number, record, None
+
+
+def _text(record, key, max_length, required=False):
+    value = record.get(key)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise ValueError(f'{key} is required')
+        return None
+    value = str(value).strip()
+    if len(value) > max_length:
+        raise ValueError(f'{key} is longer than {max_length} characters')
+    return value
+
+
+def _float(record, key, low, high):
+    value = record.get(key)
+    if value is None or value == '':
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be a number')
+    if not low <= value <= high:
+        raise ValueError(f'{key} must be between {low} and {high}')
+    return value
+
+
+def _int(record, key, required=False):
+    value = record.get(key)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f'{key} is required')
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be an integer')
+
+
+def clean_customer(record):
+    """Validate an import record and return Customer column values.
+
+    Raises ValueError with a message suitable for the per-row error report.
+    """
+    email = _text(record, 'email', 100)
+    if email is not None:
+        email = email.lower()
+        if not EMAIL_PATTERN.match(email):
+            raise ValueError('email is not a valid address')
+    lat = _float(record, 'lat', -90, 90)
+    lng = _float(record, 'lng', -180, 180)
+    if (lat is None) != (lng is None):
+        raise ValueError('lat and lng must be given together')
+    stage = _text(record, 'stage', 20) or 'New'
+    if stage not in CUSTOMER_STAGES:
+        raise ValueError(f"stage must be one of {', '.join(CUSTOMER_STAGES)}")
+    return {
+        'name': _text(record, 'name', 100, required=True),
+        'email': email,
+        'phone': _text(record, 'phone', 20),
+        'company': _text(record, 'company', 100),
+        'lat': lat,
+        'lng': lng,
+        'stage': stage,
+        'created_by': _int(record, 'created_by')
+    }
+
+
+def clean_customer_update(record):
+    """Validate the fields given in ``record`` as clean_customer() does; returns only those columns."""
+    cleaned = clean_customer({'name': '-', **record})
+    return {field: cleaned[field] for field in CUSTOMER_UPDATE_FIELDS if field in record}
+
+
+def clean_interaction(record):
+    """Validate an import record and return Interaction column values."""
+    interaction_type = _text(record, 'type', 20) or 'note'
+    if interaction_type not in INTERACTION_TYPES:
+        raise ValueError(f"type must be one of {', '.join(INTERACTION_TYPES)}")
+    return {
+        'customer_id': _int(record, 'customer_id', required=True),
+        'type': interaction_type,
+        'note': _text(record, 'note', 10000) or '',
+        'timestamp': record.get('timestamp') or None
+    }
+
+
+def copy_stream(source, target, chunk_size=64 * 1024, max_bytes=None):
+    """Copy ``source`` to ``target`` in chunks; returns the bytes copied.
+
+    Raises ValueError if more than ``max_bytes`` arrive.
+    """
+    copied = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return copied
+        copied += len(chunk)
+        if max_bytes is not None and copied > max_bytes:
+            raise ValueError(f'Upload is larger than {max_bytes} bytes')
+        target.write(chunk)
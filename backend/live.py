@@ -0,0 +1,246 @@
+"""Fan-out of live events (rep locations) to Server-Sent Event streams.
+
+Each process has a Hub that hands published events to its subscribers.
+Events reach the hubs through a broker: LocalBroker delivers within the
+process, PostgresBroker relays through LISTEN/NOTIFY so every gunicorn
+worker (and every instance on the same database) sees every event.
+
+A Broadcast uses the same brokers to run a handler in every process,
+e.g. to drop cache entries everywhere after a write.
+
+A subscription coalesces pending events by key, keeping only the newest
+per key, so a slow client receives the latest position of each rep
+rather than a growing backlog. Past ``max_pending`` keys it is marked
+overflowed and the stream should resynchronise from a snapshot.
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY payloads are limited to 8000 bytes
+POSTGRES_PAYLOAD_MAX = 7000
+
+
+class Subscription:
+    def __init__(self, hub, max_pending):
+        self.hub = hub
+        self.max_pending = max_pending
+        self.overflowed = False
+        self._pending = {}
+        self._wakeup = threading.Condition()
+
+    def offer(self, key, event):
+        with self._wakeup:
+            if self.overflowed:
+                return
+            current = self._pending.get(key)
+            if current is None and len(self._pending) >= self.max_pending:
+                self._pending.clear()
+                self.overflowed = True
+            elif current is None or event.get('timestamp', '') >= current.get('timestamp', ''):
+                self._pending[key] = event
+            self._wakeup.notify()
+
+    def get(self, timeout):
+        """Wait up to ``timeout`` seconds; return the pending events (possibly none)."""
+        with self._wakeup:
+            if not self._pending and not self.overflowed:
+                self._wakeup.wait(timeout)
+            events = list(self._pending.values())
+            self._pending.clear()
+            return events
+
+    def reset(self):
+        """Clear the overflow flag once the subscriber has resynchronised."""
+        with self._wakeup:
+            self.overflowed = False
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """Subscribers of this process, fed by a broker."""
+
+    def __init__(self, broker, max_subscribers=100, max_pending=1000):
+        self.broker = broker
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self.stats = {'published': 0, 'delivered': 0, 'overflows': 0}
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            # Forked after subscribers/listener threads were set up in the parent
+            self._reset()
+
+    def subscribe(self):
+        """Return a new Subscription, or None when the process is at max_subscribers."""
+        self._check_fork()
+        with self._lock:
+            if not self._started:
+                self.broker.start(self.dispatch)
+                self._started = True
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self, self.max_pending)
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, events, key='user_id'):
+        """Send events (dicts) to the subscribers of every process."""
+        if not events:
+            return
+        self._check_fork()
+        self.stats['published'] += len(events)
+        self.broker.publish([(event[key], event) for event in events], self.dispatch)
+
+    def dispatch(self, items):
+        """Deliver (key, event) pairs to this process's subscribers."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            was_overflowed = subscription.overflowed
+            for key, event in items:
+                subscription.offer(key, event)
+            if subscription.overflowed and not was_overflowed:
+                self.stats['overflows'] += 1
+        self.stats['delivered'] += len(items) * len(subscribers)
+
+
+class Broadcast:
+    """Calls ``handler`` with the (key, event) pairs published by any process.
+
+    The broker's listener is started in each process on first use (after
+    any fork); call start() before caching anything ``handler`` invalidates.
+    """
+
+    def __init__(self, broker, handler):
+        self.broker = broker
+        self.handler = handler
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self.broker.start(self.handler)
+                self._pid = os.getpid()
+
+    def publish(self, items):
+        self.start()
+        self.broker.publish(items, self.handler)
+
+
+class LocalBroker:
+    """Delivers events only within the publishing process."""
+
+    def start(self, dispatch):
+        pass
+
+    def publish(self, items, dispatch):
+        dispatch(items)
+
+
+class PostgresBroker:
+    """Relays events between processes with Postgres LISTEN/NOTIFY.
+
+    ``dsn`` is a libpq connection string or URL. Each process opens one
+    connection for notifying and one, on a listener thread, for listening.
+    """
+
+    def __init__(self, dsn, channel='crm_live'):
+        self.dsn = dsn
+        self.channel = channel
+        self._notify_conn = None
+        self._notify_pid = None
+        self._notify_lock = threading.Lock()
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def start(self, dispatch):
+        threading.Thread(target=self._listen, args=(dispatch,), name='live-listener', daemon=True).start()
+
+    def _listen(self, dispatch):
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        dispatch([tuple(item) for item in json.loads(notify.payload)])
+            except Exception:
+                logger.exception('Live event listener failed; reconnecting')
+                time.sleep(1)
+
+    def publish(self, items, dispatch):
+        payloads = []
+        chunk, size = [], 2
+        for item in items:
+            encoded = json.dumps(item, default=str)
+            if chunk and size + len(encoded) + 1 > POSTGRES_PAYLOAD_MAX:
+                payloads.append('[' + ','.join(chunk) + ']')
+                chunk, size = [], 2
+            chunk.append(encoded)
+            size += len(encoded) + 1
+        if chunk:
+            payloads.append('[' + ','.join(chunk) + ']')
+        with self._notify_lock:
+            try:
+                # A connection inherited across fork must not be shared
+                if self._notify_conn is None or self._notify_conn.closed or self._notify_pid != os.getpid():
+                    self._notify_conn = self._connect()
+                    self._notify_pid = os.getpid()
+                with self._notify_conn.cursor() as cursor:
+                    for payload in payloads:
+                        cursor.execute('SELECT pg_notify(%s, %s)', (self.channel, payload))
+            except Exception:
+                # Subscribers catch up from the snapshot when they reconnect
+                logger.exception('Could not publish live events')
+                self._notify_conn = None
+
+
+def create_broker(name, dsn=None, channel='crm_live'):
+    if name == 'local':
+        return LocalBroker()
+    if name == 'postgres':
+        if not dsn or not dsn.startswith(('postgres://', 'postgresql://', 'postgresql+psycopg2://')):
+            raise ValueError('The postgres live broker needs a Postgres DATABASE_URL or LIVE_BROKER_URL')
+        return PostgresBroker(dsn.replace('postgresql+psycopg2://', 'postgresql://', 1), channel=channel)
+    raise ValueError(f'Unknown live broker: {name}')
+
+
+def sse_event(event, data):
+    """One Server-Sent Event; ``data`` is already-encoded JSON bytes."""
+    return b'event: ' + event.encode() + b'\ndata: ' + data + b'\n\n'
@@ -0,0 +1,150 @@
+"""SMTP delivery for the email outbox.
+
+Requests only enqueue mail; an OutboxWorker thread delivers it through an
+SMTPPool that keeps connections open between messages, so the TLS
+handshake and login are paid once per connection rather than per email.
+"""
+import logging
+import os
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPPool:
+    """Reusable SMTP connections to one relay.
+
+    ``security`` is 'starttls', 'ssl' or 'none'; login happens only when a
+    username is given. Connections idle for more than ``max_idle`` seconds
+    are closed instead of reused.
+    """
+
+    def __init__(self, host, port, username=None, password=None, security='starttls',
+                 timeout=10, max_size=2, max_idle=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.timeout = timeout
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a pool from the SMTP_* environment, or None if SMTP_HOST is unset."""
+        host = os.environ.get('SMTP_HOST')
+        if not host:
+            return None
+        security = os.environ.get('SMTP_SECURITY')
+        if not security:
+            security = 'starttls' if os.environ.get('SMTP_USE_TLS', 'true').lower() == 'true' else 'ssl'
+        return cls(
+            host,
+            int(os.environ.get('SMTP_PORT', '587')),
+            username=os.environ.get('SMTP_USER'),
+            password=os.environ.get('SMTP_PASS'),
+            security=security,
+            timeout=float(os.environ.get('SMTP_TIMEOUT', '10')),
+            max_size=int(os.environ.get('SMTP_POOL_SIZE', '2'))
+        )
+
+    def _connect(self):
+        if self.security == 'ssl':
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == 'starttls':
+                server.starttls()
+        if self.username:
+            server.login(self.username, self.password)
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        server = None
+        with self._lock:
+            while self._idle:
+                candidate, idle_since = self._idle.pop()
+                if time.monotonic() - idle_since <= self.max_idle:
+                    server = candidate
+                    break
+                self._close(candidate)
+        if server is None:
+            server = self._connect()
+        try:
+            yield server
+        except BaseException:
+            self._close(server)
+            raise
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((server, time.monotonic()))
+                return
+        self._close(server)
+
+    def send(self, message):
+        # A pooled connection may have been dropped by the relay; retry once
+        # on a fresh one before reporting failure.
+        for attempt in (1, 2):
+            try:
+                with self.connection() as server:
+                    server.send_message(message)
+                return
+            except smtplib.SMTPServerDisconnected:
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+
+class OutboxWorker:
+    """Background thread that calls ``deliver`` until the outbox is drained.
+
+    ``deliver`` returns how many messages it handled; the worker sleeps
+    ``poll_interval`` seconds when there was nothing to do, or until
+    ``notify`` is called after a new message is enqueued.
+    """
+
+    def __init__(self, deliver, poll_interval=30.0):
+        self.deliver = deliver
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def notify(self):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                handled = self.deliver()
+            except Exception:
+                logger.exception('Outbox delivery failed')
+                handled = 0
+            if not handled:
+                self._wakeup.wait(self.poll_interval)
@@ -0,0 +1,160 @@
+"""Rollups, location projections, email outbox, import jobs and customer geohash
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 20:58:12.402113
+
+The dashboard rollups are filled from the existing customers and
+interactions, since every later write only adds its delta to them. Run
+`flask rebuild-geohashes` and `flask rebuild-latest-locations` after
+upgrading a database with data.
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+GLOBAL_ROLLUP_USER_ID = 0
+STAGE_ROLLUP_COLUMNS = {
+    'New': 'new_customers',
+    'Contacted': 'contacted_customers',
+    'Proposal': 'proposal_customers',
+    'Closed': 'closed_customers'
+}
+PIPELINE_COLUMNS = tuple(STAGE_ROLLUP_COLUMNS.values()) + ('other_customers', 'total_interactions')
+
+
+def backfill_rollups(pipeline_rollups, activity_rollups):
+    """Fill the rollups from the existing rows, as app.rebuild_pipeline_rollups() does."""
+    bind = op.get_bind()
+    pipeline = {}
+    activity = {}
+
+    def add(rows, keys, column, count):
+        for key in keys:
+            row = rows.setdefault(key, {})
+            row[column] = row.get(column, 0) + count
+
+    for created_by, stage, count in bind.execute(sa.text(
+            'SELECT created_by, stage, count(*) FROM customers GROUP BY created_by, stage')):
+        add(pipeline, (created_by, GLOBAL_ROLLUP_USER_ID), STAGE_ROLLUP_COLUMNS.get(stage, 'other_customers'), count)
+    for user_id, count in bind.execute(sa.text('SELECT user_id, count(*) FROM interactions GROUP BY user_id')):
+        add(pipeline, (user_id, GLOBAL_ROLLUP_USER_ID), 'total_interactions', count)
+    for table, user_column, time_column, column in (('customers', 'created_by', 'created_at', 'customers_created'),
+                                                    ('interactions', 'user_id', 'timestamp', 'interactions')):
+        for user_id, day, count in bind.execute(sa.text(
+                f'SELECT {user_column}, date({time_column}), count(*) FROM {table} '
+                f'WHERE {time_column} IS NOT NULL GROUP BY {user_column}, date({time_column})')):
+            day = date.fromisoformat(day) if isinstance(day, str) else day
+            add(activity, ((user_id, day), (GLOBAL_ROLLUP_USER_ID, day)), column, count)
+
+    if pipeline:
+        op.bulk_insert(pipeline_rollups, [
+            {'user_id': user_id, **{column: values.get(column, 0) for column in PIPELINE_COLUMNS}}
+            for user_id, values in pipeline.items()
+        ])
+    if activity:
+        op.bulk_insert(activity_rollups, [
+            {'user_id': user_id, 'day': day, 'customers_created': values.get('customers_created', 0),
+             'interactions': values.get('interactions', 0)}
+            for (user_id, day), values in activity.items()
+        ])
+
+
+def upgrade():
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+
+    pipeline_rollups = op.create_table('pipeline_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('new_customers', sa.Integer(), nullable=False),
+    sa.Column('contacted_customers', sa.Integer(), nullable=False),
+    sa.Column('proposal_customers', sa.Integer(), nullable=False),
+    sa.Column('closed_customers', sa.Integer(), nullable=False),
+    sa.Column('other_customers', sa.Integer(), nullable=False),
+    sa.Column('total_interactions', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    activity_rollups = op.create_table('activity_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('customers_created', sa.Integer(), nullable=False),
+    sa.Column('interactions', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+    backfill_rollups(pipeline_rollups, activity_rollups)
+    op.create_table('user_latest_location',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=False),
+    sa.Column('longitude', sa.Float(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('location_tracks',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('polyline', sa.Text(), nullable=False),
+    sa.Column('offsets', sa.Text(), nullable=False),
+    sa.Column('point_count', sa.Integer(), nullable=False),
+    sa.Column('raw_point_count', sa.Integer(), nullable=False),
+    sa.Column('tolerance_m', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+    op.create_table('email_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recipient', sa.String(length=100), nullable=False),
+    sa.Column('sender', sa.String(length=100), nullable=False),
+    sa.Column('subject', sa.String(length=200), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.create_index('ix_email_outbox_status_next_attempt_at', ['status', 'next_attempt_at'], unique=False)
+
+    op.create_table('import_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('format', sa.String(length=10), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('processed_rows', sa.Integer(), nullable=False),
+    sa.Column('inserted_rows', sa.Integer(), nullable=False),
+    sa.Column('duplicate_rows', sa.Integer(), nullable=False),
+    sa.Column('failed_rows', sa.Integer(), nullable=False),
+    sa.Column('errors', sa.Text(), nullable=True),
+    sa.Column('message', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('import_jobs')
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.drop_index('ix_email_outbox_status_next_attempt_at')
+
+    op.drop_table('email_outbox')
+    op.drop_table('location_tracks')
+    op.drop_table('user_latest_location')
+    op.drop_table('activity_rollups')
+    op.drop_table('pipeline_rollups')
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.drop_column('geohash')
@@ -0,0 +1,61 @@
+"""Composite indexes for per-rep and per-customer access paths
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 21:02:40.118734
+
+Each index matches the filter and sort of a hot query, leading with the
+equality column:
+
+- customers (created_by, created_at, id): a rep's customer list, keyset-paginated
+- customers (created_at, id): the admin customer list
+- customers (created_by, geohash), (geohash): nearby-customer prefix ranges
+- customers (email): import dedupe
+- interactions (user_id, timestamp): a rep's interactions and activity
+- interactions (customer_id, timestamp): a customer's history
+- locations (user_id, timestamp): tracks and compaction
+
+`flask check-query-plans` verifies that no endpoint query falls back to a
+full table scan.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.create_index('ix_customers_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_customers_created_by_created_at_id', ['created_by', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_customers_created_by_geohash', ['created_by', 'geohash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_customers_email'), ['email'], unique=False)
+        batch_op.create_index(batch_op.f('ix_customers_geohash'), ['geohash'], unique=False)
+
+    with op.batch_alter_table('interactions', schema=None) as batch_op:
+        batch_op.create_index('ix_interactions_customer_id_timestamp', ['customer_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_interactions_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.create_index('ix_locations_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.drop_index('ix_locations_user_id_timestamp')
+
+    with op.batch_alter_table('interactions', schema=None) as batch_op:
+        batch_op.drop_index('ix_interactions_user_id_timestamp')
+        batch_op.drop_index('ix_interactions_customer_id_timestamp')
+
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_customers_geohash'))
+        batch_op.drop_index(batch_op.f('ix_customers_email'))
+        batch_op.drop_index('ix_customers_created_by_geohash')
+        batch_op.drop_index('ix_customers_created_by_created_at_id')
+        batch_op.drop_index('ix_customers_created_at_id')
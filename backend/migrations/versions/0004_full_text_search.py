@@ -0,0 +1,35 @@
+"""Full-text search tables (SQLite) and indexes (Postgres)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 21:05:03.660251
+
+The DDL lives in search.py, shared with db.create_all().
+
+"""
+from alembic import op
+
+import search
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    search.install(op.get_bind(), rebuild=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.drop_index('ix_interactions_search', table_name='interactions')
+        op.drop_index('ix_customers_search', table_name='customers')
+    else:
+        for trigger in ('customers_fts_insert', 'customers_fts_delete', 'customers_fts_update',
+                        'interactions_fts_insert', 'interactions_fts_delete', 'interactions_fts_update'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        search.uninstall(bind)
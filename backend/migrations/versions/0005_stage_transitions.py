@@ -0,0 +1,112 @@
+"""Stage transition log and funnel rollups
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 21:40:26.815307
+
+Existing customers are taken to have entered their current stage when
+they were created: that is logged as their first transition and folded
+into the cohort funnel rollups.
+
+"""
+from collections import Counter
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+GLOBAL_ROLLUP_USER_ID = 0
+CUSTOMER_STAGES = ('New', 'Contacted', 'Proposal', 'Closed')
+
+
+def backfill_funnels(cohort_funnel_rollups):
+    """Log every customer's current stage and fill the cohort rollups, as app.rebuild_funnel_rollups() would."""
+    op.execute("INSERT INTO stage_transitions (customer_id, user_id, to_stage, entered_at, customer_created_at) "
+               "SELECT id, created_by, stage, coalesce(created_at, CURRENT_TIMESTAMP), created_at FROM customers")
+    cohorts = Counter()
+    for created_by, stage, day, count in op.get_bind().execute(sa.text(
+            'SELECT created_by, stage, date(created_at), count(*) FROM customers '
+            'WHERE created_at IS NOT NULL GROUP BY created_by, stage, date(created_at)')):
+        if stage not in CUSTOMER_STAGES:
+            continue
+        day = date.fromisoformat(day) if isinstance(day, str) else day
+        cohort = date(day.year, day.month, 1)
+        # A customer created in a stage has reached every stage before it
+        for reached in CUSTOMER_STAGES[:CUSTOMER_STAGES.index(stage) + 1]:
+            for scope in (created_by, GLOBAL_ROLLUP_USER_ID):
+                cohorts[scope, cohort, reached] += count
+    if cohorts:
+        op.bulk_insert(cohort_funnel_rollups, [
+            {'user_id': user_id, 'cohort': cohort, 'stage': stage, 'customers': count, 'seconds_to_reach': 0}
+            for (user_id, cohort, stage), count in cohorts.items()
+        ])
+
+
+def upgrade():
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stage_entered_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('furthest_stage', sa.String(length=20), nullable=True))
+    op.execute("UPDATE customers SET stage_entered_at = created_at, furthest_stage = stage "
+               "WHERE stage IN ('New', 'Contacted', 'Proposal', 'Closed')")
+    op.execute("UPDATE customers SET stage_entered_at = created_at WHERE stage_entered_at IS NULL")
+
+    op.create_table('stage_transitions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('from_stage', sa.String(length=20), nullable=True),
+    sa.Column('to_stage', sa.String(length=20), nullable=True),
+    sa.Column('entered_at', sa.DateTime(), nullable=False),
+    sa.Column('from_stage_seconds', sa.Integer(), nullable=True),
+    sa.Column('customer_created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stage_transitions', schema=None) as batch_op:
+        batch_op.create_index('ix_stage_transitions_customer_id_entered_at', ['customer_id', 'entered_at'], unique=False)
+
+    op.create_table('stage_transition_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.Date(), nullable=False),
+    sa.Column('from_stage', sa.String(length=20), nullable=False),
+    sa.Column('to_stage', sa.String(length=20), nullable=False),
+    sa.Column('transitions', sa.Integer(), nullable=False),
+    sa.Column('seconds_in_from_stage', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'period', 'from_stage', 'to_stage')
+    )
+    op.create_table('stage_duration_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.Date(), nullable=False),
+    sa.Column('stage', sa.String(length=20), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('customers', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'period', 'stage', 'bucket')
+    )
+    cohort_funnel_rollups = op.create_table('cohort_funnel_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('cohort', sa.Date(), nullable=False),
+    sa.Column('stage', sa.String(length=20), nullable=False),
+    sa.Column('customers', sa.Integer(), nullable=False),
+    sa.Column('seconds_to_reach', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'cohort', 'stage')
+    )
+    backfill_funnels(cohort_funnel_rollups)
+
+
+def downgrade():
+    op.drop_table('cohort_funnel_rollups')
+    op.drop_table('stage_duration_rollups')
+    op.drop_table('stage_transition_rollups')
+    with op.batch_alter_table('stage_transitions', schema=None) as batch_op:
+        batch_op.drop_index('ix_stage_transitions_customer_id_entered_at')
+
+    op.drop_table('stage_transitions')
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.drop_column('furthest_stage')
+        batch_op.drop_column('stage_entered_at')
@@ -0,0 +1,41 @@
+"""Never reuse customer ids on SQLite
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 21:52:47.306519
+
+SQLite hands out the id of the most recently deleted customer again unless
+the table is AUTOINCREMENT, which would merge the stage_transitions history
+of the deleted customer into the new one's. Postgres sequences never reuse
+ids. Recreating the table drops its search triggers, so they are installed
+again.
+
+"""
+from alembic import op
+
+import search
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def _recreate_customers(autoincrement):
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('customers', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+    search.install(bind, rebuild=True)
+
+
+def upgrade():
+    _recreate_customers(True)
+
+
+def downgrade():
+    _recreate_customers(False)
@@ -0,0 +1,29 @@
+"""Case-insensitive customer email index per rep
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 22:10:05.552418
+
+Imports skip a customer whose email the owning rep already has, compared
+with lower(); this index serves that lookup.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.create_index('ix_customers_created_by_lower_email', ['created_by', sa.text('lower(email)')], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.drop_index('ix_customers_created_by_lower_email')
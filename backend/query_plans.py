@@ -0,0 +1,65 @@
+"""Query-plan inspection for the check-query-plans command.
+
+Statements are captured as the app executes them, then re-run under
+EXPLAIN with the same parameters to find tables read in full.
+"""
+import json
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# "SCAN customers" is a full table scan; "SCAN customers USING INDEX ..."
+# walks an index in order (and stops early under LIMIT), and virtual tables
+# are the FTS5 indexes themselves.
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+@contextmanager
+def capture_selects(engine):
+    """Collect (statement, parameters) of every SELECT run on ``engine``."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _postgres_seq_scans(plan):
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan.get('Alias') or plan['Relation Name']
+    for child in plan.get('Plans', []):
+        yield from _postgres_seq_scans(child)
+
+
+def explain_connection(engine):
+    """Open a connection to run full_scans() on.
+
+    On Postgres sequential scans are disabled for it, so a Seq Scan in a
+    plan means no index could serve the query at all, independent of table
+    size and statistics.
+    """
+    connection = engine.connect()
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET enable_seqscan = off')
+    return connection
+
+
+def full_scans(connection, statement, parameters):
+    """Names (or aliases) of the tables the plan of ``statement`` reads in full."""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        return [match.group(1) for match in (SQLITE_FULL_SCAN.match(row[3]) for row in rows) if match]
+    if dialect == 'postgresql':
+        plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return list(_postgres_seq_scans(plan[0]['Plan']))
+    raise ValueError(f'Unsupported dialect: {dialect}')
@@ -0,0 +1,140 @@
+"""Multi-stop route optimisation used by /api/route-planning.
+
+Routes are built on a haversine distance matrix with a nearest-neighbour
+tour, then improved with 2-opt and Or-opt moves until no move helps or the
+time budget runs out. The start node is always fixed; the route either ends
+at its last stop or returns to the start.
+"""
+import time
+
+import numpy as np
+
+from geo import haversine_matrix_km
+
+IMPROVEMENT_EPSILON = 1e-9
+
+
+def haversine_matrix(lats, lngs):
+    """Return the N x N great-circle distance matrix in kilometres."""
+    return haversine_matrix_km(lats, lngs, lats, lngs)
+
+
+def path_length(path, dist):
+    path = np.asarray(path)
+    return float(dist[path[:-1], path[1:]].sum())
+
+
+def nearest_neighbour(dist, start=0):
+    """Greedy tour over every node of ``dist`` starting at ``start``."""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    order = [start]
+    visited[start] = True
+    current = start
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[current])
+        current = int(row.argmin())
+        visited[current] = True
+        order.append(current)
+    return order
+
+
+def two_opt(path, dist, deadline):
+    """Reverse interior segments of ``path`` while that shortens it.
+
+    The first and last entries of ``path`` never move.
+    """
+    path = np.asarray(path)
+    last = len(path) - 2
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, last):
+            a, b = path[i - 1], path[i]
+            c = path[i + 1:last + 1]
+            d = path[i + 2:last + 2]
+            gains = dist[a, b] + dist[c, d] - dist[a, c] - dist[b, d]
+            j = int(gains.argmax())
+            if gains[j] > IMPROVEMENT_EPSILON:
+                j += i + 1
+                path[i:j + 1] = path[i:j + 1][::-1].copy()
+                improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return path
+
+
+def or_opt(path, dist, deadline, max_segment=3):
+    """Move runs of up to ``max_segment`` interior stops to a cheaper edge.
+
+    Each run may be inserted in either direction. The first and last
+    entries of ``path`` never move.
+    """
+    path = np.asarray(path)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for length in range(1, max_segment + 1):
+            i = 1
+            while i + length <= len(path) - 1:
+                prev, nxt = path[i - 1], path[i + length]
+                first, last = path[i], path[i + length - 1]
+                removal_gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+
+                rest = np.concatenate((path[:i], path[i + length:]))
+                u, v = rest[:-1], rest[1:]
+                forward = dist[u, first] + dist[last, v] - dist[u, v]
+                backward = dist[u, last] + dist[first, v] - dist[u, v]
+                # Re-inserting at the edge the run was cut from is a no-op
+                forward[i - 1] = backward[i - 1] = np.inf
+                k_forward, k_backward = int(forward.argmin()), int(backward.argmin())
+                if forward[k_forward] <= backward[k_backward]:
+                    k, cost, segment = k_forward, forward[k_forward], path[i:i + length]
+                else:
+                    k, cost, segment = k_backward, backward[k_backward], path[i:i + length][::-1]
+
+                if removal_gain - cost > IMPROVEMENT_EPSILON:
+                    path = np.concatenate((rest[:k + 1], segment, rest[k + 1:]))
+                    improved = True
+                else:
+                    i += 1
+                if time.perf_counter() >= deadline:
+                    return path
+    return path
+
+
+def plan_route(lats, lngs, return_to_start=False, time_budget=0.5):
+    """Order the stops 1..N-1 of ``lats``/``lngs`` into a short route from stop 0.
+
+    Returns a dict with the visiting ``order`` (node indices, excluding the
+    start), the per-leg ``legs_km`` along that order (plus the leg back to
+    the start when ``return_to_start``), the optimised ``distance_km`` and
+    the ``naive_distance_km`` of visiting the stops in their given order.
+    """
+    deadline = time.perf_counter() + time_budget
+    n = len(lats)
+    dist = haversine_matrix(lats, lngs)
+    if return_to_start:
+        end = 0
+    else:
+        # An open path is a closed tour through a dummy end node that is
+        # free to reach from everywhere, pinned at the last position.
+        dist = np.pad(dist, ((0, 1), (0, 1)))
+        end = n
+
+    naive = np.array(list(range(n)) + [end])
+    path = np.array(nearest_neighbour(dist[:n, :n]) + [end])
+    while time.perf_counter() < deadline:
+        length = path_length(path, dist)
+        path = two_opt(path, dist, deadline)
+        path = or_opt(path, dist, deadline)
+        if path_length(path, dist) >= length - IMPROVEMENT_EPSILON:
+            break
+
+    stops = path if return_to_start else path[:-1]
+    return {
+        'order': [int(node) for node in stops[1:-1 if return_to_start else None]],
+        'legs_km': [float(km) for km in dist[stops[:-1], stops[1:]]],
+        'distance_km': path_length(path, dist),
+        'naive_distance_km': path_length(naive, dist)
+    }
@@ -0,0 +1,142 @@
+"""Full-text search over customers and interaction notes.
+
+SQLite uses FTS5 tables that shadow ``customers`` and ``interactions``
+(external content, kept in sync by triggers). Postgres uses GIN indexes on
+``tsvector`` expressions of the base tables, so there is nothing to sync.
+Either way, rows written by any path, including bulk inserts, are
+searchable immediately.
+"""
+import re
+
+MAX_TERMS = 10
+
+# Weighted document per customer: name ranks above company, above contact details.
+POSTGRES_CUSTOMER_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(company, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(email, '') || ' ' || coalesce(phone, '')), 'C')"
+)
+POSTGRES_INTERACTION_DOCUMENT = "to_tsvector('simple', coalesce(note, ''))"
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5("
+    "name, company, email, phone, content='customers', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS customers_fts_insert AFTER INSERT ON customers BEGIN "
+    "INSERT INTO customers_fts(rowid, name, company, email, phone) "
+    "VALUES (new.id, new.name, new.company, new.email, new.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS customers_fts_delete AFTER DELETE ON customers BEGIN "
+    "INSERT INTO customers_fts(customers_fts, rowid, name, company, email, phone) "
+    "VALUES ('delete', old.id, old.name, old.company, old.email, old.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS customers_fts_update AFTER UPDATE OF name, company, email, phone ON customers BEGIN "
+    "INSERT INTO customers_fts(customers_fts, rowid, name, company, email, phone) "
+    "VALUES ('delete', old.id, old.name, old.company, old.email, old.phone); "
+    "INSERT INTO customers_fts(rowid, name, company, email, phone) "
+    "VALUES (new.id, new.name, new.company, new.email, new.phone); END",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS interactions_fts USING fts5("
+    "note, content='interactions', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS interactions_fts_insert AFTER INSERT ON interactions BEGIN "
+    "INSERT INTO interactions_fts(rowid, note) VALUES (new.id, new.note); END",
+    "CREATE TRIGGER IF NOT EXISTS interactions_fts_delete AFTER DELETE ON interactions BEGIN "
+    "INSERT INTO interactions_fts(interactions_fts, rowid, note) VALUES ('delete', old.id, old.note); END",
+    "CREATE TRIGGER IF NOT EXISTS interactions_fts_update AFTER UPDATE OF note ON interactions BEGIN "
+    "INSERT INTO interactions_fts(interactions_fts, rowid, note) VALUES ('delete', old.id, old.note); "
+    "INSERT INTO interactions_fts(rowid, note) VALUES (new.id, new.note); END",
+]
+SQLITE_REBUILD = [
+    "INSERT INTO customers_fts(customers_fts) VALUES ('rebuild')",
+    "INSERT INTO interactions_fts(interactions_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    "DROP TABLE IF EXISTS customers_fts",
+    "DROP TABLE IF EXISTS interactions_fts",
+]
+
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_customers_search ON customers USING gin (({POSTGRES_CUSTOMER_DOCUMENT}))",
+    f"CREATE INDEX IF NOT EXISTS ix_interactions_search ON interactions USING gin (({POSTGRES_INTERACTION_DOCUMENT}))",
+]
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Alembic autogenerate filter that leaves the search tables and indexes alone."""
+    if type_ == 'table' and (name.endswith('_fts') or '_fts_' in name):
+        return False
+    if type_ == 'index' and name in ('ix_customers_search', 'ix_interactions_search'):
+        return False
+    return True
+
+
+def search_terms(q):
+    """Split a user query into at most MAX_TERMS word tokens."""
+    return re.findall(r'\w+', q or '')[:MAX_TERMS]
+
+
+def match_expression(dialect, terms):
+    """All-terms prefix query: an FTS5 MATCH string or a to_tsquery string."""
+    if dialect == 'postgresql':
+        return ' & '.join(f'{term.lower()}:*' for term in terms)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def install(connection, rebuild=False):
+    """Create the search tables/indexes on ``connection`` if they are missing.
+
+    ``rebuild`` repopulates the SQLite FTS tables from the base tables, for
+    databases that had rows before search was installed.
+    """
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        statements = SQLITE_DDL + (SQLITE_REBUILD if rebuild else [])
+    elif dialect == 'postgresql':
+        statements = POSTGRES_DDL
+    else:
+        return
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def uninstall(connection):
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_DROP:
+            connection.exec_driver_sql(statement)
+
+
+def customer_query(dialect, scoped):
+    """SQL for ranked customer hits; binds :query, :limit, :offset and, if scoped, :user_id."""
+    scope = ' AND c.created_by = :user_id' if scoped else ''
+    if dialect == 'postgresql':
+        return (
+            "SELECT c.id, c.name, c.company, c.email, c.phone, c.stage, c.created_by, "
+            f"ts_rank({POSTGRES_CUSTOMER_DOCUMENT}, to_tsquery('simple', :query)) AS rank "
+            f"FROM customers c WHERE ({POSTGRES_CUSTOMER_DOCUMENT}) @@ to_tsquery('simple', :query){scope} "
+            "ORDER BY rank DESC, c.id LIMIT :limit OFFSET :offset"
+        )
+    return (
+        "SELECT c.id, c.name, c.company, c.email, c.phone, c.stage, c.created_by, "
+        "-bm25(customers_fts, 10.0, 5.0, 2.0, 2.0) AS rank "
+        "FROM customers_fts JOIN customers c ON c.id = customers_fts.rowid "
+        f"WHERE customers_fts MATCH :query{scope} "
+        "ORDER BY rank DESC, c.id LIMIT :limit OFFSET :offset"
+    )
+
+
+def interaction_query(dialect, scoped):
+    """SQL for ranked interaction hits with a highlighted snippet of the note."""
+    scope = ' AND i.user_id = :user_id' if scoped else ''
+    if dialect == 'postgresql':
+        return (
+            "SELECT i.id, i.customer_id, i.user_id, i.type, i.timestamp, "
+            "ts_headline('simple', i.note, to_tsquery('simple', :query), "
+            "'StartSel=[, StopSel=], MaxWords=20, MinWords=5') AS snippet, "
+            f"ts_rank({POSTGRES_INTERACTION_DOCUMENT}, to_tsquery('simple', :query)) AS rank "
+            f"FROM interactions i WHERE ({POSTGRES_INTERACTION_DOCUMENT}) @@ to_tsquery('simple', :query){scope} "
+            "ORDER BY rank DESC, i.id LIMIT :limit OFFSET :offset"
+        )
+    return (
+        "SELECT i.id, i.customer_id, i.user_id, i.type, i.timestamp, "
+        "snippet(interactions_fts, 0, '[', ']', '...', 20) AS snippet, "
+        "-bm25(interactions_fts) AS rank "
+        "FROM interactions_fts JOIN interactions i ON i.id = interactions_fts.rowid "
+        f"WHERE interactions_fts MATCH :query{scope} "
+        "ORDER BY rank DESC, i.id LIMIT :limit OFFSET :offset"
+    )
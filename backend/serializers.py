@@ -0,0 +1,69 @@
+"""JSON encoding for API responses and exports.
+
+orjson is used when it is installed and the standard json module otherwise;
+both give the same document. Datetimes are written as
+``YYYY-MM-DD HH:MM:SS``, the format the API has always used, so handlers
+can hand over selected rows without formatting them first.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        # Same as strftime('%Y-%m-%d %H:%M:%S') for the naive UTC values stored
+        return value.isoformat(' ', 'seconds')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """Encode ``obj`` as UTF-8 JSON bytes."""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(obj):
+        """Encode ``obj`` as UTF-8 JSON bytes."""
+        return _encoder.encode(obj).encode('utf-8')
+
+    loads = json.loads
+
+
+def records(fields, rows):
+    """Dicts of ``fields`` from row tuples (extra trailing columns are ignored)."""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider (jsonify, request.get_json) backed by dumps/loads."""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
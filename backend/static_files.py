@@ -0,0 +1,152 @@
+"""Serving the React build with precompressed variants and cache headers.
+
+Next to every compressible file of the build a ``.gz`` and, when the
+brotli package is installed, a ``.br`` copy is written once by
+``flask precompress-static`` at build time, and each request gets the
+smallest variant its Accept-Encoding allows. Compressing on first use
+instead is opt-in and uses faster, lighter settings, since it runs inside
+that request.
+Fingerprinted assets (``main.3f2a1b9c.js``) are cached for a year as
+immutable; everything else, index.html included, is revalidated by ETag.
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+from flask import request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_EXTENSIONS = ('.html', '.js', '.mjs', '.css', '.json', '.map', '.svg', '.txt', '.xml', '.ico', '.webmanifest')
+# Smaller files gain too little to be worth a second round trip through the variant lookup
+MIN_COMPRESS_BYTES = 1024
+# main.3f2a1b9c.js, 453.9c1e4a2b.chunk.js, logo.6ce24c58023cc2f8fd88fe9d219db6c6.svg
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{8,}\.(?:chunk\.)?[A-Za-z0-9]+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Content-Encoding token and file suffix, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Brotli quality and gzip level: the best at build time, fast enough for a request otherwise
+BUILD_LEVELS = {'br': 11, 'gzip': 9}
+RUNTIME_LEVELS = {'br': 5, 'gzip': 6}
+
+
+def _write_atomic(path, data, mode):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.precompress-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class StaticBuild:
+    """Index of the files in ``root`` and their compressed variants.
+
+    With ``precompress`` false only variants already on disk are used;
+    otherwise missing or stale ones are written at ``levels``.
+    """
+
+    def __init__(self, root, precompress=False, levels=RUNTIME_LEVELS):
+        self.root = root
+        self.precompress = precompress
+        self.levels = levels
+        self._variants = None
+        self._lock = threading.Lock()
+
+    def _compress(self, path, stat):
+        """Write missing or stale variants of ``path``; return the encodings available."""
+        encodings = {}
+        data = None
+        for encoding, suffix in ENCODINGS:
+            if encoding == 'br' and brotli is None:
+                continue
+            variant = path + suffix
+            try:
+                fresh = os.stat(variant).st_mtime >= stat.st_mtime
+            except OSError:
+                fresh = False
+            if not fresh:
+                if not self.precompress:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                if encoding == 'br':
+                    compressed = brotli.compress(data, quality=self.levels['br'])
+                else:
+                    compressed = gzip.compress(data, self.levels['gzip'], mtime=0)
+                if len(compressed) >= stat.st_size:
+                    continue
+                try:
+                    _write_atomic(variant, compressed, stat.st_mode & 0o777)
+                except OSError:
+                    logger.warning('Cannot write %s; serving it uncompressed', variant)
+                    continue
+            encodings[encoding] = variant
+        return encodings
+
+    def scan(self):
+        """Precompress the build (as configured) and index the variants; returns the index."""
+        variants = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+                    continue
+                path = os.path.join(directory, filename)
+                stat = os.stat(path)
+                if stat.st_size < MIN_COMPRESS_BYTES:
+                    continue
+                encodings = self._compress(path, stat)
+                if encodings:
+                    variants[os.path.relpath(path, self.root).replace(os.sep, '/')] = encodings
+        return variants
+
+    def variants(self, filename):
+        if self._variants is None:
+            with self._lock:
+                if self._variants is None:
+                    self._variants = self.scan() if os.path.isdir(self.root) else {}
+        return self._variants.get(filename, {})
+
+    def exists(self, filename):
+        path = safe_join(self.root, filename)
+        return path is not None and os.path.isfile(path)
+
+    def send(self, filename):
+        """Response for ``filename`` (relative to the build root), which must exist."""
+        path = safe_join(self.root, filename)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encodings = self.variants(filename)
+        encoding = None
+        for candidate, _ in ENCODINGS:
+            if candidate in encodings and request.accept_encodings[candidate]:
+                encoding = candidate
+                path = encodings[candidate]
+                break
+
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.content_encoding = encoding
+        if FINGERPRINTED.search(filename):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
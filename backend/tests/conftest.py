@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+import pytest
+
+# app reads its configuration at import time, so point it at a scratch
+# database before any test imports it
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='crm-tests-'), 'crm.db')
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    with app.app.app_context():
+        app.db.create_all()
+    return app
+
+
+@pytest.fixture
+def app_context(app_module):
+    with app_module.app.app_context():
+        yield app_module
+        app_module.db.session.rollback()
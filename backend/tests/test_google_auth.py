@@ -0,0 +1,159 @@
+"""Local verification of Google ID tokens against a generated JWKS."""
+import json
+import time
+
+import jwt
+import pytest
+import requests
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+from google_auth import GoogleKeySet
+
+CLIENT_ID = 'client-id.apps.googleusercontent.com'
+
+
+def generate_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk.update(kid=kid, alg='RS256', use='sig')
+    return private_key, jwk
+
+
+@pytest.fixture(scope='module')
+def signing_key():
+    return generate_key('key-1')
+
+
+@pytest.fixture(scope='module')
+def jwks(signing_key):
+    return {'keys': [signing_key[1]]}
+
+
+def id_token(signing_key, kid='key-1', **overrides):
+    now = int(time.time())
+    claims = {
+        'iss': 'https://accounts.google.com',
+        'aud': CLIENT_ID,
+        'sub': '1234567890',
+        'email': 'rep@example.com',
+        'iat': now,
+        'exp': now + 3600,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, signing_key[0], algorithm='RS256', headers={'kid': kid})
+
+
+class FakeResponse:
+    def __init__(self, jwks, max_age):
+        self._jwks = jwks
+        self.headers = {'Cache-Control': f'public, max-age={max_age}, must-revalidate'}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._jwks
+
+
+class FakeSession:
+    """Serves ``jwks`` like Google's certs endpoint, or fails if ``jwks`` is None."""
+
+    def __init__(self, jwks=None, max_age=3600):
+        self.jwks = jwks
+        self.max_age = max_age
+        self.requests = 0
+
+    def get(self, url, timeout=None):
+        self.requests += 1
+        if self.jwks is None:
+            raise requests.ConnectionError('offline')
+        return FakeResponse(self.jwks, self.max_age)
+
+
+def test_valid_token(jwks, signing_key):
+    claims = GoogleKeySet.from_jwks(jwks).verify(id_token(signing_key), audience=CLIENT_ID)
+    assert claims['email'] == 'rep@example.com'
+    assert claims['sub'] == '1234567890'
+
+
+def test_audience_mismatch(jwks, signing_key):
+    token = id_token(signing_key, aud='someone-else.apps.googleusercontent.com')
+    with pytest.raises(jwt.InvalidAudienceError):
+        GoogleKeySet.from_jwks(jwks).verify(token, audience=CLIENT_ID)
+
+
+def test_expired_token(jwks, signing_key):
+    token = id_token(signing_key, iat=int(time.time()) - 7200, exp=int(time.time()) - 3600)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        GoogleKeySet.from_jwks(jwks).verify(token, audience=CLIENT_ID)
+
+
+def test_bad_issuer(jwks, signing_key):
+    token = id_token(signing_key, iss='https://evil.example.com')
+    with pytest.raises(jwt.InvalidIssuerError):
+        GoogleKeySet.from_jwks(jwks).verify(token, audience=CLIENT_ID)
+
+
+def test_unknown_kid(jwks, signing_key):
+    with pytest.raises(jwt.InvalidTokenError, match='Unknown signing key'):
+        GoogleKeySet.from_jwks(jwks).verify(id_token(signing_key, kid='key-2'), audience=CLIENT_ID)
+
+
+def test_signed_by_another_key(jwks):
+    other_key = generate_key('key-1')
+    with pytest.raises(jwt.InvalidSignatureError):
+        GoogleKeySet.from_jwks(jwks).verify(id_token(other_key), audience=CLIENT_ID)
+
+
+def test_from_file(tmp_path, jwks, signing_key):
+    path = tmp_path / 'jwks.json'
+    path.write_text(json.dumps(jwks))
+    claims = GoogleKeySet.from_file(str(path)).verify(id_token(signing_key), audience=CLIENT_ID)
+    assert claims['aud'] == CLIENT_ID
+
+
+def test_keys_are_fetched_once_and_reloaded_from_the_disk_cache(tmp_path, jwks, signing_key):
+    cache_path = str(tmp_path / 'google-jwks.json')
+    session = FakeSession(jwks)
+    keys = GoogleKeySet(url='https://jwks.example', cache_path=cache_path, session=session)
+    keys.verify(id_token(signing_key), audience=CLIENT_ID)
+    keys.verify(id_token(signing_key), audience=CLIENT_ID)
+    assert session.requests == 1
+
+    # A new process verifies from the cache file without going to the network
+    offline = FakeSession()
+    reloaded = GoogleKeySet(url='https://jwks.example', cache_path=cache_path, session=offline)
+    assert reloaded.verify(id_token(signing_key), audience=CLIENT_ID)['sub'] == '1234567890'
+    assert offline.requests == 0
+
+
+def test_expired_disk_cache_is_refreshed(tmp_path, jwks, signing_key):
+    cache_path = tmp_path / 'google-jwks.json'
+    cache_path.write_text(json.dumps({'jwks': jwks, 'fetched_at': 0, 'expires_at': 1}))
+    session = FakeSession(jwks)
+    keys = GoogleKeySet(url='https://jwks.example', cache_path=str(cache_path), session=session)
+    keys.verify(id_token(signing_key), audience=CLIENT_ID)
+    assert session.requests == 1
+    assert json.loads(cache_path.read_text())['expires_at'] > time.time()
+
+
+def test_stale_keys_are_used_when_a_refresh_fails(tmp_path, jwks, signing_key):
+    cache_path = tmp_path / 'google-jwks.json'
+    cache_path.write_text(json.dumps({'jwks': jwks, 'fetched_at': 0, 'expires_at': 1}))
+    offline = FakeSession()
+    keys = GoogleKeySet(url='https://jwks.example', cache_path=str(cache_path), session=offline)
+    assert keys.verify(id_token(signing_key), audience=CLIENT_ID)['sub'] == '1234567890'
+    assert offline.requests == 1
+
+
+def test_rotated_key_triggers_a_refresh(jwks, signing_key):
+    new_key = generate_key('key-2')
+    session = FakeSession(jwks)
+    keys = GoogleKeySet(url='https://jwks.example', session=session, min_refresh_interval=0)
+    keys.verify(id_token(signing_key), audience=CLIENT_ID)
+
+    session.jwks = {'keys': [signing_key[1], new_key[1]]}
+    claims = keys.verify(id_token(new_key, kid='key-2'), audience=CLIENT_ID)
+    assert claims['email'] == 'rep@example.com'
+    assert session.requests == 2
@@ -0,0 +1,168 @@
+"""Outbox delivery through SMTPPool against a local aiosmtpd relay."""
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from mailer import SMTPPool
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Relay:
+    """Accepts mail, except for recipients in ``refused`` and while ``data_reply`` is set."""
+
+    def __init__(self):
+        self.messages = []
+        self.peers = set()
+        self.refused = set()
+        self.data_reply = None
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return '550 5.1.1 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.data_reply:
+            return self.data_reply
+        self.messages.append(envelope)
+        self.peers.add(session.peer)
+        return '250 Message accepted for delivery'
+
+
+@pytest.fixture
+def relay():
+    handler = Relay()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield handler, controller
+    controller.stop()
+
+
+@pytest.fixture
+def outbox(app_context, relay, monkeypatch):
+    app = app_context
+    _, controller = relay
+    pool = SMTPPool(controller.hostname, controller.port, security='none', timeout=5)
+    monkeypatch.setattr(app, 'smtp_pool', pool)
+    monkeypatch.setattr(app, 'EMAIL_FROM', 'crm@example.com')
+    yield app
+    pool.close()
+    app.EmailOutbox.query.delete()
+    app.db.session.commit()
+
+
+def enqueue(app, *recipients):
+    for recipient in recipients:
+        app.enqueue_email(recipient, 'Hello', 'Body')
+    app.db.session.commit()
+    return [email.id for email in app.EmailOutbox.query.order_by(app.EmailOutbox.id)]
+
+
+def email(app, email_id):
+    app.db.session.expire_all()
+    return app.db.session.get(app.EmailOutbox, email_id)
+
+
+def make_due(app, email_id):
+    email(app, email_id).next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    app.db.session.commit()
+
+
+def test_delivers_pending_mail_over_one_connection(outbox, relay):
+    handler, _ = relay
+    ids = enqueue(outbox, 'a@example.com', 'b@example.com')
+
+    assert outbox.deliver_due_emails() == 2
+
+    for email_id in ids:
+        sent = email(outbox, email_id)
+        assert sent.status == 'sent'
+        assert sent.attempts == 1
+        assert sent.sent_at is not None
+        assert sent.last_error is None
+    assert [envelope.rcpt_tos for envelope in handler.messages] == [['a@example.com'], ['b@example.com']]
+    assert all(envelope.mail_from == 'crm@example.com' for envelope in handler.messages)
+    # The second message reused the pooled connection
+    assert len(handler.peers) == 1
+    # Nothing is due any more
+    assert outbox.deliver_due_emails() == 0
+
+
+def test_refused_recipient_fails_without_retry(outbox, relay):
+    handler, _ = relay
+    handler.refused.add('nobody@example.com')
+    [email_id] = enqueue(outbox, 'nobody@example.com')
+
+    assert outbox.deliver_due_emails() == 1
+
+    failed = email(outbox, email_id)
+    assert failed.status == 'failed'
+    assert failed.attempts == 1
+    assert '550' in failed.last_error
+    assert handler.messages == []
+
+
+def test_temporary_errors_retry_until_max_attempts(outbox, relay, monkeypatch):
+    handler, _ = relay
+    monkeypatch.setattr(outbox, 'EMAIL_MAX_ATTEMPTS', 3)
+    handler.data_reply = '451 4.3.0 Try again later'
+    [email_id] = enqueue(outbox, 'a@example.com')
+
+    assert outbox.deliver_due_emails() == 1
+    pending = email(outbox, email_id)
+    assert pending.status == 'pending'
+    assert pending.attempts == 1
+    assert '451' in pending.last_error
+    # Backed off, so not due again yet
+    assert pending.next_attempt_at > datetime.utcnow()
+    assert outbox.deliver_due_emails() == 0
+
+    make_due(outbox, email_id)
+    assert outbox.deliver_due_emails() == 1
+    assert email(outbox, email_id).status == 'pending'
+    assert email(outbox, email_id).attempts == 2
+
+    make_due(outbox, email_id)
+    assert outbox.deliver_due_emails() == 1
+    failed = email(outbox, email_id)
+    assert failed.status == 'failed'
+    assert failed.attempts == 3
+    assert handler.messages == []
+
+
+def test_recovers_once_the_relay_accepts_again(outbox, relay):
+    handler, _ = relay
+    handler.data_reply = '451 4.3.0 Try again later'
+    [email_id] = enqueue(outbox, 'a@example.com')
+    assert outbox.deliver_due_emails() == 1
+
+    handler.data_reply = None
+    make_due(outbox, email_id)
+    assert outbox.deliver_due_emails() == 1
+
+    sent = email(outbox, email_id)
+    assert sent.status == 'sent'
+    assert sent.attempts == 2
+    assert sent.last_error is None
+    assert len(handler.messages) == 1
+
+
+def test_unreachable_relay_is_retried(outbox, monkeypatch):
+    # Nothing listens on a freshly freed port
+    monkeypatch.setattr(outbox, 'smtp_pool', SMTPPool('127.0.0.1', free_port(), security='none', timeout=5))
+    [email_id] = enqueue(outbox, 'a@example.com')
+
+    assert outbox.deliver_due_emails() == 1
+
+    pending = email(outbox, email_id)
+    assert pending.status == 'pending'
+    assert pending.attempts == 1
+    assert pending.last_error
@@ -0,0 +1,68 @@
+"""User cache invalidation across processes, through the live broker."""
+import pytest
+from werkzeug.security import generate_password_hash
+
+from live import Broadcast, LocalBroker
+
+
+class RecordingBroker(LocalBroker):
+    """Delivers locally like LocalBroker and remembers what other processes would receive."""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, items, dispatch):
+        self.published.extend(items)
+        dispatch(items)
+
+
+@pytest.fixture
+def users(app_context, monkeypatch):
+    app = app_context
+    broker = RecordingBroker()
+    monkeypatch.setattr(app, 'user_invalidations', Broadcast(broker, app.drop_cached_users))
+    user = app.User(name='Admin', email='cache-admin@example.com', role='admin',
+                    password_hash=generate_password_hash('secret'))
+    app.db.session.add(user)
+    app.db.session.commit()
+    broker.published.clear()
+    yield app, user.id, broker
+    app.User.query.filter_by(email='cache-admin@example.com').delete()
+    app.db.session.commit()
+    app.user_cache.clear()
+
+
+def test_committed_role_change_is_broadcast(users):
+    app, user_id, broker = users
+    stale = app.load_user(user_id)
+    assert stale.role == 'admin'
+
+    app.db.session.get(app.User, user_id).role = 'sales_rep'
+    app.db.session.flush()
+    # Read before the commit, as another worker could; only the broadcast drops it
+    app.user_cache.set(user_id, stale)
+    app.db.session.commit()
+
+    assert broker.published == [(user_id, None)]
+    assert app.load_user(user_id).role == 'sales_rep'
+
+
+def test_deleted_user_is_broadcast(users):
+    app, user_id, broker = users
+    app.load_user(user_id)
+    app.db.session.delete(app.db.session.get(app.User, user_id))
+    app.db.session.commit()
+
+    assert broker.published == [(user_id, None)]
+    assert app.load_user(user_id) is None
+
+
+def test_rolled_back_change_is_not_broadcast(users):
+    app, user_id, broker = users
+    app.db.session.get(app.User, user_id).role = 'sales_rep'
+    app.db.session.flush()
+    app.db.session.rollback()
+    app.db.session.commit()
+
+    assert broker.published == []
+    assert app.load_user(user_id).role == 'admin'
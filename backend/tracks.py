@@ -0,0 +1,143 @@
+"""GPS track simplification and compact encoding.
+
+Tracks are lists of (latitude, longitude, timestamp) tuples ordered by
+time. They are thinned with a min-distance/min-time filter, simplified with
+Douglas-Peucker, and stored as Google encoded polylines with a parallel
+delta-encoded list of seconds since the start of the day.
+"""
+import math
+
+import numpy as np
+
+from geo import EARTH_RADIUS_KM
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+
+
+def _project(points):
+    """Project (lat, lng, ...) points onto a local plane in metres."""
+    lats = np.radians([p[0] for p in points])
+    lngs = np.radians([p[1] for p in points])
+    x = EARTH_RADIUS_M * lngs * math.cos(float(lats.mean()))
+    y = EARTH_RADIUS_M * lats
+    return x, y
+
+
+def thin(points, min_distance_m, min_interval_s):
+    """Drop fixes that add neither min_distance_m of movement nor min_interval_s of time.
+
+    The first and last points are always kept, so dwell time survives.
+    """
+    if len(points) <= 2:
+        return list(points)
+    x, y = _project(points)
+    kept = [0]
+    for i in range(1, len(points) - 1):
+        last = kept[-1]
+        moved = math.hypot(x[i] - x[last], y[i] - y[last])
+        waited = (points[i][2] - points[last][2]).total_seconds()
+        if moved >= min_distance_m or waited >= min_interval_s:
+            kept.append(i)
+    kept.append(len(points) - 1)
+    return [points[i] for i in kept]
+
+
+def douglas_peucker(points, tolerance_m):
+    """Simplify a track so no dropped point is over tolerance_m from the result."""
+    if len(points) <= 2 or tolerance_m <= 0:
+        return list(points)
+    x, y = _project(points)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dx * py - dy * px) / length
+        index = int(distances.argmax())
+        if distances[index] > tolerance_m:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify(points, tolerance_m, min_distance_m=0, min_interval_s=0):
+    if min_distance_m or min_interval_s:
+        points = thin(points, min_distance_m, min_interval_s)
+    return douglas_peucker(points, tolerance_m)
+
+
+def _encode_signed(value, chunks):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+
+def _decode_signed(encoded):
+    index = 0
+    while index < len(encoded):
+        result = 0
+        shift = 0
+        while True:
+            byte = ord(encoded[index]) - 63
+            index += 1
+            result |= (byte & 0x1f) << shift
+            shift += 5
+            if byte < 0x20:
+                break
+        yield ~(result >> 1) if result & 1 else result >> 1
+
+
+def encode_values(values):
+    """Delta-encode integers with the polyline algorithm's varint scheme."""
+    chunks = []
+    previous = 0
+    for value in values:
+        _encode_signed(value - previous, chunks)
+        previous = value
+    return ''.join(chunks)
+
+
+def decode_values(encoded):
+    values = []
+    previous = 0
+    for delta in _decode_signed(encoded):
+        previous += delta
+        values.append(previous)
+    return values
+
+
+def encode_polyline(coordinates, precision=5):
+    """Google encoded polyline of (lat, lng) pairs."""
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lng = 0
+    for lat, lng in coordinates:
+        lat, lng = round(lat * factor), round(lng * factor)
+        _encode_signed(lat - previous_lat, chunks)
+        _encode_signed(lng - previous_lng, chunks)
+        previous_lat, previous_lng = lat, lng
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded, precision=5):
+    factor = 10 ** precision
+    deltas = list(_decode_signed(encoded))
+    coordinates = []
+    lat = lng = 0
+    for i in range(0, len(deltas), 2):
+        lat += deltas[i]
+        lng += deltas[i + 1]
+        coordinates.append((lat / factor, lng / factor))
+    return coordinates
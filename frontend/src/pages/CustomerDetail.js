@@ -22,6 +22,8 @@ const CustomerDetail = () => {
   
   const [customer, setCustomer] = useState(null);
   const [interactions, setInteractions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [showInteractionModal, setShowInteractionModal] = useState(false);
@@ -77,8 +79,9 @@ const CustomerDetail = () => {
     try {
       setLoading(true);
       
-      // Get customer details
-      const customerResponse = await customerService.getCustomer(id);
+      // Customer details and the latest interactions in one request
+      const timeline = await customerService.getCustomerTimeline(id);
+      const customerResponse = timeline.customer;
       setCustomer(customerResponse);
       setCustomerData({
         name: customerResponse.name || '',
@@ -90,9 +93,8 @@ const CustomerDetail = () => {
         lng: customerResponse.lng
       });
       
-      // Get customer interactions
-      const interactionsResponse = await interactionService.getInteractions(id);
-      setInteractions(interactionsResponse);
+      setInteractions(timeline.interactions);
+      setNextCursor(timeline.next_cursor);
       
       setLoading(false);
     } catch (error) {
@@ -102,6 +104,27 @@ const CustomerDetail = () => {
     }
   };
   
+  // Reload the first page of interactions, e.g. after adding or deleting one
+  const refreshInteractions = async () => {
+    const timeline = await customerService.getCustomerTimeline(id);
+    setInteractions(timeline.interactions);
+    setNextCursor(timeline.next_cursor);
+  };
+  
+  const loadMoreInteractions = async () => {
+    try {
+      setLoadingMore(true);
+      const timeline = await customerService.getCustomerTimeline(id, { cursor: nextCursor });
+      setInteractions(prevState => [...prevState, ...timeline.interactions]);
+      setNextCursor(timeline.next_cursor);
+    } catch (error) {
+      console.error('Error fetching interactions:', error);
+      setError('Failed to load interactions');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+  
   const handleInteractionChange = (e) => {
     const { name, value } = e.target;
     setInteractionData(prevState => ({
@@ -134,8 +157,7 @@ const CustomerDetail = () => {
       });
       
       // Refresh interactions
-      const interactionsResponse = await interactionService.getInteractions(id);
-      setInteractions(interactionsResponse);
+      await refreshInteractions();
     } catch (error) {
       console.error('Error creating interaction:', error);
       setError('Failed to create interaction');
@@ -147,8 +169,7 @@ const CustomerDetail = () => {
       try {
         await interactionService.deleteInteraction(interactionId);
         // Refresh interactions
-        const interactionsResponse = await interactionService.getInteractions(id);
-        setInteractions(interactionsResponse);
+        await refreshInteractions();
       } catch (error) {
         console.error('Error deleting interaction:', error);
         setError('Failed to delete interaction');
@@ -445,6 +466,13 @@ const CustomerDetail = () => {
                   </tbody>
                 </Table>
               )}
+              {nextCursor && (
+                <div className="text-center">
+                  <Button variant="outline-secondary" size="sm" onClick={loadMoreInteractions} disabled={loadingMore}>
+                    {loadingMore ? 'Loading...' : 'Load older interactions'}
+                  </Button>
+                </div>
+              )}
             </Card.Body>
           </Card>
         </Tab>
@@ -16,7 +16,8 @@ const Dashboard = () => {
     recent_customers_count: 0,
     recent_interactions_count: 0,
     conversion_rate: 0,
-    avg_interactions_per_customer: 0
+    avg_interactions_per_customer: 0,
+    avg_days_to_close: null
   });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
@@ -229,6 +230,13 @@ const Dashboard = () => {
                   ></div>
                 </div>
               </div>
+
+              <div className="mb-3">
+                <div className="d-flex justify-content-between align-items-center">
+                  <span>Avg Days to Close</span>
+                  <Badge bg="secondary">{analytics.avg_days_to_close ?? '-'}</Badge>
+                </div>
+              </div>
               
               <div className="text-center mt-3">
                 <Link to="/customers" className="btn btn-outline-primary btn-sm">
@@ -38,6 +38,8 @@ const Locations = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [selectedDistance, setSelectedDistance] = useState(null);
+  // Distance from the current location to each customer, keyed by customer id
+  const [customerDistances, setCustomerDistances] = useState({});
   
   useEffect(() => {
     const fetchData = async () => {
@@ -58,10 +60,6 @@ const Locations = () => {
         const customersWithLocation = customersData.filter(c => c.lat && c.lng);
         setCustomers(customersWithLocation);
         
-        // Get other sales reps locations
-        const salesRepsData = await locationService.getLocations();
-        setSalesReps(salesRepsData);
-        
         setLoading(false);
       } catch (error) {
         console.error('Error fetching location data:', error);
@@ -86,23 +84,71 @@ const Locations = () => {
     
     fetchData();
     
+    // Sales reps' locations, kept live by the server
+    const unsubscribe = locationService.subscribeToLocations(
+      setSalesReps,
+      updates => setSalesReps(prevState => {
+        const byUser = new Map(prevState.map(rep => [rep.user_id, rep]));
+        updates.forEach(update => {
+          const current = byUser.get(update.user_id);
+          if (!current || update.timestamp >= current.timestamp) {
+            byUser.set(update.user_id, update);
+          }
+        });
+        return Array.from(byUser.values());
+      })
+    );
+    
     // Set up interval to update locations
     const trackingId = locationService.startLocationTracking(location => {
       setCurrentLocation(location);
     }, 60000); // Update every minute
     
     return () => {
+      unsubscribe();
       locationService.stopLocationTracking(trackingId);
     };
   }, []);
   
+  // Price every customer with one matrix request whenever we move
+  useEffect(() => {
+    if (!currentLocation || customers.length === 0) {
+      return;
+    }
+    const origin = { lat: currentLocation.latitude, lng: currentLocation.longitude };
+    const destinations = customers.map(c => ({ lat: c.lat, lng: c.lng }));
+    locationService.getDistanceMatrix([origin], destinations)
+      .then(({ distances_km, durations_minutes }) => {
+        const distances = {};
+        customers.forEach((customer, i) => {
+          const minutes = durations_minutes[0][i];
+          distances[customer.id] = {
+            distance_km: distances_km[0][i],
+            distance_mi: distances_km[0][i] / 1.609344,
+            estimated_time_minutes: minutes,
+            estimated_time_text: minutes >= 60 ? `${Math.floor(minutes / 60)}h ${minutes % 60}m` : `${minutes}m`
+          };
+        });
+        setCustomerDistances(distances);
+      })
+      .catch(error => console.error('Error calculating distances:', error));
+  }, [currentLocation, customers]);
+
   const calculateDistance = async (customer) => {
     try {
       if (!currentLocation) {
         setError('Your location is not available');
         return;
       }
-      
+
+      if (customerDistances[customer.id]) {
+        setSelectedDistance({
+          customer,
+          distance: customerDistances[customer.id]
+        });
+        return;
+      }
+
       const result = await locationService.calculateDistance(
         currentLocation.latitude,
         currentLocation.longitude,
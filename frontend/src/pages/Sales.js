@@ -83,15 +83,15 @@ const Sales = () => {
     const destColumn = columns[destination.droppableId];
     const customer = sourceColumn.items[source.index];
     
-    // Update the customer's stage
+    // Move the card right away, then save; reload only if saving fails
+    const stage = destination.droppableId;
+    setCustomers(prevState => prevState.map(c => (c.id === customer.id ? { ...c, stage } : c)));
     try {
-      await customerService.updateCustomerStage(customer.id, destination.droppableId);
-      
-      // Refresh customers
-      fetchCustomers();
+      await customerService.updateCustomerStages([customer.id], stage);
     } catch (error) {
       console.error('Error updating customer stage:', error);
       setError('Failed to update customer stage');
+      fetchCustomers();
     }
   };
   
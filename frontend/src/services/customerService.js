@@ -8,14 +8,16 @@ import axios from 'axios';
 //     throw error;
 //   }
 // };
-const getCustomers = async () => {
+// Fetch a single page of customers. `params` may carry limit, cursor,
+// stage, company, created_by and fields; the cursor for the next page is
+// returned alongside the rows (null on the last page).
+const getCustomersPage = async (params = {}) => {
   try {
-    console.log('🔍 CustomerService: Making request to /api/customers');
-    console.log('🔍 CustomerService: Auth header:', axios.defaults.headers.common['Authorization'] ? 'Present' : 'Missing');
-    
-    const response = await axios.get('/api/customers');
-    console.log('✅ CustomerService: Customers fetched successfully:', response.data);
-    return response.data;
+    const response = await axios.get('/api/customers', { params });
+    return {
+      customers: response.data,
+      nextCursor: response.headers['x-next-cursor'] || null
+    };
   } catch (error) {
     let message = 'Failed to fetch customers';
     if (error.response && error.response.data && error.response.data.message) {
@@ -25,6 +27,22 @@ const getCustomers = async () => {
   }
 };
 
+// Fetch every customer matching `params` by following the pagination cursor.
+const getCustomers = async (params = {}) => {
+  console.log('🔍 CustomerService: Making request to /api/customers');
+  console.log('🔍 CustomerService: Auth header:', axios.defaults.headers.common['Authorization'] ? 'Present' : 'Missing');
+
+  const customers = [];
+  let cursor = null;
+  do {
+    const page = await getCustomersPage(cursor ? { ...params, cursor } : params);
+    customers.push(...page.customers);
+    cursor = page.nextCursor;
+  } while (cursor);
+  console.log('✅ CustomerService: Customers fetched successfully:', customers);
+  return customers;
+};
+
 
 const getCustomer = async (id) => {
   try {
@@ -39,6 +57,21 @@ const getCustomer = async (id) => {
   }
 };
 
+// The customer plus one page of its interactions, newest first. `params`
+// may carry limit and cursor; `next_cursor` is null on the last page.
+const getCustomerTimeline = async (id, params = {}) => {
+  try {
+    const response = await axios.get(`/api/customers/${id}/timeline`, { params });
+    return response.data;
+  } catch (error) {
+    let message = 'Failed to fetch customer';
+    if (error.response && error.response.data && error.response.data.message) {
+      message = error.response.data.message;
+    }
+    throw new Error(message);
+  }
+};
+
 const createCustomer = async (customerData) => {
   try {
     const response = await axios.post('/api/customers', customerData);
@@ -91,13 +124,58 @@ const updateCustomerStage = async (id, stage) => {
   }
 };
 
+// Apply several customer/interaction creates, updates and deletes in one
+// request and transaction. Each operation is { type, op, id, data }; the
+// per-operation results come back in order. If any operation fails nothing
+// is applied, and the error carries those results.
+const batchMutations = async (operations) => {
+  try {
+    const response = await axios.post('/api/batch', { operations });
+    return response.data.results;
+  } catch (error) {
+    let message = 'Failed to save changes';
+    if (error.response && error.response.data && error.response.data.message) {
+      message = error.response.data.message;
+    }
+    const batchError = new Error(message);
+    batchError.results = error.response && error.response.data ? error.response.data.results : undefined;
+    throw batchError;
+  }
+};
+
+// Move several customers to `stage` with a single request.
+const updateCustomerStages = (ids, stage) => batchMutations(
+  ids.map(id => ({ type: 'customer', op: 'update', id, data: { stage } }))
+);
+
+// Ranked full-text search. `params` may carry type (all, customers or
+// interactions), limit and offset; the response has `customers`,
+// `interactions` and `next_offset` (null on the last page).
+const searchCustomers = async (q, params = {}) => {
+  try {
+    const response = await axios.get('/api/search', { params: { ...params, q } });
+    return response.data;
+  } catch (error) {
+    let message = 'Failed to search';
+    if (error.response && error.response.data && error.response.data.message) {
+      message = error.response.data.message;
+    }
+    throw new Error(message);
+  }
+};
+
 const customerService = {
   getCustomers,
+  getCustomersPage,
   getCustomer,
+  getCustomerTimeline,
   createCustomer,
   updateCustomer,
   deleteCustomer,
-  updateCustomerStage
+  updateCustomerStage,
+  updateCustomerStages,
+  batchMutations,
+  searchCustomers
 };
 
 export default customerService; 
\ No newline at end of file
@@ -1,8 +1,22 @@
 import axios from 'axios';
 
-const updateLocation = async (latitude, longitude) => {
+const updateLocation = async (latitude, longitude, timestamp = new Date().toISOString()) => {
   try {
-    const response = await axios.post('/api/locations', { latitude, longitude });
+    const response = await axios.post('/api/locations', { latitude, longitude, timestamp });
+    return response.data;
+  } catch (error) {
+    let message = 'Failed to update location';
+    if (error.response && error.response.data && error.response.data.message) {
+      message = error.response.data.message;
+    }
+    throw new Error(message);
+  }
+};
+
+// Send several timestamped fixes ({ latitude, longitude, timestamp }) at once
+const updateLocations = async (fixes) => {
+  try {
+    const response = await axios.post('/api/locations', { fixes });
     return response.data;
   } catch (error) {
     let message = 'Failed to update location';
@@ -39,6 +53,22 @@ const calculateDistance = async (lat1, lng1, lat2, lng2) => {
   }
 };
 
+// Distances from every origin to every destination in one request.
+// Points are { lat, lng } objects; mode is 'haversine' (fast) or
+// 'geodesic' (exact). Returns { distances_km, durations_minutes } matrices.
+const getDistanceMatrix = async (origins, destinations, mode = 'haversine') => {
+  try {
+    const response = await axios.post('/api/distance-matrix', { origins, destinations, mode });
+    return response.data;
+  } catch (error) {
+    let message = 'Failed to calculate distances';
+    if (error.response && error.response.data && error.response.data.message) {
+      message = error.response.data.message;
+    }
+    throw new Error(message);
+  }
+};
+
 // Get the current location of the user
 const getCurrentLocation = () => {
   return new Promise((resolve, reject) => {
@@ -58,25 +88,106 @@ const getCurrentLocation = () => {
   });
 };
 
+// Fixes that could not be sent yet; retried together with the next fix
+const MAX_PENDING_FIXES = 500;
+let pendingFixes = [];
+
+const sendFix = (location, callback) => {
+  pendingFixes.push({ ...location, timestamp: new Date().toISOString() });
+  if (pendingFixes.length > MAX_PENDING_FIXES) {
+    pendingFixes = pendingFixes.slice(-MAX_PENDING_FIXES);
+  }
+  const batch = pendingFixes;
+  pendingFixes = [];
+  updateLocations(batch)
+    .then(() => callback(location))
+    .catch(error => {
+      console.error('Error updating location:', error);
+      pendingFixes = batch.concat(pendingFixes);
+    });
+};
+
+// A short-lived token that opens the location stream and nothing else, so
+// the access token never ends up in a URL
+const getStreamToken = async () => {
+  try {
+    const response = await axios.post('/api/locations/stream-token');
+    return response.data.token;
+  } catch (error) {
+    let message = 'Failed to open the location stream';
+    if (error.response && error.response.data && error.response.data.message) {
+      message = error.response.data.message;
+    }
+    throw new Error(message);
+  }
+};
+
+// Follow everyone's latest location over Server-Sent Events. `onSnapshot`
+// gets the full list (on connect and whenever the server resynchronises),
+// `onUpdate` the users that moved. Returns a function that closes the stream.
+// If the stream cannot be opened, falls back to a single GET /api/locations.
+const subscribeToLocations = (onSnapshot, onUpdate, reconnectDelay = 3000) => {
+  let source = null;
+  let reconnectId = null;
+  let closed = false;
+
+  const fallBack = () => {
+    getLocations()
+      .then(onSnapshot)
+      .catch(error => console.error('Error fetching locations:', error));
+  };
+
+  const connect = () => {
+    getStreamToken()
+      .then(token => {
+        if (closed) {
+          return;
+        }
+        let opened = false;
+        source = new EventSource(
+          `${axios.defaults.baseURL || ''}/api/locations/stream?token=${encodeURIComponent(token)}`
+        );
+        source.onopen = () => { opened = true; };
+        source.addEventListener('snapshot', event => onSnapshot(JSON.parse(event.data)));
+        source.addEventListener('locations', event => onUpdate(JSON.parse(event.data)));
+        source.onerror = () => {
+          // The stream token has expired by now, so reconnect with a new one
+          // rather than letting EventSource retry with it
+          source.close();
+          if (!opened) {
+            fallBack();
+          } else if (!closed) {
+            reconnectId = setTimeout(connect, reconnectDelay);
+          }
+        };
+      })
+      .catch(error => {
+        console.error('Error opening location stream:', error);
+        fallBack();
+      });
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(reconnectId);
+    if (source) {
+      source.close();
+    }
+  };
+};
+
 // Start tracking the user's location
 const startLocationTracking = (callback, interval = 60000) => {
   // Get the initial location
   getCurrentLocation()
-    .then(location => {
-      updateLocation(location.latitude, location.longitude)
-        .then(() => callback(location))
-        .catch(error => console.error('Error updating location:', error));
-    })
+    .then(location => sendFix(location, callback))
     .catch(error => console.error('Error getting current location:', error));
 
   // Set up interval to update location
   const trackingId = setInterval(() => {
     getCurrentLocation()
-      .then(location => {
-        updateLocation(location.latitude, location.longitude)
-          .then(() => callback(location))
-          .catch(error => console.error('Error updating location:', error));
-      })
+      .then(location => sendFix(location, callback))
       .catch(error => console.error('Error getting current location:', error));
   }, interval);
 
@@ -116,8 +227,11 @@ const getCustomerAnalytics = async () => {
 
 const locationService = {
   updateLocation,
+  updateLocations,
   getLocations,
+  subscribeToLocations,
   calculateDistance,
+  getDistanceMatrix,
   getCurrentLocation,
   startLocationTracking,
   stopLocationTracking,